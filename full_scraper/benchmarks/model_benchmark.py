@@ -0,0 +1,151 @@
+"""
+model_benchmark.py
+
+Compares the memory and pickle size of seasons of games held in the original
+__dict__ based models against the slotted models in oddsportal/models.py, and
+checks both produce the same JSON
+
+Usage (from the full_scraper directory):
+    python benchmarks/model_benchmark.py
+    python benchmarks/model_benchmark.py --seasons 20 --pages 25 --rows 50
+
+"""
+
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from oddsportal.models import BasicJsonEncoder
+from oddsportal.parser import parse_results_page
+from parser_benchmark import URL
+from parser_benchmark import synthetic_page
+
+import argparse
+import json
+import multiprocessing
+import pickle
+import resource
+
+
+# Game's fields before it had __slots__ - the JSON written from the slotted models must still be just these
+LEGACY_GAME_FIELDS = ('retrieval_url', 'retrieval_datetime', 'game_datetime', 'game_url', 'num_possible_outcomes', \
+                      'team_home', 'team_away', 'odds_home', 'odds_away', 'odds_draw', 'outcome', 'score_home', \
+                      'score_away')
+
+
+class LegacyGame(object):
+    """
+    Game as it was before it had __slots__
+    """
+    def __init__(self):
+        self.retrieval_url = str()
+        self.retrieval_datetime = str()
+        self.game_datetime = str()
+        self.game_url = str()
+        self.num_possible_outcomes = str()
+        self.team_home = str()
+        self.team_away = str()
+        self.odds_home = str()
+        self.odds_away = str()
+        self.odds_draw = str()
+        self.outcome = str()
+        self.score_home = str()
+        self.score_away = str()
+
+
+class LegacySeason(object):
+    def __init__(self,name):
+        self.name = name
+        self.games = list()
+        self.urls = list()
+        self.possible_outcomes = int()
+
+
+class LegacyJsonEncoder(json.JSONEncoder):
+        def default(self, o):
+            return o.__dict__
+
+
+def to_legacy(game):
+    """
+    Copy of a Game as the old parser made it - no __slots__, and its own copy of every team name
+    """
+    legacy_game = LegacyGame()
+    for key in LEGACY_GAME_FIELDS:
+        value = getattr(game, key)
+        if key in ('team_home', 'team_away'):
+            value = ''.join(list(value))
+        setattr(legacy_game, key, value)
+    return legacy_game
+
+
+def build_seasons(model, num_seasons, num_pages, rows_per_page, number_of_outcomes):
+    from oddsportal.models import Season
+    html_source = synthetic_page(rows_per_page, number_of_outcomes)
+    seasons = []
+    for s in range(num_seasons):
+        season = LegacySeason('%d-%d' % (2000 + s, 2001 + s)) if model == 'legacy' else Season('%d-%d' % (2000 + s, 2001 + s))
+        season.possible_outcomes = number_of_outcomes
+        for p in range(num_pages):
+            url = URL.replace('/page/2/', '/page/%d/' % (p + 1))
+            season.urls.append(url)
+            for game in parse_results_page(html_source, url, number_of_outcomes):
+                season.games.append(to_legacy(game) if model == 'legacy' else game)
+        seasons.append(season)
+    return seasons
+
+
+def measure(model, num_seasons, num_pages, rows_per_page, number_of_outcomes, results):
+    """
+    Runs in a fresh process, so peak RSS covers just this model's seasons
+    """
+    html_source = synthetic_page(rows_per_page, number_of_outcomes)
+    parse_results_page(html_source, URL, number_of_outcomes)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seasons = build_seasons(model, num_seasons, num_pages, rows_per_page, number_of_outcomes)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pickle_bytes = [len(pickle.dumps(season)) for season in seasons]
+    results.put((model, (rss_after - rss_before) * 1024, sum(pickle_bytes) / len(pickle_bytes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Game/Season model memory benchmark')
+    parser.add_argument('--seasons', type=int, default=20, help='Seasons to hold in memory')
+    parser.add_argument('--pages', type=int, default=25, help='Results pages per season')
+    parser.add_argument('--rows', type=int, default=50, help='Games per results page')
+    parser.add_argument('--outcomes', type=int, default=2, help='Possible outcomes for the league (2 or 3)')
+    args = parser.parse_args()
+    # Same JSON document either way
+    legacy = build_seasons('legacy', 2, 2, args.rows, args.outcomes)
+    slotted = build_seasons('slotted', 2, 2, args.rows, args.outcomes)
+    for season in legacy + slotted:
+        for game in season.games:
+            game.retrieval_datetime = ''
+    if json.dumps(legacy, cls=LegacyJsonEncoder) != json.dumps(slotted, cls=BasicJsonEncoder):
+        print('JSON output differs between models!')
+    # Pickles made by the slotted models round trip
+    if json.dumps(pickle.loads(pickle.dumps(slotted)), cls=BasicJsonEncoder) != json.dumps(slotted, cls=BasicJsonEncoder):
+        print('Slotted season does not survive pickling!')
+    results = multiprocessing.get_context('spawn').Queue()
+    measured = dict()
+    for model in ('legacy', 'slotted'):
+        process = multiprocessing.get_context('spawn').Process(target=measure, args=(model, args.seasons, args.pages, \
+                                                                                    args.rows, args.outcomes, results))
+        process.start()
+        name, rss_bytes, pickle_bytes = results.get()
+        process.join()
+        measured[name] = (rss_bytes, pickle_bytes)
+    games_per_season = args.pages * args.rows
+    print('%d seasons of %d games' % (args.seasons, games_per_season))
+    print('%-10s %16s %20s %18s' % ('model', 'peak RSS MiB', 'RSS bytes per game', 'pickle KiB/season'))
+    for model in ('legacy', 'slotted'):
+        rss_bytes, pickle_bytes = measured[model]
+        print('%-10s %16.1f %20.0f %18.1f' % (model, rss_bytes / 2**20, rss_bytes / (args.seasons * games_per_season), \
+                                              pickle_bytes / 1024))
+    print('RSS %.1fx smaller, pickles %.1fx smaller' % (measured['legacy'][0] / max(1, measured['slotted'][0]), \
+                                                        measured['legacy'][1] / measured['slotted'][1]))
+
+
+if __name__ == '__main__':
+    main()
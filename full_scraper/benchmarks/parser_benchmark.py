@@ -0,0 +1,168 @@
+"""
+parser_benchmark.py
+
+Compares the original per-field PyQuery row parsing against the single-pass
+lxml parser in oddsportal/parser.py, on saved results pages
+
+Usage (from the full_scraper directory):
+    python benchmarks/parser_benchmark.py saved_pages/*.html
+    python benchmarks/parser_benchmark.py --synthetic-rows 50 100 200 400
+
+"""
+
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from oddsportal.models import Game
+from oddsportal.parser import parse_results_page
+from pyquery import PyQuery as pyquery
+
+import argparse
+import time
+
+
+BASE_URL = 'https://www.oddsportal.com'
+URL = BASE_URL + '/basketball/usa/nba/results/#/page/2/'
+
+
+def legacy_parse(html_source, url, number_of_outcomes):
+    """
+    The row loop previously in Scraper.populate_games_into_season, which
+    re-selects every table row for each field it reads
+    """
+    games = []
+    html_querying = pyquery(html_source)
+    retrieval_time_for_reference = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    tournament_table = html_querying.find('div#tournamentTable > table#tournamentTable')
+    num_table_rows = len(tournament_table.find('tbody > tr'))
+    for i in range(0,num_table_rows):
+        try:
+            time_cell = tournament_table.find('tbody > tr').eq(i).find('td.table-time')
+            if 0 == len(str(time_cell).strip()):
+                continue
+            game = Game()
+            time_cell = time_cell[0]
+            for key, value in time_cell.attrib.items():
+                if key == 'class':
+                    for time_cell_class in value.split(' '):
+                        if 0 == len(time_cell_class) or time_cell_class[0] != 't':
+                            continue
+                        if time_cell_class[1] == '0' or time_cell_class[1] == '1' or time_cell_class[2] == '2':
+                            unix_time = int(time_cell_class.split('-')[0].replace('t',''))
+                            game.game_datetime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(unix_time))
+                            break
+                    break
+            if 0 == len(game.game_datetime):
+                continue
+            game.retrieval_datetime = retrieval_time_for_reference
+            game.retrieval_url = url
+            game.num_possible_outcomes = number_of_outcomes
+            participants_link = tournament_table.find('tbody > tr').eq(i).find('td.table-participant > a')
+            participants = participants_link.text().split(' - ')
+            game.team_home = participants[0]
+            game.team_away = participants[1]
+            game.game_url = BASE_URL + participants_link[0].attrib['href']
+            overall_score_string = tournament_table.find('tbody > tr').eq(i).find('td.table-score').text().split()[0]
+            if ':' in overall_score_string:
+                game.score_home = int(overall_score_string.split(':')[0])
+                game.score_away = int(overall_score_string.split(':')[1])
+            elif '-' in overall_score_string:
+                game.score_home = int(overall_score_string.split('-')[0])
+                game.score_away = int(overall_score_string.split('-')[1])
+            else:
+                raise RuntimeError('Could not split score string - delimiter unknown')
+            if game.score_home > game.score_away:
+                game.outcome = 'HOME'
+            elif game.score_home < game.score_away:
+                game.outcome = 'AWAY'
+            else:
+                game.outcome = 'DRAW'
+            individual_odds_links = tournament_table.find('tbody > tr').eq(i).find('td.odds-nowrp > a')
+            if len(individual_odds_links) < 2:
+                continue
+            for x, individual_odds_link in enumerate(individual_odds_links):
+                if x == 0:
+                    game.odds_home = individual_odds_link.text
+                elif x == 1 and 3 == number_of_outcomes:
+                    game.odds_draw = individual_odds_link.text
+                else:
+                    game.odds_away = individual_odds_link.text
+            if number_of_outcomes == 2:
+                game.odds_draw = None
+            games.append(game)
+        except Exception:
+            continue
+    return games
+
+
+def synthetic_page(num_games, number_of_outcomes):
+    """
+    Builds a results page shaped like Odds Portal's tournament table
+    """
+    rows = []
+    kickoff = 1546300800
+    for i in range(num_games):
+        if i % 10 == 0:
+            rows.append('<tr class="center nob-border"><th class="first2 tl" colspan="7">'
+                        '<span class="datet t%d-1-1-0-0">01 Jan 2019</span></th></tr>' % kickoff)
+        odds = ''.join('<td class="odds-nowrp" xodd="1.9"><a href="">%.2f</a></td>' % (1.5 + j)
+                       for j in range(number_of_outcomes))
+        rows.append('<tr class="odd deactivate" xeid="x%d">'
+                    '<td class="table-time datet t%d-1-1-0-0">19:00</td>'
+                    '<td class="name table-participant"><a href="/basketball/usa/nba/game-%d/">'
+                    '<span class="bold">Home Team %d</span> - Away Team %d</a></td>'
+                    '<td class="center bold table-odds table-score">%d:%d OT</td>%s'
+                    '<td class="center info-value">12</td></tr>'
+                    % (i, kickoff + i * 3600, i, i % 30, (i + 7) % 30, 100 + i % 9, 98 + i % 7, odds))
+    return ('<html><body><div id="tournamentTable"><table id="tournamentTable" class="table-main">'
+            '<tbody>%s</tbody></table></div></body></html>' % ''.join(rows))
+
+
+def comparable(games):
+    return [dict((k, v) for k, v in game.to_dict().items() if k not in ('retrieval_datetime', 'game_unix_time')) \
+            for game in games]
+
+
+def time_it(function, html_source, number_of_outcomes, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(html_source, URL, number_of_outcomes)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Results page parser benchmark')
+    parser.add_argument('pages', nargs='*', help='Saved results page HTML files')
+    parser.add_argument('--synthetic-rows', type=int, nargs='*', default=[50, 100, 200, 400],
+                        help='Row counts of synthetic pages, used when no saved pages are given')
+    parser.add_argument('--outcomes', type=int, default=2, help='Possible outcomes for the league (2 or 3)')
+    parser.add_argument('--repeat', type=int, default=3, help='Take the best of this many runs')
+    args = parser.parse_args()
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, encoding='utf-8') as html_file:
+                pages.append((os.path.basename(path), html_file.read()))
+    else:
+        pages = [('synthetic-%d' % n, synthetic_page(n, args.outcomes)) for n in args.synthetic_rows]
+    print('%-24s %6s %12s %12s %8s' % ('page', 'games', 'pyquery ms', 'lxml ms', 'speedup'))
+    mismatched = []
+    for name, html_source in pages:
+        legacy_time, legacy_games = time_it(legacy_parse, html_source, args.outcomes, args.repeat)
+        new_time, new_games = time_it(parse_results_page, html_source, args.outcomes, args.repeat)
+        if comparable(legacy_games) != comparable(new_games or []):
+            print('%s: parsed games differ between implementations!' % name)
+            mismatched.append(name)
+        print('%-24s %6d %12.2f %12.2f %7.1fx' % (name, len(new_games or []), legacy_time * 1000,
+                                                 new_time * 1000, legacy_time / new_time))
+    if mismatched:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
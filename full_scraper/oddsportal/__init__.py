@@ -1,7 +1,13 @@
 from .crawler import Crawler
+from .fetchers import CachingFetcher
+from .fetchers import Fetcher
+from .fetchers import HttpFetcher
+from .fetchers import SeleniumFetcher
 from .models import Collection
 from .models import DataRepository
 from .models import Game
 from .models import League
 from .models import Season
-from .scraper import Scraper
\ No newline at end of file
+from .page_cache import PageCache
+from .parser import parse_results_page
+from .scraper import Scraper
@@ -0,0 +1,176 @@
+"""
+async_engine.py
+
+Fetches the pagination pages of many seasons at once from a single process,
+under a global concurrency limit, a per-host limit and a token bucket rate limit
+
+"""
+
+
+from .crawler import add_pagination_links_from_html
+from .fetchers import HttpFetcher
+from .fetchers import get_process_pool_manager
+from .parser import parse_results_page
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` requests per second on average, with bursts of up to `capacity`
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity != None else max(1, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = None
+
+    async def acquire(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncCrawlEngine(object):
+    """
+    Crawls pagination and scrapes games for a list of seasons concurrently.
+    The blocking HTTP requests run on a thread pool, so dozens can be in flight at once.
+    """
+    def __init__(self, max_concurrency=32, per_host_limit=8, requests_per_second=10, burst=None, fetcher=None):
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.rate_limiter = TokenBucket(requests_per_second, burst)
+        if fetcher is None:
+            fetcher = HttpFetcher(http=get_process_pool_manager(maxsize=per_host_limit))
+        self.fetcher = fetcher
+        self.executor = None
+        self.global_limit = None
+        self.host_limits = dict()
+        self.pages_fetched = 0
+        self.on_season_done = None
+
+    def host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self.host_limits[host]
+
+    async def fetch(self, url):
+        """
+        Returns:
+            (str) HTML at url, or None if it couldn't be retrieved
+        """
+        async with self.global_limit:
+            async with self.host_limit(url):
+                await self.rate_limiter.acquire()
+                loop = asyncio.get_event_loop()
+                html_source = await loop.run_in_executor(self.executor, self.fetcher.fetch, url)
+        self.pages_fetched += 1
+        return html_source
+
+    async def parse(self, html_source, url, number_of_outcomes):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, parse_results_page, html_source, url, number_of_outcomes)
+
+    async def scrape_page(self, url, number_of_outcomes, html_source=None, checkpoint=None):
+        """
+        Returns:
+            (list) of Game objects on the page, or None if it couldn't be retrieved
+        """
+        if checkpoint != None and url in checkpoint.completed_pages:
+            return checkpoint.completed_pages[url]
+        if html_source is None:
+            html_source = await self.fetch(url)
+        if html_source is None:
+            logger.warning('Could not load page, skipping %s', url)
+            return None
+        games = await self.parse(html_source, url, number_of_outcomes)
+        if games is None:
+            logger.warning('Found "No data available", skipping %s', url)
+            games = []
+        if checkpoint != None:
+            checkpoint.record_page(url, games)
+        return games
+
+    async def scrape_season(self, season, checkpoint=None):
+        """
+        Params:
+            season (Season) with just its first url, to fill in with the rest of its urls and its games
+            checkpoint (SeasonCheckpoint) optional - work recorded in it is skipped, new work recorded to it
+        """
+        first_url_in_season = season.urls[0]
+        first_page_html = None
+        if checkpoint != None and checkpoint.urls != None:
+            season.urls = list(checkpoint.urls)
+        else:
+            first_page_html = await self.fetch(first_url_in_season)
+            if first_page_html is None:
+                logger.warning('Season "%s" - could not load first page %s', season.name, first_url_in_season)
+                return self.season_done(season)
+            has_data = add_pagination_links_from_html(season, first_page_html)
+            if checkpoint != None:
+                checkpoint.record_pagination(season.urls)
+            if not has_data:
+                return self.season_done(season)
+        logger.info('Season "%s" - found %d pages', season.name, len(season.urls))
+        # First page may already be here, the rest all go out at once
+        pages_of_games = await asyncio.gather(
+            self.scrape_page(season.urls[0], season.possible_outcomes, first_page_html, checkpoint),
+            *[self.scrape_page(url, season.possible_outcomes, checkpoint=checkpoint) for url in season.urls[1:]])
+        for games in pages_of_games:
+            for game in games or []:
+                season.add_game(game)
+        if checkpoint != None and not checkpoint.is_done and None not in pages_of_games:
+            checkpoint.record_done()
+        logger.info('Season "%s" - scraped %d games', season.name, len(season.games))
+        return self.season_done(season)
+
+    def season_done(self, season):
+        if self.on_season_done != None:
+            self.on_season_done(season)
+        return season
+
+    async def scrape_seasons_async(self, seasons, checkpoints=None, on_season_done=None):
+        self.on_season_done = on_season_done
+        self.global_limit = asyncio.Semaphore(self.max_concurrency)
+        self.host_limits = dict()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            self.executor = executor
+            started_at = time.time()
+            if checkpoints is None:
+                checkpoints = [None] * len(seasons)
+            seasons = await asyncio.gather(*[self.scrape_season(season, checkpoint) \
+                                             for season, checkpoint in zip(seasons, checkpoints)])
+            elapsed = time.time() - started_at
+        self.executor = None
+        logger.info('Fetched %d pages in %.1f seconds (%.1f pages/second)', self.pages_fetched, elapsed, \
+                    self.pages_fetched / elapsed if elapsed > 0 else 0.0)
+        return list(seasons)
+
+    def scrape_seasons(self, seasons, checkpoints=None, on_season_done=None):
+        """
+        Params:
+            seasons (list) of Season objects with just their first url and possible_outcomes set
+            checkpoints (list) optional SeasonCheckpoint for each season
+            on_season_done (function) optional, called with each Season as soon as it is finished
+
+        Returns:
+            (list) the same seasons, now with all their urls and games, in the same order
+        """
+        return asyncio.run(self.scrape_seasons_async(seasons, checkpoints, on_season_done))
@@ -0,0 +1,132 @@
+"""
+browser_profile.py
+
+What headless Chrome is allowed to download. Only the tournament table DOM is
+read, so the lean profile skips images, fonts, stylesheets, media, ads and
+trackers, keeping just the scripts that build the table
+
+"""
+
+
+from selenium.common.exceptions import WebDriverException
+
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Chrome content setting value meaning "block"
+BLOCK = 2
+
+# Static resources nothing reads, by URL
+RESOURCE_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.css',
+    '*.mp4', '*.webm', '*.mp3',
+]
+
+# Third party ad, tracking and social hosts seen on Odds Portal pages
+THIRD_PARTY_HOSTS = [
+    'doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'google-analytics.com',
+    'googletagmanager.com', 'googletagservices.com', 'adservice.google.com', 'facebook.net', 'facebook.com',
+    'twitter.com', 'scorecardresearch.com', 'quantserve.com', 'criteo.com', 'criteo.net', 'adnxs.com',
+    'amazon-adsystem.com', 'taboola.com', 'outbrain.com', 'hotjar.com', 'cookielaw.org', 'onetrust.com',
+]
+
+# Hosts whose scripts the tournament table needs - never blocked, even if listed above
+ALLOWED_HOSTS = [
+    'oddsportal.com',
+]
+
+
+class BrowserProfile(object):
+    """
+    Chrome prefs and arguments applied when a browser starts, plus URL patterns
+    blocked through the DevTools protocol once it is running
+    """
+    def __init__(self, name, block_images=False, block_fonts=False, block_stylesheets=False, block_media=False, \
+                 blocked_hosts=None, allowed_hosts=None, extra_arguments=None):
+        self.name = name
+        self.block_images = block_images
+        self.block_fonts = block_fonts
+        self.block_stylesheets = block_stylesheets
+        self.block_media = block_media
+        self.allowed_hosts = list(allowed_hosts or [])
+        self.blocked_hosts = [h for h in (blocked_hosts or []) if not self.is_allowed_host(h)]
+        self.extra_arguments = list(extra_arguments or [])
+
+    def is_allowed_host(self, host):
+        return any(host == allowed or host.endswith('.' + allowed) for allowed in self.allowed_hosts)
+
+    def blocked_url_patterns(self):
+        """
+        Returns:
+            (list) of wildcard URL patterns for Network.setBlockedURLs
+        """
+        patterns = []
+        for pattern in RESOURCE_URL_PATTERNS:
+            extension = pattern[2:]
+            if (self.block_images and extension in ('png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp')) or \
+               (self.block_fonts and extension in ('woff', 'woff2', 'ttf', 'otf', 'eot')) or \
+               (self.block_stylesheets and extension == 'css') or \
+               (self.block_media and extension in ('mp4', 'webm', 'mp3')):
+                # Versioned assets too, e.g. styles.css?v=123
+                patterns.extend([pattern, pattern + '?*'])
+        for host in self.blocked_hosts:
+            patterns.append('*://' + host + '/*')
+            patterns.append('*://*.' + host + '/*')
+        return patterns
+
+    def apply_to_options(self, options):
+        """
+        Params:
+            options (webdriver.ChromeOptions) of a browser about to start
+        """
+        if self.block_images:
+            options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images' : BLOCK,
+                'profile.default_content_setting_values.notifications' : BLOCK
+            })
+            options.add_argument('--blink-settings=imagesEnabled=false')
+        for argument in self.extra_arguments:
+            options.add_argument(argument)
+
+    def apply_to_driver(self, driver):
+        """
+        Params:
+            driver (webdriver.Chrome) just started with options from apply_to_options
+        """
+        patterns = self.blocked_url_patterns()
+        if len(patterns) == 0:
+            return
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', { 'urls' : patterns })
+        except (AttributeError, WebDriverException):
+            # Older chromedriver without DevTools commands - the prefs still apply
+            logger.warning('Could not block URLs through the DevTools protocol, only Chrome prefs apply')
+            return
+        logger.info('Browser profile "%s" blocks %d URL patterns', self.name, len(patterns))
+
+
+FULL_PROFILE = BrowserProfile('full')
+LEAN_PROFILE = BrowserProfile('lean', block_images=True, block_fonts=True, block_stylesheets=True, block_media=True, \
+                              blocked_hosts=THIRD_PARTY_HOSTS, allowed_hosts=ALLOWED_HOSTS, \
+                              extra_arguments=['--disable-extensions', '--disable-gpu', '--mute-audio', \
+                                               '--disable-background-networking', '--disk-cache-size=1'])
+
+PROFILES = { 'full' : FULL_PROFILE, 'lean' : LEAN_PROFILE }
+
+
+def get_browser_profile(name):
+    """
+    Params:
+        name (str) 'full' or 'lean'
+
+    Returns:
+        (BrowserProfile)
+    """
+    if name not in PROFILES:
+        raise RuntimeError('Unknown browser profile - ' + str(name))
+    return PROFILES[name]
@@ -0,0 +1,116 @@
+"""
+checkpoint.py
+
+Append-only journal of finished work, so a crashed or interrupted run can
+resume without redoing seasons and pages that already completed
+
+"""
+
+
+from .models import Game
+
+import json
+import logging
+import os
+import re
+import shutil
+
+
+logger = logging.getLogger(__name__)
+
+
+def slugify(name):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', str(name)).strip('_')
+
+
+def game_to_dict(game):
+    return game.to_dict()
+
+
+def game_from_dict(game_dict):
+    game = Game()
+    for key, value in game_dict.items():
+        setattr(game, key, value)
+    return game
+
+
+class SeasonCheckpoint(object):
+    """
+    Journal file for one season. Each line is one JSON record:
+        {"event": "pagination", "urls": [...]}
+        {"event": "page", "url": ..., "games": [...]}
+        {"event": "season_done"}
+    Every record is flushed and fsync'd before moving on.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.urls = None
+        self.completed_pages = dict()
+        self.is_done = False
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Partially written last line from a crash - that work just gets redone
+                    logger.warning('Ignoring incomplete checkpoint record in %s', self.path)
+                    continue
+                if record['event'] == 'pagination':
+                    self.urls = record['urls']
+                elif record['event'] == 'page':
+                    self.completed_pages[record['url']] = [game_from_dict(g) for g in record['games']]
+                elif record['event'] == 'season_done':
+                    self.is_done = True
+
+    def append(self, record):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as journal_file:
+            journal_file.write(json.dumps(record) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def record_pagination(self, urls):
+        self.urls = list(urls)
+        self.append({ 'event' : 'pagination', 'urls' : self.urls })
+
+    def record_page(self, url, games):
+        self.completed_pages[url] = list(games)
+        self.append({ 'event' : 'page', 'url' : url, 'games' : [game_to_dict(g) for g in games] })
+
+    def record_done(self):
+        self.is_done = True
+        self.append({ 'event' : 'season_done' })
+
+    def games_in_order(self, urls):
+        """
+        Returns:
+            (list) of Game objects from the completed pages among urls, in urls order
+        """
+        games = []
+        for url in urls:
+            games.extend(self.completed_pages.get(url, []))
+        return games
+
+
+class CheckpointJournal(object):
+    """
+    Directory of SeasonCheckpoint files, one subdirectory per collection
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def for_season(self, collection_name, season_name):
+        """
+        Returns:
+            (SeasonCheckpoint) loaded with whatever was recorded for this season before
+        """
+        return SeasonCheckpoint(os.path.join(self.directory, slugify(collection_name), \
+                                             slugify(season_name) + '.jsonl'))
+
+    def clear_collection(self, collection_name):
+        shutil.rmtree(os.path.join(self.directory, slugify(collection_name)), ignore_errors=True)
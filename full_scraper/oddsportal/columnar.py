@@ -0,0 +1,175 @@
+"""
+columnar.py
+
+Typed, columnar Parquet export of scraped games, partitioned by sport, league
+and season, for fast loading into analysis tools
+
+Needs pyarrow - writers.py only imports this module when Parquet output is asked for
+
+"""
+
+
+from .checkpoint import slugify
+
+import logging
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shutil
+import time
+
+
+logger = logging.getLogger(__name__)
+
+PARQUET_DIRECTORY_NAME = 'parquet'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+GAME_SCHEMA = pa.schema([
+    ('game_datetime', pa.int64()),          # kickoff, unix epoch seconds
+    ('team_home', pa.dictionary(pa.int32(), pa.string())),
+    ('team_away', pa.dictionary(pa.int32(), pa.string())),
+    ('score_home', pa.int16()),
+    ('score_away', pa.int16()),
+    ('outcome', pa.dictionary(pa.int8(), pa.string())),
+    ('odds_home', pa.float32()),
+    ('odds_draw', pa.float32()),
+    ('odds_away', pa.float32()),
+    ('num_possible_outcomes', pa.int8()),
+    ('game_url', pa.string()),
+    ('retrieval_url', pa.string()),
+    ('retrieval_datetime', pa.int64()),     # unix epoch seconds
+])
+
+
+def to_epoch(datetime_string):
+    """
+    Inverse of the time.strftime(..., time.localtime(t)) used when scraping - ambiguous in the hour
+    clocks go back, so only for times scraped without their unix time
+
+    Returns:
+        (int) unix epoch seconds, or None if blank/unparseable
+    """
+    if not datetime_string:
+        return None
+    try:
+        return int(time.mktime(time.strptime(datetime_string, DATETIME_FORMAT)))
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(odds_string):
+    """
+    Returns:
+        (float) odds from the raw link text, or None if there are none (e.g. "-")
+    """
+    if odds_string is None:
+        return None
+    try:
+        return float(odds_string)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def game_epoch(game):
+    """
+    Returns:
+        (int) kickoff in unix epoch seconds - the unix time read off the page where the game has it,
+            e.g. not for games read back from checkpoints, which leave it out
+    """
+    if game.game_unix_time is not None:
+        return int(game.game_unix_time)
+    return to_epoch(game.game_datetime)
+
+
+def games_to_table(games):
+    """
+    Params:
+        games (list) of Game objects
+
+    Returns:
+        (pyarrow.Table) with GAME_SCHEMA
+    """
+    columns = {
+        'game_datetime' : [game_epoch(g) for g in games],
+        'team_home' : [g.team_home for g in games],
+        'team_away' : [g.team_away for g in games],
+        'score_home' : [to_int(g.score_home) for g in games],
+        'score_away' : [to_int(g.score_away) for g in games],
+        'outcome' : [g.outcome or None for g in games],
+        'odds_home' : [to_float(g.odds_home) for g in games],
+        'odds_draw' : [to_float(g.odds_draw) for g in games],
+        'odds_away' : [to_float(g.odds_away) for g in games],
+        'num_possible_outcomes' : [to_int(g.num_possible_outcomes) for g in games],
+        'game_url' : [g.game_url for g in games],
+        'retrieval_url' : [g.retrieval_url for g in games],
+        'retrieval_datetime' : [to_epoch(g.retrieval_datetime) for g in games],
+    }
+    arrays = []
+    for field in GAME_SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], type=field.type.value_type).dictionary_encode() \
+                          .cast(field.type))
+        else:
+            arrays.append(pa.array(columns[field.name], type=field.type))
+    return pa.Table.from_arrays(arrays, schema=GAME_SCHEMA)
+
+
+class ParquetGameWriter(object):
+    """
+    Writes each season to its own Hive-style partition:
+        <output_dir>/parquet/sport=<sport>/league=<league>/season=<season>/part-0.parquet
+    Rewriting a season replaces just that partition.
+    """
+    def __init__(self, output_dir, collection):
+        self.collection_name = collection.name
+        self.path = os.path.join(output_dir, PARQUET_DIRECTORY_NAME, 'sport=' + slugify(collection.sport), \
+                                 'league=' + slugify(collection.name))
+        self.games_written = 0
+
+    def season_path(self, season):
+        return os.path.join(self.path, 'season=' + slugify(season.name))
+
+    def write_season(self, season):
+        season_path = self.season_path(season)
+        shutil.rmtree(season_path, ignore_errors=True)
+        os.makedirs(season_path)
+        pq.write_table(games_to_table(season.games), os.path.join(season_path, 'part-0.parquet'), \
+                       compression='zstd')
+        self.games_written += len(season.games)
+        logger.info('Wrote %d games of season "%s" to %s', len(season.games), season.name, season_path)
+
+    def close(self):
+        pass
+
+
+def export_repository_to_parquet(data_repository, output_dir):
+    """
+    Writes every season of every collection in a DataRepository to Parquet partitions
+    """
+    for _, collection in data_repository.collections.items():
+        writer = ParquetGameWriter(output_dir, collection)
+        for season in collection.league.seasons:
+            writer.write_season(season)
+        writer.close()
+
+
+def read_games(output_dir, columns=None, filter_expression=None):
+    """
+    Loads exported games back, e.g. read_games('output', ['game_datetime', 'odds_home'],
+    (pyarrow.dataset.field('league') == 'nba'))
+
+    Returns:
+        (pyarrow.Table) with sport, league and season columns from the partitioning
+    """
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(os.path.join(output_dir, PARQUET_DIRECTORY_NAME), format='parquet', partitioning='hive')
+    return dataset.to_table(columns=columns, filter=filter_expression)
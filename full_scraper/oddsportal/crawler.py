@@ -6,11 +6,9 @@ Logic for the overall Odds Portal scraping utility focused on crawling
 """
 
 
+from .fetchers import SeleniumFetcher
 from .models import Season
 from pyquery import PyQuery as pyquery
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
-from selenium.common.exceptions import WebDriverException
 
 import logging
 import time
@@ -26,7 +24,7 @@ class Crawler(object):
     """
     WAIT_TIME = 3  # max waiting time for a page to load
     
-    def __init__(self, wait_on_page_load=3):
+    def __init__(self, wait_on_page_load=3, driver_pool=None, readiness=None, fetcher=None):
         """
         Constructor
         """
@@ -34,39 +32,28 @@ class Crawler(object):
         self.wait_on_page_load = wait_on_page_load
         if wait_on_page_load == None:
             self.wait_on_page_load = 3
-        self.options = webdriver.ChromeOptions()
-        self.options.add_argument('headless')
-        self.driver = webdriver.Chrome('./chromedriver/chromedriver', chrome_options=self.options)
-        logger.info('Chrome browser opened in headless mode')
+        if fetcher == None:
+            fetcher = SeleniumFetcher(wait_on_page_load=self.wait_on_page_load, driver_pool=driver_pool, \
+                                      readiness=readiness)
+        self.fetcher = fetcher
         
         # exception when no driver created
 
-    def go_to_link(self,link):
+    def go_to_link(self, link, accept_season_menu=False):
         """
         returns True if no error
         False whe page not found
         """
-        self.driver.get(link)
-        try:
-            # If no Login button, page not found
-            self.driver.find_element_by_css_selector('.button-dark')
-        except NoSuchElementException:
-            logger.warning('Problem with link, could not find Login button - %s', link)
-            return False
-        # Workaround for ajax page loading issue
-        time.sleep(self.wait_on_page_load)
-        return True
+        return self.fetcher.go_to_link(link, accept_season_menu)
         
     def get_html_source(self):
-        return self.driver.page_source
+        return self.fetcher.get_html_source()
     
     def close_browser(self):
-        time.sleep(5)
-        try:
-            self.driver.quit()
-            logger.info('Browser closed')
-        except WebDriverException:
-            logger.warning('WebDriverException on closing browser - maybe closed?')
+        """
+        Releases whatever the fetcher holds, e.g. its browser
+        """
+        self.fetcher.close()
 
     def get_seasons_for_league(self, main_league_results_url):
         """
@@ -78,7 +65,7 @@ class Crawler(object):
         """
         seasons = []
         logger.info('Getting all seasons for league via %s', main_league_results_url)
-        if not self.go_to_link(main_league_results_url):
+        if not self.go_to_link(main_league_results_url, accept_season_menu=True):
             logger.error('League results URL loaded unsuccessfully %s', main_league_results_url)
             # Going to send back empty list so this is not processed further
             return seasons
@@ -94,40 +81,66 @@ class Crawler(object):
             seasons.append(this_season)
         return seasons
     
-    def fill_in_season_pagination_links(self, season):
+    def fill_in_season_pagination_links(self, season, checkpoint=None):
         """
         Params:
             (Season) object with just one entry in its urls field, to be modified
+            checkpoint (SeasonCheckpoint) optional - reused if it already has the pagination, else recorded to
         """
+        if checkpoint != None and checkpoint.urls != None:
+            season.urls = list(checkpoint.urls)
+            return
         first_url_in_season = season.urls[0]
-        self.go_to_link(first_url_in_season)
+        is_loaded = self.go_to_link(first_url_in_season)
         html_source = self.get_html_source()
-        html_querying = pyquery(html_source)
-        # Check if the page says "No data available"
-        no_data_div = html_querying.find('div.message-info > ul > li > div.cms')
-        if no_data_div != None and no_data_div.text() == 'No data available':
-            # Yes, found "No data available"
-            logger.warning('Found "No data available", skipping %s', first_url_in_season)
-            return
-        # Just need to locate the final pagination tag
-        pagination_links = html_querying.find('div#pagination > a')
-        # It's possible, however, there is no pagination...
-        if len(pagination_links) <= 1:
+        add_pagination_links_from_html(season, html_source)
+        if not is_loaded:
+            # Only page 1 is known, so don't let a resumed run trust this as the season's pagination
+            logger.warning('Season "%s" - could not load first page %s', season.name, first_url_in_season)
             return
-        last_page_number = -1
-        last_page_url = None
-        for link in reversed(pagination_links):
-            span = link.find('span')
-            if span != None and span.text != None and '»|' in span.text:
-                # This is the last link because it has these two characters in it...
-                last_page_number = int(link.attrib['x-page'])
-                last_page_url = first_url_in_season + link.attrib['href']
-                break
-        # If the last page number was set, the page format must've changed - RuntimeError
-        if last_page_number == -1:
-            logger.error('Could not locate final page URL from %s', first_url_in_season)
-            raise RuntimeError('Could not locate final page URL from %s', first_url_in_season)
-        for i in range(2,last_page_number):
-            this_url = last_page_url.replace('page/' + str(last_page_number), 'page/' + str(i))
-            season.urls.append(this_url)
-        season.urls.append(last_page_url)
+        # The Scraper wants this same page for its games
+        season.add_prefetched_page(first_url_in_season, html_source)
+        if checkpoint != None:
+            checkpoint.record_pagination(season.urls)
+
+
+def add_pagination_links_from_html(season, html_source):
+    """
+    Params:
+        season (Season) object with just one entry in its urls field, to be modified
+        html_source (str) of the page at that one URL
+
+    Returns:
+        (bool) False if the page says "No data available", True otherwise
+    """
+    first_url_in_season = season.urls[0]
+    html_querying = pyquery(html_source)
+    # Check if the page says "No data available"
+    no_data_div = html_querying.find('div.message-info > ul > li > div.cms')
+    if no_data_div != None and no_data_div.text() == 'No data available':
+        # Yes, found "No data available"
+        logger.warning('Found "No data available", skipping %s', first_url_in_season)
+        return False
+    # Just need to locate the final pagination tag
+    pagination_links = html_querying.find('div#pagination > a')
+    # It's possible, however, there is no pagination...
+    if len(pagination_links) <= 1:
+        return True
+    last_page_number = -1
+    last_page_url = None
+    for link in reversed(pagination_links):
+        span = link.find('span')
+        if span != None and span.text != None and '»|' in span.text:
+            # This is the last link because it has these two characters in it...
+            last_page_number = int(link.attrib['x-page'])
+            last_page_url = first_url_in_season + link.attrib['href']
+            break
+    # If the last page number was set, the page format must've changed - RuntimeError
+    if last_page_number == -1:
+        logger.error('Could not locate final page URL from %s', first_url_in_season)
+        raise RuntimeError('Could not locate final page URL from %s', first_url_in_season)
+    for i in range(2,last_page_number):
+        this_url = last_page_url.replace('page/' + str(last_page_number), 'page/' + str(i))
+        season.urls.append(this_url)
+    season.urls.append(last_page_url)
+    return True
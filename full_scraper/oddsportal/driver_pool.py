@@ -0,0 +1,204 @@
+"""
+driver_pool.py
+
+Keeps headless Chrome browsers warm so Crawler and Scraper can lease them
+instead of starting and quitting one each time
+
+"""
+
+
+from .browser_profile import get_browser_profile
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+import atexit
+import functools
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+CHROMEDRIVER_PATH = './chromedriver/chromedriver'
+
+
+def create_chrome_driver(browser_profile=None):
+    """
+    Params:
+        browser_profile (BrowserProfile) optional, what the browser may download - everything if not given
+
+    Returns:
+        (webdriver.Chrome) new headless Chrome browser
+    """
+    options = webdriver.ChromeOptions()
+    options.add_argument('headless')
+    if browser_profile != None:
+        browser_profile.apply_to_options(options)
+    driver = webdriver.Chrome(CHROMEDRIVER_PATH, chrome_options=options)
+    if browser_profile != None:
+        browser_profile.apply_to_driver(driver)
+        logger.info('Chrome browser opened in headless mode with the "%s" profile', browser_profile.name)
+    else:
+        logger.info('Chrome browser opened in headless mode')
+    return driver
+
+
+class PooledDriver(object):
+    """
+    A browser owned by a DriverPool, along with its usage so far
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages_loaded = 0
+        self.is_broken = False
+
+    def count_page_load(self):
+        self.pages_loaded += 1
+
+    def mark_broken(self):
+        self.is_broken = True
+
+
+class DriverPool(object):
+    """
+    Up to `size` browsers, handed out one lease at a time.
+    A browser gets recycled after `max_pages_per_driver` page loads or once marked broken.
+    """
+    def __init__(self, size=1, max_pages_per_driver=250, driver_factory=create_chrome_driver):
+        if size < 1:
+            raise RuntimeError('Driver pool size must be at least 1')
+        self.size = size
+        self.max_pages_per_driver = max_pages_per_driver
+        self.driver_factory = driver_factory
+        # Browsers handed back and not yet leased again, most recently used last
+        self.idle = []
+        self.num_created = 0
+        self.num_recycled = 0
+        self.lease_wait_times = []
+        # Guards idle and num_created - waiters get notified when a browser is handed back
+        # or recycled, as either lets one of them go on
+        self.condition = threading.Condition()
+        self.is_closed = False
+
+    def acquire(self):
+        """
+        Blocks until a browser is free, starting a new one if the pool isn't full yet
+
+        Returns:
+            (PooledDriver)
+        """
+        start = time.time()
+        pooled = None
+        with self.condition:
+            while True:
+                if len(self.idle) > 0:
+                    pooled = self.idle.pop()
+                    break
+                if self.num_created < self.size:
+                    # Claim the slot now, start the browser outside the lock
+                    self.num_created += 1
+                    break
+                self.condition.wait()
+        if pooled is None:
+            try:
+                pooled = PooledDriver(self.driver_factory())
+            except Exception:
+                with self.condition:
+                    self.num_created -= 1
+                    self.condition.notify()
+                raise
+        self.lease_wait_times.append(time.time() - start)
+        return pooled
+
+    def release(self, pooled):
+        """
+        Hands a browser back, quitting it instead if it's due for recycling
+        """
+        needs_recycling = pooled.is_broken or self.is_closed
+        if self.max_pages_per_driver and pooled.pages_loaded >= self.max_pages_per_driver:
+            needs_recycling = True
+        if not needs_recycling:
+            with self.condition:
+                self.idle.append(pooled)
+                self.condition.notify()
+            return
+        logger.info('Recycling browser after %d page loads%s', pooled.pages_loaded,
+                    ' (broken)' if pooled.is_broken else '')
+        quit_driver(pooled.driver)
+        with self.condition:
+            self.num_created -= 1
+            self.num_recycled += 1
+            # Its slot is free, so a waiter can start a new browser
+            self.condition.notify()
+
+    def close_all(self):
+        self.is_closed = True
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+            self.num_created -= len(idle)
+            self.condition.notify_all()
+        for pooled in idle:
+            quit_driver(pooled.driver)
+
+    def wait_time_stats(self):
+        """
+        Returns:
+            (dict) summary of how long callers waited for a lease, in seconds
+        """
+        waits = sorted(self.lease_wait_times)
+        if len(waits) == 0:
+            return { 'leases' : 0, 'mean' : 0.0, 'p95' : 0.0, 'max' : 0.0, 'recycled' : self.num_recycled }
+        return {
+            'leases' : len(waits),
+            'mean' : sum(waits) / len(waits),
+            'p95' : waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+            'max' : waits[-1],
+            'recycled' : self.num_recycled
+        }
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+        logger.info('Browser closed')
+    except WebDriverException:
+        logger.warning('WebDriverException on closing browser - maybe closed?')
+
+
+_process_pool = None
+_process_pool_pid = None
+
+
+def get_process_pool(size=1, max_pages_per_driver=250, browser_profile_name='full'):
+    """
+    One pool per worker process, created on first use and kept for the life of the process
+
+    Returns:
+        (DriverPool)
+    """
+    global _process_pool, _process_pool_pid
+    if _process_pool is None or _process_pool_pid != os.getpid():
+        _process_pool = DriverPool(size=size, max_pages_per_driver=max_pages_per_driver, \
+                                   driver_factory=functools.partial(create_chrome_driver, \
+                                                                    get_browser_profile(browser_profile_name)))
+        _process_pool_pid = os.getpid()
+        atexit.register(_process_pool.close_all)
+    return _process_pool
+
+
+def close_process_pool():
+    """
+    Quits this process's pool's browsers, if it has a pool. Worker processes must call it themselves
+    before they finish - multiprocessing children leave through os._exit, so atexit hooks never run there.
+    The next get_process_pool in this process starts a new pool.
+    """
+    global _process_pool, _process_pool_pid
+    if _process_pool is None or _process_pool_pid != os.getpid():
+        return
+    atexit.unregister(_process_pool.close_all)
+    _process_pool.close_all()
+    _process_pool = None
+    _process_pool_pid = None
@@ -0,0 +1,314 @@
+"""
+fetchers.py
+
+Ways of getting Odds Portal pages - through a Selenium driven browser, or
+straight over HTTP without a browser
+
+"""
+
+
+from .driver_pool import create_chrome_driver
+from .driver_pool import PooledDriver
+from .driver_pool import quit_driver
+from .parser import BASE_URL
+from .parser import EXTRACT_ROWS_SCRIPT
+from .parser import has_results
+from .parser import parse_extracted_rows
+from .parser import parse_html
+from .parser import parse_results_page
+from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import WebDriverException
+
+import logging
+import os
+import re
+import time
+import urllib3
+
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT_STRING = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.121 Safari/537.36'
+PAGE_FRAGMENT_REGEX = re.compile(r'#/page/(\d+)/?$')
+
+
+class Fetcher(object):
+    """
+    Interface used by Crawler and Scraper to load pages
+    """
+    # Whether the page last gone to showed it was ready - False when waiting for it timed out and the
+    # fixed wait was slept instead, so it may be incomplete and shouldn't be cached
+    last_page_ready = True
+
+    def go_to_link(self, link, accept_season_menu=False):
+        """
+        Params:
+            accept_season_menu (bool) link is a league's root page, only needed for its season links -
+                no need to wait for its results table
+
+        returns True if no error
+        False when page not found
+        """
+        raise NotImplementedError()
+
+    def get_html_source(self):
+        """
+        Returns:
+            (str) HTML of the page last gone to
+        """
+        raise NotImplementedError()
+
+    def fetch(self, link):
+        """
+        Returns:
+            (str) HTML at link, or None if it couldn't be retrieved
+        """
+        if not self.go_to_link(link):
+            return None
+        return self.get_html_source()
+
+    def fetch_games(self, link, number_of_outcomes, base_url=BASE_URL):
+        """
+        Returns:
+            (list) of Game objects at link - empty if it says "No data available" - or None if it couldn't be retrieved
+        """
+        html_source = self.fetch(link)
+        if html_source is None:
+            return None
+        games = parse_results_page(html_source, link, number_of_outcomes, base_url)
+        if games is None:
+            logger.warning('Found "No data available", skipping %s', link)
+            return []
+        return games
+
+    def close(self):
+        pass
+
+
+class SeleniumFetcher(Fetcher):
+    """
+    Loads pages in headless Chrome, either our own or one leased from a DriverPool
+    """
+    def __init__(self, wait_on_page_load=3, driver_pool=None, readiness=None, browser_profile=None, extraction='html'):
+        """
+        Params:
+            extraction (str) how fetch_games gets at the games - 'html' parses the page source here,
+                'js' walks the table in the browser and only sends back the rows
+        """
+        if extraction not in ('html', 'js'):
+            raise RuntimeError('Unknown extraction mode - ' + str(extraction))
+        self.extraction = extraction
+        self.wait_on_page_load = wait_on_page_load
+        if wait_on_page_load == None:
+            self.wait_on_page_load = 3
+        # Without a PageReadiness, always sleep wait_on_page_load after navigating
+        self.readiness = readiness
+        self.driver_pool = driver_pool
+        if driver_pool != None:
+            # Lease a warm browser instead of starting our own
+            self.pooled_driver = driver_pool.acquire()
+        else:
+            self.pooled_driver = PooledDriver(create_chrome_driver(browser_profile))
+        self.driver = self.pooled_driver.driver
+
+    def go_to_link(self, link, accept_season_menu=False):
+        started_at = time.time()
+        self.last_page_ready = True
+        try:
+            self.driver.get(link)
+        except WebDriverException:
+            # Don't hand a crashed browser back out
+            self.pooled_driver.mark_broken()
+            raise
+        self.pooled_driver.count_page_load()
+        try:
+            # If no Login button, page not found
+            self.driver.find_element_by_css_selector('.button-dark')
+        except NoSuchElementException:
+            logger.warning('Problem with link, could not find Login button - %s', link)
+            return False
+        if self.readiness != None:
+            self.last_page_ready = self.readiness.wait_until_ready(self.driver, link, started_at, accept_season_menu)
+        else:
+            # Workaround for ajax page loading issue
+            time.sleep(self.wait_on_page_load)
+        return True
+
+    def get_html_source(self):
+        return self.driver.page_source
+
+    def fetch_games(self, link, number_of_outcomes, base_url=BASE_URL):
+        if self.extraction != 'js':
+            return super().fetch_games(link, number_of_outcomes, base_url)
+        if not self.go_to_link(link):
+            return None
+        games = parse_extracted_rows(self.driver.execute_script(EXTRACT_ROWS_SCRIPT), link, number_of_outcomes, \
+                                     base_url=base_url)
+        if games is None:
+            logger.warning('Found "No data available", skipping %s', link)
+            return []
+        return games
+
+    def close(self):
+        """
+        Gives a leased browser back to its pool, or quits our own browser
+        """
+        if self.driver_pool != None:
+            self.driver_pool.release(self.pooled_driver)
+        else:
+            quit_driver(self.driver)
+
+
+def page_fragment_to_path(url):
+    """
+    Pagination pages only differ by their "#/page/N/" fragment, which never reaches
+    the server, so ask for the ".../page/N/" path form instead
+
+    Returns:
+        (str) URL to request over HTTP
+    """
+    return PAGE_FRAGMENT_REGEX.sub(r'page/\1/', url)
+
+
+class HttpFetcher(Fetcher):
+    """
+    Fetches page HTML directly with a pooled HTTP client - no browser involved.
+    Only works for pages where the server sends the data we need in the HTML -
+    it doesn't go on to fetch the AJAX fragments a results page fills its table
+    in from, so a results page that comes back without its table counts as not
+    loaded rather than as a page with no games.
+    """
+    def __init__(self, http=None, timeout=10, url_rewriter=page_fragment_to_path):
+        if http is None:
+            http = get_process_pool_manager()
+        self.http = http
+        self.timeout = timeout
+        self.url_rewriter = url_rewriter
+        self.html_source = str()
+
+    def request(self, link):
+        """
+        Returns:
+            (str) HTML the server sent for link, or None if the request failed
+        """
+        url = self.url_rewriter(link) if self.url_rewriter != None else link
+        try:
+            response = self.http.request('GET', url, timeout=self.timeout, \
+                                         headers={ 'User-Agent' : USER_AGENT_STRING, 'Referer' : link })
+        except urllib3.exceptions.HTTPError as e:
+            logger.warning('Problem with link, HTTP request failed (%s) - %s', str(e), link)
+            return None
+        if response.status != 200:
+            logger.warning('Problem with link, got HTTP status %d - %s', response.status, link)
+            return None
+        return response.data.decode('utf-8', errors='replace')
+
+    def go_to_link(self, link, accept_season_menu=False):
+        self.html_source = str()
+        html_source = self.request(link)
+        if html_source is None:
+            return False
+        if 'button-dark' not in html_source:
+            # If no Login button, page not found
+            logger.warning('Problem with link, could not find Login button - %s', link)
+            return False
+        if not accept_season_menu and not has_results(parse_html(html_source)):
+            # Table is filled in by JavaScript we don't run - don't let it pass for an empty page
+            logger.warning('Problem with link, results table missing from the HTML - %s', link)
+            return False
+        self.html_source = html_source
+        return True
+
+    def get_html_source(self):
+        return self.html_source
+
+
+class CachingFetcher(Fetcher):
+    """
+    Serves pages from a PageCache, going to the wrapped fetcher only on a miss.
+    Pass fetcher_factory instead of fetcher to only create it (e.g. lease a browser) on the first miss.
+    With offline=True no fetcher is needed - it only ever reads the cache.
+    """
+    def __init__(self, cache, fetcher=None, offline=False, fetcher_factory=None):
+        if fetcher is None and fetcher_factory is None and not offline:
+            raise RuntimeError('CachingFetcher needs a fetcher unless offline')
+        self.cache = cache
+        self.fetcher = fetcher
+        self.fetcher_factory = fetcher_factory
+        self.offline = offline
+        self.html_source = str()
+
+    def get_fetcher(self):
+        if self.fetcher is None:
+            self.fetcher = self.fetcher_factory()
+        return self.fetcher
+
+    def fetch(self, link):
+        html_source = self.cache.get(link, allow_stale=self.offline)
+        if html_source != None or self.offline:
+            return html_source
+        html_source = self.get_fetcher().fetch(link)
+        if html_source != None and self.fetcher.last_page_ready:
+            self.cache.put(link, html_source)
+        return html_source
+
+    def go_to_link(self, link, accept_season_menu=False):
+        self.html_source = str()
+        html_source = self.cache.get(link, allow_stale=self.offline)
+        if html_source is None:
+            if self.offline:
+                logger.warning('Offline and page not in cache - %s', link)
+                return False
+            if not self.get_fetcher().go_to_link(link, accept_season_menu):
+                return False
+            html_source = self.fetcher.get_html_source()
+            if self.fetcher.last_page_ready:
+                self.cache.put(link, html_source)
+            else:
+                logger.info('Not caching page that may be incomplete - %s', link)
+        self.html_source = html_source
+        return True
+
+    def get_html_source(self):
+        return self.html_source
+
+    def close(self):
+        if self.fetcher != None:
+            self.fetcher.close()
+
+
+_process_pool_manager = None
+_process_pool_manager_pid = None
+
+
+def get_process_pool_manager(maxsize=10):
+    """
+    One HTTP connection pool per worker process, shared by all HttpFetchers in it
+
+    Returns:
+        (urllib3.PoolManager)
+    """
+    global _process_pool_manager, _process_pool_manager_pid
+    if _process_pool_manager is None or _process_pool_manager_pid != os.getpid():
+        retries = urllib3.util.Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        _process_pool_manager = urllib3.PoolManager(maxsize=maxsize, block=True, retries=retries)
+        _process_pool_manager_pid = os.getpid()
+    return _process_pool_manager
+
+
+def make_fetcher(name, wait_on_page_load=3, driver_pool=None, readiness=None, browser_profile=None, extraction='html'):
+    """
+    Params:
+        name (str) 'selenium' or 'http'
+        browser_profile (BrowserProfile) optional, for a selenium fetcher that starts its own browser
+        extraction (str) 'html' or 'js', for a selenium fetcher
+
+    Returns:
+        (Fetcher)
+    """
+    if name == 'selenium':
+        return SeleniumFetcher(wait_on_page_load=wait_on_page_load, driver_pool=driver_pool, readiness=readiness, \
+                               browser_profile=browser_profile, extraction=extraction)
+    elif name == 'http':
+        return HttpFetcher()
+    raise RuntimeError('Unknown fetcher - ' + str(name))
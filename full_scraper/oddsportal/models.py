@@ -11,6 +11,15 @@ import os
 
 
 class Game(object):
+    # Fixed set of fields without a per-object __dict__ - there can be hundreds of thousands of these
+    __slots__ = ('retrieval_url', 'retrieval_datetime', 'game_datetime', 'game_url', 'num_possible_outcomes', \
+                 'team_home', 'team_away', 'odds_home', 'odds_away', 'odds_draw', 'outcome', 'score_home', \
+                 'score_away', 'game_unix_time')
+    # game_unix_time is only kept in memory, for columnar output - JSON, NDJSON and checkpoints stay as they were
+    JSON_FIELDS = ('retrieval_url', 'retrieval_datetime', 'game_datetime', 'game_url', 'num_possible_outcomes', \
+                   'team_home', 'team_away', 'odds_home', 'odds_away', 'odds_draw', 'outcome', 'score_home', \
+                   'score_away')
+
     def __init__(self):
         self.retrieval_url = str()
         self.retrieval_datetime = str()
@@ -25,14 +34,34 @@ class Game(object):
         self.outcome = str()
         self.score_home = str()
         self.score_away = str()
+        # Kickoff as read off the page, unix epoch seconds - game_datetime is this in local time
+        self.game_unix_time = None
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in Game.JSON_FIELDS)
+
+    def __getstate__(self):
+        # Pickle as a bare tuple of values, not a dict of field names to values
+        return tuple(getattr(self, field) for field in Game.__slots__)
+
+    def __setstate__(self, state):
+        # State pickled before game_unix_time was added has one value fewer
+        self.game_unix_time = None
+        for field, value in zip(Game.__slots__, state):
+            setattr(self, field, value)
 
 
 class Season(object):
+    __slots__ = ('name', 'games', 'urls', 'possible_outcomes', 'prefetched_pages')
+    JSON_FIELDS = ('name', 'games', 'urls', 'possible_outcomes')
+
     def __init__(self,name):
         self.name = name
         self.games = list()
         self.urls = list()
         self.possible_outcomes = int()
+        # HTML of pages an earlier stage already loaded, by URL, so later stages needn't load them again
+        self.prefetched_pages = dict()
 
     def add_game(self,game):
         self.games.append(game)
@@ -40,6 +69,19 @@ class Season(object):
     def add_url(self,url):
         self.urls.append(url)
 
+    def add_prefetched_page(self,url,html_source):
+        self.prefetched_pages[url] = html_source
+
+    def take_prefetched_page(self,url):
+        """
+        Returns:
+            (str) HTML already loaded for url, or None - either way it is not kept any longer
+        """
+        return self.prefetched_pages.pop(url, None)
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in Season.JSON_FIELDS)
+
 
 class League(object):
     def __init__(self,name):
@@ -56,7 +98,10 @@ class League(object):
 
 class BasicJsonEncoder(json.JSONEncoder):
         def default(self, o):
-            return o.__dict__ 
+            # Slotted models have no __dict__, they say what to write themselves
+            if hasattr(o, 'to_dict'):
+                return o.to_dict()
+            return o.__dict__
 
 
 class Collection(object):
@@ -0,0 +1,154 @@
+"""
+page_cache.py
+
+Compressed on-disk cache of page HTML keyed by URL, so reruns don't fetch
+finished seasons again and parsing can be replayed offline
+
+"""
+
+
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = 'index.sqlite'
+CLOSED_SEASON_URL_REGEX = re.compile(r'-\d{4}(-\d{4})?/results/')
+
+
+def is_closed_season_url(url):
+    """
+    Past seasons have their years in the URL, e.g. .../nhl-2017-2018/results/,
+    while the current season is just .../nhl/results/
+
+    Returns:
+        (bool) True if the page belongs to a season that is over, so never changes
+    """
+    return CLOSED_SEASON_URL_REGEX.search(url) != None
+
+
+class PageCache(object):
+    """
+    Pages of closed seasons are kept indefinitely, current season pages expire after
+    `current_season_ttl` seconds. Once the cache grows past `max_bytes`, least recently
+    used pages get evicted - current season ones first.
+    """
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, current_season_ttl=12 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.current_season_ttl = current_season_ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, INDEX_FILENAME), timeout=30, check_same_thread=False)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS pages
+                             (key text PRIMARY KEY, url text, is_closed integer,
+                              fetched_at real, last_access real, size integer)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_eviction ON pages (is_closed, last_access)')
+        self.conn.commit()
+
+    def key_for(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], key + '.html.gz')
+
+    def get(self, url, allow_stale=False):
+        """
+        Params:
+            url (str) of the page
+            allow_stale (bool) return expired current season pages too, e.g. when offline
+
+        Returns:
+            (str) cached HTML, or None on a miss
+        """
+        key = self.key_for(url)
+        with self.lock:
+            row = self.conn.execute('SELECT is_closed, fetched_at FROM pages WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            is_closed, fetched_at = row
+            if not is_closed and not allow_stale and time.time() - fetched_at > self.current_season_ttl:
+                self.misses += 1
+                return None
+            try:
+                with gzip.open(self.path_for(key), 'rt', encoding='utf-8') as cached_file:
+                    html_source = cached_file.read()
+            except (OSError, EOFError):
+                # Index and files out of step - treat as a miss and let it get fetched again
+                self.conn.execute('DELETE FROM pages WHERE key = ?', (key,))
+                self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE pages SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return html_source
+
+    def put(self, url, html_source):
+        key = self.key_for(url)
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as cached_file:
+            cached_file.write(html_source)
+        os.replace(temp_path, path)
+        now = time.time()
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)', \
+                              (key, url, int(is_closed_season_url(url)), now, now, os.path.getsize(path)))
+            self.conn.commit()
+            self.evict_if_needed()
+
+    def evict_if_needed(self):
+        """
+        Drops least recently used pages until the cache is back under max_bytes.
+        Expects self.lock to be held.
+        """
+        total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.conn.execute('SELECT key, size FROM pages ORDER BY is_closed, last_access').fetchall():
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+            self.conn.execute('DELETE FROM pages WHERE key = ?', (key,))
+            total_bytes -= size
+            evicted += 1
+        self.conn.commit()
+        logger.info('Evicted %d pages from page cache', evicted)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_process_cache = None
+_process_cache_pid = None
+
+
+def get_process_cache(directory, max_bytes=2 * 1024 ** 3, current_season_ttl=12 * 3600):
+    """
+    One PageCache (and index connection) per worker process
+
+    Returns:
+        (PageCache)
+    """
+    global _process_cache, _process_cache_pid
+    if _process_cache is None or _process_cache_pid != os.getpid():
+        _process_cache = PageCache(directory, max_bytes=max_bytes, current_season_ttl=current_season_ttl)
+        _process_cache_pid = os.getpid()
+    return _process_cache
@@ -0,0 +1,328 @@
+"""
+parser.py
+
+Single-pass parsing of Odds Portal results pages into Game objects
+
+"""
+
+
+from .models import Game
+from lxml import html as lxml_html
+
+import logging
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = 'https://www.oddsportal.com'
+NO_DATA_SELECTOR = 'div.message-info > ul > li > div.cms'
+RESULTS_TABLE_SELECTOR = 'div#tournamentTable > table#tournamentTable'
+TABLE_ROWS_SELECTOR = 'div#tournamentTable > table#tournamentTable > tbody > tr'
+
+
+def parse_html(html_source):
+    """
+    Params:
+        (str) html_source of a results page
+
+    Returns:
+        (lxml.html.HtmlElement) document root to hand to the other functions here
+    """
+    return lxml_html.fromstring(html_source)
+
+
+def has_no_data(document):
+    """
+    Returns:
+        (bool) True if the page says "No data available"
+    """
+    for div in document.cssselect(NO_DATA_SELECTOR):
+        if squash_text(div.text_content()) == 'No data available':
+            return True
+    return False
+
+
+def has_results(document):
+    """
+    Returns:
+        (bool) True if the page has its results table, or says "No data available" instead -
+            False when the table was never filled in, e.g. HTML that still waits on its AJAX fragment
+    """
+    return len(document.cssselect(RESULTS_TABLE_SELECTOR)) > 0 or has_no_data(document)
+
+
+def squash_text(text):
+    """
+    Collapse runs of whitespace the same way PyQuery.text() does
+    """
+    return ' '.join(text.split())
+
+
+def parse_unix_time_from_classes(class_string):
+    """
+    Odds Portal encodes kickoff time in a class of the time cell, e.g. "t1563580800-1-1-0-0"
+
+    Returns:
+        (int) unix time or None if no such class
+    """
+    for cell_class in class_string.split(' '):
+        if 0 == len(cell_class) or cell_class[0] != 't':
+            continue
+        if cell_class[1] == '0' or cell_class[1] == '1' or cell_class[2] == '2':
+            return int(cell_class.split('-')[0].replace('t',''))
+    return None
+
+
+def parse_game_row(row, url, number_of_outcomes, retrieval_datetime, base_url=BASE_URL):
+    """
+    Walks the cells of one tournament table row a single time
+
+    Params:
+        row (lxml.html.HtmlElement) <tr> of the tournament table
+        url (str) the page this row was retrieved from
+        number_of_outcomes (int) either 2 or 3
+        retrieval_datetime (str) formatted time the page was retrieved
+
+    Returns:
+        (Game) or None if this row does not contain game/match data
+
+    Raises:
+        RuntimeError or others when the data format is not as expected
+    """
+    time_cell = None
+    participants_links = []
+    score_cell = None
+    odds_links = []
+    for cell in row.iterchildren('td'):
+        cell_classes = cell.get('class', '').split()
+        if 'table-time' in cell_classes:
+            if time_cell is None:
+                time_cell = cell
+        elif 'table-participant' in cell_classes:
+            participants_links.extend(cell.iterchildren('a'))
+        elif 'table-score' in cell_classes:
+            if score_cell is None:
+                score_cell = cell
+        elif 'odds-nowrp' in cell_classes:
+            odds_links.extend(cell.iterchildren('a'))
+    # A blank time cell tells us this is not a game data row
+    if time_cell is None:
+        return None
+    return game_from_cells(time_cell.get('class', ''), [link.text_content() for link in participants_links], \
+                           participants_links[0].attrib['href'] if len(participants_links) > 0 else None, \
+                           score_cell.text_content() if score_cell is not None else None, \
+                           [link.text for link in odds_links], url, number_of_outcomes, retrieval_datetime, base_url)
+
+
+def game_from_cells(time_classes, participant_texts, game_href, score_text, odds_texts, url, number_of_outcomes, \
+                    retrieval_datetime, base_url=BASE_URL):
+    """
+    Types the raw contents of one row's cells, however they were pulled out of the page
+
+    Params:
+        time_classes (str) class attribute of the time cell
+        participant_texts (list) text of each link in the participants cell
+        game_href (str) href of the first participants link, or None
+        score_text (str) text of the score cell, or None
+        odds_texts (list) text of each odds link, None where a link has no text of its own
+
+    Returns:
+        (Game) or None if this row does not contain game/match data
+
+    Raises:
+        RuntimeError or others when the data format is not as expected
+    """
+    unix_time = parse_unix_time_from_classes(time_classes)
+    # If time isn't set, then assume corrupt data and skip the row
+    if unix_time is None:
+        return None
+    game = Game()
+    game.game_datetime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(unix_time))
+    game.game_unix_time = unix_time
+    game.retrieval_datetime = retrieval_datetime
+    game.retrieval_url = url
+    game.num_possible_outcomes = number_of_outcomes
+    participants = ' '.join(squash_text(text) for text in participant_texts).split(' - ')
+    # Team names repeat all through a season, so keep one copy of each
+    game.team_home = sys.intern(participants[0])
+    game.team_away = sys.intern(participants[1])
+    if game_href is None:
+        raise RuntimeError('Participants cell has no link to the game')
+    game.game_url = base_url + game_href
+    if score_text is None:
+        raise RuntimeError('Row has no score cell')
+    # Perform crude sanitization against various things appended to scores, like " OT"
+    overall_score_string = squash_text(score_text).split()[0]
+    # Home team/participant is always listed first in Odds Portal's scores
+    if ':' in overall_score_string:
+        game.score_home = int(overall_score_string.split(':')[0])
+        game.score_away = int(overall_score_string.split(':')[1])
+    elif '-' in overall_score_string:
+        game.score_home = int(overall_score_string.split('-')[0])
+        game.score_away = int(overall_score_string.split('-')[1])
+    else:
+        logger.warning('Could not split score string - delimiter unknown')
+        raise RuntimeError('Could not split score string - delimiter unknown')
+    # Based on the score we can infer the outcome, as follows...
+    if game.score_home > game.score_away:
+        game.outcome = 'HOME'
+    elif game.score_home < game.score_away:
+        game.outcome = 'AWAY'
+    else:
+        game.outcome = 'DRAW'
+    # Odds cells - either 2 or 3 depending on number of possible outcomes
+    if len(odds_texts) < 2:
+        # Assume data corruption and skip this row
+        return None
+    elif number_of_outcomes != 2 and number_of_outcomes != 3:
+        raise RuntimeError('Unsupported number of outcomes specified - ' + str(number_of_outcomes))
+    if 2 == number_of_outcomes:
+        game.odds_home = odds_texts[0]
+        # Away team odds are in the last link
+        game.odds_away = odds_texts[-1]
+        game.odds_draw = None
+    else:
+        game.odds_home = odds_texts[0]
+        game.odds_draw = odds_texts[1]
+        if len(odds_texts) > 2:
+            game.odds_away = odds_texts[-1]
+    return game
+
+
+def parse_games(document, url, number_of_outcomes, retrieval_datetime=None, base_url=BASE_URL):
+    """
+    Params:
+        document (lxml.html.HtmlElement) from parse_html()
+        url (str) the page this document was retrieved from
+        number_of_outcomes (int) either 2 or 3
+
+    Returns:
+        (list) of Game objects, in table order
+    """
+    if retrieval_datetime is None:
+        retrieval_datetime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    games = []
+    for row in document.cssselect(TABLE_ROWS_SELECTOR):
+        try:
+            game = parse_game_row(row, url, number_of_outcomes, retrieval_datetime, base_url)
+        except Exception:
+            logger.warning('Skipping row, encountered exception - data format not as expected')
+            continue
+        if game is not None:
+            games.append(game)
+    return games
+
+
+def parse_results_page(html_source, url, number_of_outcomes, base_url=BASE_URL):
+    """
+    Convenience wrapper going straight from page HTML to games
+
+    Returns:
+        (list) of Game objects, or None if the page says "No data available"
+    """
+    document = parse_html(html_source)
+    if has_no_data(document):
+        return None
+    return parse_games(document, url, number_of_outcomes, base_url=base_url)
+
+
+# Run in the browser by SeleniumFetcher, returning just what game_from_cells needs instead of the whole page
+EXTRACT_ROWS_SCRIPT = """
+return (function () {
+    function hasClass(element, name) {
+        return element.classList.contains(name);
+    }
+    function ownText(element) {
+        var first = element.firstChild;
+        return first !== null && first.nodeType === 3 ? first.nodeValue : null;
+    }
+    function childLinks(cell) {
+        var links = [];
+        for (var i = 0; i < cell.children.length; i++) {
+            if (cell.children[i].tagName === 'A') {
+                links.push(cell.children[i]);
+            }
+        }
+        return links;
+    }
+    var messages = [];
+    document.querySelectorAll('%s').forEach(function (div) {
+        messages.push(div.textContent);
+    });
+    var rows = [];
+    document.querySelectorAll('%s').forEach(function (row) {
+        var timeCell = null, scoreCell = null, participantsLinks = [], oddsLinks = [];
+        for (var i = 0; i < row.children.length; i++) {
+            var cell = row.children[i];
+            if (cell.tagName !== 'TD') {
+                continue;
+            }
+            if (hasClass(cell, 'table-time')) {
+                if (timeCell === null) {
+                    timeCell = cell;
+                }
+            } else if (hasClass(cell, 'table-participant')) {
+                participantsLinks = participantsLinks.concat(childLinks(cell));
+            } else if (hasClass(cell, 'table-score')) {
+                if (scoreCell === null) {
+                    scoreCell = cell;
+                }
+            } else if (hasClass(cell, 'odds-nowrp')) {
+                oddsLinks = oddsLinks.concat(childLinks(cell));
+            }
+        }
+        if (timeCell === null) {
+            return;
+        }
+        rows.push({
+            time_classes: timeCell.getAttribute('class') || '',
+            participants: participantsLinks.map(function (link) { return link.textContent; }),
+            href: participantsLinks.length > 0 ? participantsLinks[0].getAttribute('href') : null,
+            score: scoreCell !== null ? scoreCell.textContent : null,
+            odds: oddsLinks.map(ownText)
+        });
+    });
+    return { messages: messages, rows: rows };
+})();
+""" % (NO_DATA_SELECTOR, TABLE_ROWS_SELECTOR)
+
+
+def parse_extracted_rows(extracted, url, number_of_outcomes, retrieval_datetime=None, base_url=BASE_URL):
+    """
+    Checks and types what EXTRACT_ROWS_SCRIPT returned
+
+    Params:
+        extracted (dict) with "messages" and "rows", straight from the browser
+
+    Returns:
+        (list) of Game objects, in table order, or None if the page says "No data available"
+
+    Raises:
+        RuntimeError if extracted isn't shaped like EXTRACT_ROWS_SCRIPT's result at all
+    """
+    if not isinstance(extracted, dict) or not isinstance(extracted.get('messages'), list) or \
+       not isinstance(extracted.get('rows'), list):
+        raise RuntimeError('Unexpected result from in-browser row extraction')
+    for message in extracted['messages']:
+        if isinstance(message, str) and squash_text(message) == 'No data available':
+            return None
+    if retrieval_datetime is None:
+        retrieval_datetime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    games = []
+    for row in extracted['rows']:
+        try:
+            if not isinstance(row.get('time_classes'), str) or not isinstance(row.get('participants'), list) or \
+               not all(isinstance(text, str) for text in row['participants']) or \
+               not isinstance(row.get('odds'), list) or \
+               not all(text is None or isinstance(text, str) for text in row['odds']):
+                raise RuntimeError('Extracted row is missing fields')
+            game = game_from_cells(row['time_classes'], row['participants'], row.get('href'), row.get('score'), \
+                                   row['odds'], url, number_of_outcomes, retrieval_datetime, base_url)
+        except Exception:
+            logger.warning('Skipping row, encountered exception - data format not as expected')
+            continue
+        if game is not None:
+            games.append(game)
+    return games
@@ -0,0 +1,187 @@
+"""
+readiness.py
+
+Waits for concrete signs that an Odds Portal page has finished loading,
+instead of always sleeping a fixed number of seconds, and records how long
+each page actually took
+
+"""
+
+
+from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+
+import logging
+import os
+import re
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+PAGE_NUMBER_REGEX = re.compile(r'#/page/(\d+)/?')
+SEASON_SUFFIX_REGEX = re.compile(r'-\d{4}(-\d{4})?$')
+
+NO_DATA_SELECTOR = 'div.message-info > ul > li > div.cms'
+NO_DATA_TEXT = 'No data available'
+TABLE_ROWS_SELECTOR = 'table#tournamentTable > tbody > tr'
+ACTIVE_PAGE_SELECTOR = 'div#pagination span.active-page'
+SEASON_LINKS_SELECTOR = 'div.main-menu2.main-menu-gray > ul.main-filter'
+
+
+def league_key_from_url(url):
+    """
+    e.g. https://www.oddsportal.com/hockey/usa/nhl-2017-2018/results/#/page/2/ -> hockey/usa/nhl
+
+    Returns:
+        (str) key to group page timings by league
+    """
+    path = url.split('://', 1)[-1].split('#')[0]
+    parts = [part for part in path.split('/')[1:] if part != '' and part != 'results']
+    if len(parts) > 0:
+        parts[-1] = SEASON_SUFFIX_REGEX.sub('', parts[-1])
+    return '/'.join(parts)
+
+
+def page_number_from_url(url):
+    """
+    Returns:
+        (int) page number from a "#/page/N/" URL fragment, or None if there is none
+    """
+    match = PAGE_NUMBER_REGEX.search(url)
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+class PageTiming(object):
+    def __init__(self, url, seconds, signal):
+        self.url = url
+        self.league = league_key_from_url(url)
+        self.seconds = seconds
+        self.signal = signal
+
+
+class ResultsPageReady(object):
+    """
+    Expected condition for WebDriverWait - the page is ready once it says "No data available",
+    or it has tournament table rows (for the requested pagination page, where there is one).
+    Only for a league's root page, which we just want the season links of, is the season menu enough -
+    the server renders it on every results page, before the table arrives.
+
+    Calling it returns the name of the signal seen, or False.
+    """
+    def __init__(self, url, accept_season_menu=False):
+        self.expected_page = page_number_from_url(url)
+        self.accept_season_menu = accept_season_menu
+
+    def __call__(self, driver):
+        for no_data in driver.find_elements_by_css_selector(NO_DATA_SELECTOR):
+            if no_data.text.strip() == NO_DATA_TEXT:
+                return 'no-data'
+        if len(driver.find_elements_by_css_selector(TABLE_ROWS_SELECTOR)) > 0:
+            if self.expected_page is None or self.expected_page == 1:
+                return 'table-rows'
+            # Pagination swaps the table via AJAX, so rows alone may still be the previous page's
+            for active_page in driver.find_elements_by_css_selector(ACTIVE_PAGE_SELECTOR):
+                if active_page.text.strip() == str(self.expected_page):
+                    return 'table-rows'
+            return False
+        if self.accept_season_menu and len(driver.find_elements_by_css_selector(SEASON_LINKS_SELECTOR)) > 0:
+            return 'season-menu'
+        return False
+
+
+class PageReadiness(object):
+    """
+    Waits up to `timeout` seconds for a ready signal, and sleeps `fallback_wait`
+    seconds like before if none shows up in time
+    """
+    def __init__(self, timeout=10, fallback_wait=3, poll_frequency=0.1, timings_path=None):
+        self.timeout = timeout
+        self.fallback_wait = fallback_wait
+        self.poll_frequency = poll_frequency
+        self.timings_path = timings_path
+        self.timings = []
+        self.lock = threading.Lock()
+
+    def wait_until_ready(self, driver, url, started_at=None, accept_season_menu=False):
+        """
+        Params:
+            driver (webdriver) that has just navigated to url
+            url (str) that was navigated to
+            started_at (float) time.time() from before navigating, defaults to now
+            accept_season_menu (bool) the page is a league's root page, only needed for its season links
+
+        Returns:
+            (bool) True if a ready signal was seen, False if we fell back to the fixed wait
+        """
+        if started_at is None:
+            started_at = time.time()
+        try:
+            signal = WebDriverWait(driver, self.timeout, poll_frequency=self.poll_frequency) \
+                .until(ResultsPageReady(url, accept_season_menu))
+        except (TimeoutException, WebDriverException):
+            logger.warning('No ready signal after %s seconds, falling back to fixed wait - %s', str(self.timeout), url)
+            time.sleep(self.fallback_wait)
+            signal = 'fallback'
+        self.record(PageTiming(url, time.time() - started_at, signal))
+        return signal != 'fallback'
+
+    def record(self, timing):
+        with self.lock:
+            self.timings.append(timing)
+            if self.timings_path is None:
+                return
+            is_new_file = not os.path.isfile(self.timings_path)
+            with open(self.timings_path, 'a') as timings_file:
+                if is_new_file:
+                    timings_file.write('league,url,seconds,signal\n')
+                timings_file.write('%s,%s,%.3f,%s\n' % (timing.league, timing.url, timing.seconds, timing.signal))
+
+    def timing_summary(self):
+        """
+        Returns:
+            (dict) league -> dict of page count, mean/p50/p95/max seconds and number of fallbacks
+        """
+        by_league = dict()
+        with self.lock:
+            for timing in self.timings:
+                by_league.setdefault(timing.league, []).append(timing)
+        summary = dict()
+        for league, timings in by_league.items():
+            seconds = sorted(timing.seconds for timing in timings)
+            summary[league] = {
+                'pages' : len(seconds),
+                'mean' : sum(seconds) / len(seconds),
+                'p50' : seconds[len(seconds) // 2],
+                'p95' : seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))],
+                'max' : seconds[-1],
+                'fallbacks' : len([timing for timing in timings if timing.signal == 'fallback'])
+            }
+        return summary
+
+    def log_timing_summary(self):
+        for league, stats in self.timing_summary().items():
+            logger.info('Page load times for %s: %d pages, mean %.2fs, p50 %.2fs, p95 %.2fs, max %.2fs, %d fallbacks', \
+                        league, stats['pages'], stats['mean'], stats['p50'], stats['p95'], stats['max'], stats['fallbacks'])
+
+
+_process_readiness = None
+_process_readiness_pid = None
+
+
+def get_process_readiness(timeout=10, fallback_wait=3, timings_path=None):
+    """
+    One PageReadiness per worker process, so timings accumulate across seasons
+
+    Returns:
+        (PageReadiness)
+    """
+    global _process_readiness, _process_readiness_pid
+    if _process_readiness is None or _process_readiness_pid != os.getpid():
+        _process_readiness = PageReadiness(timeout=timeout, fallback_wait=fallback_wait, timings_path=timings_path)
+        _process_readiness_pid = os.getpid()
+    return _process_readiness
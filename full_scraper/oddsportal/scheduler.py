@@ -0,0 +1,262 @@
+"""
+scheduler.py
+
+Scrapes seasons as page-sized tasks spread over worker processes, with idle
+workers stealing queued pages from busy ones, so a few long seasons don't
+leave most workers waiting at the end of a run
+
+"""
+
+
+from .crawler import add_pagination_links_from_html
+from .driver_pool import close_process_pool
+from .models import Season
+from .parser import BASE_URL
+from .parser import parse_results_page
+
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+
+logger = logging.getLogger(__name__)
+
+PAGINATION_TASK = 'pagination'
+PAGE_TASK = 'page'
+
+
+def next_task(worker_id, task_queues, stop_event, idle_wait=0.1):
+    """
+    Takes from this worker's own queue first, then from the others', starting with the next worker along
+
+    Returns:
+        (tuple) task, or None once the scheduler says there will be no more
+    """
+    while True:
+        for offset in range(len(task_queues)):
+            try:
+                return task_queues[(worker_id + offset) % len(task_queues)].get_nowait()
+            except queue.Empty:
+                continue
+        if stop_event.is_set():
+            return None
+        try:
+            return task_queues[worker_id].get(timeout=idle_wait)
+        except queue.Empty:
+            continue
+
+
+def run_task(fetcher, task, base_url):
+    """
+    Returns:
+        (tuple) result to send back to the scheduler
+    """
+    if task[0] == PAGINATION_TASK:
+        _, season_index, url, number_of_outcomes = task
+        html_source = fetcher.fetch(url)
+        if html_source is None:
+            return (PAGINATION_TASK, season_index, None, None)
+        season = Season('')
+        season.urls.append(url)
+        if not add_pagination_links_from_html(season, html_source):
+            return (PAGINATION_TASK, season_index, season.urls, [])
+        # The first page is already here, no need to fetch it again for its games
+        games = parse_results_page(html_source, url, number_of_outcomes, base_url)
+        return (PAGINATION_TASK, season_index, season.urls, games if games != None else [])
+    _, season_index, page_index, url, number_of_outcomes = task
+    return (PAGE_TASK, season_index, page_index, fetcher.fetch_games(url, number_of_outcomes, base_url))
+
+
+def work_stealing_worker(worker_id, task_queues, result_queue, stop_event, fetcher_factory, base_url):
+    """
+    Worker process main loop - makes a fetcher for each task and closes it after, so a leased browser goes
+    back to the process's DriverPool every time, which recycles it once broken or past its page budget
+    and otherwise hands the same warm browser out again. The pool's browsers are quit when the loop ends.
+    """
+    try:
+        while True:
+            task = next_task(worker_id, task_queues, stop_event)
+            if task is None:
+                break
+            fetcher = None
+            try:
+                fetcher = fetcher_factory()
+                result = run_task(fetcher, task, base_url)
+            except Exception:
+                logger.exception('Worker %d - task failed %s', worker_id, str(task[:3]))
+                if task[0] == PAGINATION_TASK:
+                    result = (PAGINATION_TASK, task[1], None, None)
+                else:
+                    result = (PAGE_TASK, task[1], task[2], None)
+            finally:
+                if fetcher != None:
+                    fetcher.close()
+            result_queue.put(result + (worker_id,))
+    finally:
+        # atexit never runs in a multiprocessing child, so quit the process's browsers here
+        close_process_pool()
+
+
+class WorkStealingScheduler(object):
+    """
+    Expands each season into one pagination task and then one task per further page, handed out
+    round-robin to per-worker queues. Checkpointing and assembling seasons happen here in the parent.
+    """
+    def __init__(self, fetcher_factory, num_workers=-1, base_url=BASE_URL, progress_interval=30):
+        """
+        Params:
+            fetcher_factory (function) called in a worker to make the Fetcher for each task, closed after it -
+                must pickle, so a module-level function or a functools.partial of one
+            num_workers (int) worker processes, -1 for one per CPU
+        """
+        if num_workers == None or num_workers < 1:
+            num_workers = os.cpu_count() or 1
+        self.num_workers = num_workers
+        self.fetcher_factory = fetcher_factory
+        self.base_url = base_url
+        self.progress_interval = progress_interval
+        self.next_queue = 0
+
+    def put_task(self, task):
+        self.task_queues[self.next_queue].put(task)
+        self.next_queue = (self.next_queue + 1) % self.num_workers
+
+    def scrape_seasons(self, seasons, checkpoints=None, on_season_done=None):
+        """
+        Params:
+            seasons (list) of Season objects with just their first url and possible_outcomes set
+            checkpoints (list) optional SeasonCheckpoint for each season
+            on_season_done (function) optional, called with each Season as soon as it is finished
+
+        Returns:
+            (list) the same seasons, now with all their urls and games, in the same order
+        """
+        if checkpoints is None:
+            checkpoints = [None] * len(seasons)
+        context = multiprocessing.get_context()
+        self.task_queues = [context.Queue() for _ in range(self.num_workers)]
+        result_queue = context.Queue()
+        stop_event = context.Event()
+        pages_by_season = [dict() for _ in seasons]
+        all_pages_completed = [True] * len(seasons)
+        pending = [0] * len(seasons)
+        seasons_left = 0
+        for season_index, season in enumerate(seasons):
+            checkpoint = checkpoints[season_index]
+            if checkpoint != None and checkpoint.is_done:
+                season.urls = list(checkpoint.urls)
+                for game in checkpoint.games_in_order(season.urls):
+                    season.add_game(game)
+                logger.info('Season "%s" - already completed, loaded %d games from checkpoint', season.name, \
+                            len(season.games))
+                if on_season_done != None:
+                    on_season_done(season)
+            elif checkpoint != None and checkpoint.urls != None:
+                season.urls = list(checkpoint.urls)
+                pending[season_index] = self.queue_pages(season_index, season, checkpoint, pages_by_season)
+                seasons_left += 1
+            else:
+                self.put_task((PAGINATION_TASK, season_index, season.urls[0], season.possible_outcomes))
+                pending[season_index] = 1
+                seasons_left += 1
+        workers = [context.Process(target=work_stealing_worker, args=(i, self.task_queues, result_queue, stop_event, \
+                                   self.fetcher_factory, self.base_url)) for i in range(self.num_workers)]
+        for worker in workers:
+            worker.start()
+        started_at = time.time()
+        last_progress_at = started_at
+        pages_done = 0
+        pages_done_at_last_progress = 0
+        tasks_by_worker = [0] * self.num_workers
+        try:
+            # Seasons with nothing left to fetch still need finishing off
+            for season_index, season in enumerate(seasons):
+                if pending[season_index] == 0 and not (checkpoints[season_index] != None and checkpoints[season_index].is_done):
+                    seasons_left -= 1
+                    self.finish_season(season, checkpoints[season_index], pages_by_season[season_index], \
+                                       all_pages_completed[season_index], on_season_done)
+            while seasons_left > 0:
+                try:
+                    result = result_queue.get(timeout=1)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        raise RuntimeError('All scheduler workers exited with work still queued')
+                    continue
+                season_index = result[1]
+                season = seasons[season_index]
+                checkpoint = checkpoints[season_index]
+                tasks_by_worker[result[-1]] += 1
+                pages_done += 1
+                pending[season_index] -= 1
+                if result[0] == PAGINATION_TASK:
+                    urls, games = result[2], result[3]
+                    if urls is None:
+                        logger.warning('Season "%s" - could not load first page %s', season.name, season.urls[0])
+                        all_pages_completed[season_index] = False
+                    else:
+                        season.urls = urls
+                        if checkpoint != None:
+                            checkpoint.record_pagination(season.urls)
+                        pages_by_season[season_index][0] = games
+                        if checkpoint != None:
+                            checkpoint.record_page(season.urls[0], games)
+                        logger.info('Season "%s" - found %d pages', season.name, len(season.urls))
+                        pending[season_index] += self.queue_pages(season_index, season, checkpoint, pages_by_season)
+                else:
+                    page_index, games = result[2], result[3]
+                    url = season.urls[page_index]
+                    if games is None:
+                        logger.warning('Could not load page, skipping %s', url)
+                        all_pages_completed[season_index] = False
+                    else:
+                        pages_by_season[season_index][page_index] = games
+                        if checkpoint != None:
+                            checkpoint.record_page(url, games)
+                if pending[season_index] == 0:
+                    seasons_left -= 1
+                    self.finish_season(season, checkpoint, pages_by_season[season_index], \
+                                       all_pages_completed[season_index], on_season_done)
+                    pages_by_season[season_index] = None
+                now = time.time()
+                if now - last_progress_at >= self.progress_interval:
+                    logger.info('Scheduler - %d pages done, %.1f pages/second over the last %d seconds, %d seasons left', \
+                                pages_done, (pages_done - pages_done_at_last_progress) / (now - last_progress_at), \
+                                int(now - last_progress_at), seasons_left)
+                    last_progress_at = now
+                    pages_done_at_last_progress = pages_done
+        finally:
+            stop_event.set()
+            for worker in workers:
+                worker.join()
+        elapsed = time.time() - started_at
+        logger.info('Scheduler - %d pages in %.1f seconds (%.1f pages/second), pages per worker: %s', pages_done, \
+                    elapsed, pages_done / elapsed if elapsed > 0 else 0.0, str(tasks_by_worker))
+        return seasons
+
+    def queue_pages(self, season_index, season, checkpoint, pages_by_season):
+        """
+        Returns:
+            (int) number of page tasks queued for this season
+        """
+        queued = 0
+        for page_index, url in enumerate(season.urls):
+            if page_index in pages_by_season[season_index]:
+                continue
+            if checkpoint != None and url in checkpoint.completed_pages:
+                pages_by_season[season_index][page_index] = checkpoint.completed_pages[url]
+                continue
+            self.put_task((PAGE_TASK, season_index, page_index, url, season.possible_outcomes))
+            queued += 1
+        return queued
+
+    def finish_season(self, season, checkpoint, pages, all_pages_completed, on_season_done):
+        for page_index in sorted(pages):
+            for game in pages[page_index]:
+                season.add_game(game)
+        if checkpoint != None and not checkpoint.is_done and all_pages_completed:
+            checkpoint.record_done()
+        logger.info('Season "%s" - scraped %d games', season.name, len(season.games))
+        if on_season_done != None:
+            on_season_done(season)
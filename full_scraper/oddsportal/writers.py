@@ -0,0 +1,75 @@
+"""
+writers.py
+
+Streams games out to disk season by season as they are scraped, so they
+don't all have to be held in memory until the end of a run
+
+"""
+
+
+import gzip
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_output_directory(path):
+    """
+    Same clean slate save_all_collections_to_json gives - the directory exists and is empty
+    """
+    if os.path.isdir(path):
+        for f in os.listdir(path):
+            os.remove(os.path.join(path, f))
+    else:
+        os.makedirs(path)
+
+
+class NdjsonGameWriter(object):
+    """
+    Writes one JSON object per game per line to <output_dir>/<collection output_dir>/<collection name>.ndjson,
+    gzipped if compress is set. Each line has the Game fields plus "collection" and "season".
+    """
+    def __init__(self, output_dir, collection, compress=False):
+        self.collection_name = collection.name
+        qualified_output_dir = os.path.normpath(output_dir + os.sep + collection.output_dir)
+        prepare_output_directory(qualified_output_dir)
+        self.path = os.path.join(qualified_output_dir, collection.name + ('.ndjson.gz' if compress else '.ndjson'))
+        if compress:
+            self.file = gzip.open(self.path, 'wt', encoding='utf-8')
+        else:
+            self.file = open(self.path, 'w', encoding='utf-8')
+        self.games_written = 0
+
+    def write_season(self, season):
+        for game in season.games:
+            record = { 'collection' : self.collection_name, 'season' : season.name }
+            record.update(game.to_dict())
+            self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.games_written += len(season.games)
+        logger.info('Wrote %d games of season "%s" to %s', len(season.games), season.name, self.path)
+
+    def close(self):
+        self.file.close()
+
+
+def make_game_writer(output_format, output_dir, collection):
+    """
+    Params:
+        output_format (str) 'ndjson', 'ndjson.gz' or 'parquet'
+
+    Returns:
+        game writer with write_season(season) and close()
+    """
+    if output_format == 'ndjson':
+        return NdjsonGameWriter(output_dir, collection)
+    elif output_format == 'ndjson.gz':
+        return NdjsonGameWriter(output_dir, collection, compress=True)
+    elif output_format == 'parquet':
+        # pyarrow is only needed by those who ask for Parquet
+        from .columnar import ParquetGameWriter
+        return ParquetGameWriter(output_dir, collection)
+    raise RuntimeError('Unsupported streaming output format - ' + str(output_format))
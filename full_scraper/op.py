@@ -10,8 +10,19 @@ from joblib import Parallel
 from oddsportal import Crawler
 from oddsportal import DataRepository
 from oddsportal import Scraper
+from oddsportal.async_engine import AsyncCrawlEngine
+from oddsportal.checkpoint import CheckpointJournal
+from oddsportal.driver_pool import close_process_pool
+from oddsportal.driver_pool import get_process_pool
+from oddsportal.fetchers import CachingFetcher
+from oddsportal.fetchers import make_fetcher
+from oddsportal.page_cache import get_process_cache
+from oddsportal.readiness import get_process_readiness
+from oddsportal.scheduler import WorkStealingScheduler
+from oddsportal.writers import make_game_writer
 
 import argparse
+import functools
 import json
 import logging
 import time
@@ -20,11 +31,15 @@ import time
 
 TARGET_SPORTS_FILE = 'config/sports.json'
 OUTPUT_DIRECTORY_PATH = 'output'
+PAGE_CACHE_DIRECTORY_PATH = 'cache'
+CHECKPOINT_DIRECTORY_PATH = 'checkpoints'
+RUN_TIMESTAMP = str(int(time.time()))
+PAGE_TIMINGS_FILE = 'logs/page_timings_' + RUN_TIMESTAMP + '.csv'
 
 #######################################################################################################################
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', \
-                    handlers=[ logging.FileHandler('logs/oddsportal_' + str(int(time.time())) + '.log'),\
+                    handlers=[ logging.FileHandler('logs/oddsportal_' + RUN_TIMESTAMP + '.log'),\
                                logging.StreamHandler() ])
 logger = logging.getLogger('oddsportal')
 
@@ -32,6 +47,31 @@ data = DataRepository()
 
 wait_on_page_load = 3 # seconds - default wait time for each page to load completely
 
+page_ready_timeout = 10 # seconds - max wait for a page's ready signal before falling back to wait_on_page_load
+use_fixed_wait = False # always sleep wait_on_page_load instead of waiting on ready signals
+
+fetcher_name = 'selenium' # how pages get loaded - 'selenium' (headless Chrome) or 'http' (no browser)
+extraction = 'html' # selenium - 'html' (parse the page source) or 'js' (pull the rows out in the browser)
+
+engine_name = 'pages' # 'pages' (page tasks shared out over worker processes), 'joblib' (one process per season)
+                      # or 'asyncio' (all pages of all seasons from one process)
+max_concurrency = 32 # asyncio engine - max requests in flight overall
+per_host_limit = 8 # asyncio engine - max requests in flight to one host
+requests_per_second = 10 # asyncio engine - average request rate allowed
+
+output_format = 'json' # 'json' (one document per collection at the end) or 'ndjson'/'ndjson.gz'/'parquet' (streamed per season)
+
+resume = False # pick up where an interrupted run left off, per CHECKPOINT_DIRECTORY_PATH
+
+use_page_cache = True # keep fetched pages in PAGE_CACHE_DIRECTORY_PATH and reuse them on later runs
+offline = False # only ever read pages from the page cache
+cache_max_mb = 2048 # size the page cache gets trimmed back to
+cache_ttl_hours = 12 # how long current season pages stay in the page cache
+
+browser_profile_name = 'lean' # 'lean' (skip images, fonts, stylesheets, ads, trackers) or 'full' (load everything)
+browsers_per_worker = 1 # warm browsers kept in each worker process
+max_pages_per_browser = 250 # page loads before a browser gets recycled
+
 #######################################################################################################################
 
 def get_target_sports_from_file():
@@ -39,30 +79,119 @@ def get_target_sports_from_file():
         data = json.load(json_file)
         return data
 
-def scrape_games_for_season(this_season):
+def get_driver_pool():
+    global browsers_per_worker, max_pages_per_browser, browser_profile_name
+    return get_process_pool(size=browsers_per_worker, max_pages_per_driver=max_pages_per_browser, \
+                            browser_profile_name=browser_profile_name)
+
+def get_page_readiness():
+    global wait_on_page_load, page_ready_timeout, use_fixed_wait
+    if use_fixed_wait:
+        return None
+    return get_process_readiness(timeout=page_ready_timeout, fallback_wait=wait_on_page_load, \
+                                 timings_path=PAGE_TIMINGS_FILE)
+
+def get_page_cache():
+    global cache_max_mb, cache_ttl_hours
+    return get_process_cache(PAGE_CACHE_DIRECTORY_PATH, max_bytes=cache_max_mb * 1024 ** 2, \
+                             current_season_ttl=cache_ttl_hours * 3600)
+
+def get_uncached_fetcher():
+    global wait_on_page_load, fetcher_name, extraction
+    if fetcher_name == 'http':
+        return make_fetcher(fetcher_name)
+    return make_fetcher(fetcher_name, wait_on_page_load=wait_on_page_load, driver_pool=get_driver_pool(), \
+                        readiness=get_page_readiness(), extraction=extraction)
+
+def get_fetcher():
+    global use_page_cache, offline
+    if offline:
+        return CachingFetcher(get_page_cache(), offline=True)
+    if not use_page_cache:
+        return get_uncached_fetcher()
+    # Only start or lease a browser if something actually needs fetching
+    return CachingFetcher(get_page_cache(), fetcher_factory=get_uncached_fetcher)
+
+# Settings worker processes need - they may not inherit this module's globals, e.g. where processes are spawned
+WORKER_SETTINGS = ['wait_on_page_load', 'page_ready_timeout', 'use_fixed_wait', 'fetcher_name', 'extraction', 'use_page_cache', \
+                   'offline', 'cache_max_mb', 'cache_ttl_hours', 'browser_profile_name', 'browsers_per_worker', \
+                   'max_pages_per_browser']
+
+def get_worker_settings():
+    return dict((name, globals()[name]) for name in WORKER_SETTINGS)
+
+def make_worker_fetcher(settings):
+    globals().update(settings)
+    return get_fetcher()
+
+def scrape_games_for_season(this_season, collection_name):
     global wait_on_page_load
-    logger.info('Season "%s" - getting all pagination links', this_season.name)
-    crawler = Crawler(wait_on_page_load=wait_on_page_load)
-    logger.info('Season "%s" - started this crawler', this_season.name)
-    crawler.fill_in_season_pagination_links(this_season)
-    crawler.close_browser()
-    logger.info('Season "%s" - closed this crawler', this_season.name)
-    logger.info('Season "%s" - populating all game data via pagination links', this_season.name)
-    scraper = Scraper(wait_on_page_load=wait_on_page_load)
-    logger.info('Season "%s" - started this scraper', this_season.name)
-    scraper.populate_games_into_season(this_season)
-    scraper.close_browser()
-    logger.info('Season "%s" - closed this scraper', this_season.name)
+    checkpoint = CheckpointJournal(CHECKPOINT_DIRECTORY_PATH).for_season(collection_name, this_season.name)
+    if checkpoint.is_done:
+        this_season.urls = list(checkpoint.urls)
+        for game in checkpoint.games_in_order(this_season.urls):
+            this_season.add_game(game)
+        logger.info('Season "%s" - already completed, loaded %d games from checkpoint', this_season.name, \
+                    len(this_season.games))
+        return this_season
+    try:
+        logger.info('Season "%s" - getting all pagination links', this_season.name)
+        crawler = Crawler(wait_on_page_load=wait_on_page_load, fetcher=get_fetcher())
+        logger.info('Season "%s" - started this crawler', this_season.name)
+        try:
+            crawler.fill_in_season_pagination_links(this_season, checkpoint)
+        finally:
+            crawler.close_browser()
+        logger.info('Season "%s" - closed this crawler', this_season.name)
+        logger.info('Season "%s" - populating all game data via pagination links', this_season.name)
+        scraper = Scraper(wait_on_page_load=wait_on_page_load, fetcher=get_fetcher())
+        logger.info('Season "%s" - started this scraper', this_season.name)
+        try:
+            scraper.populate_games_into_season(this_season, checkpoint)
+        finally:
+            scraper.close_browser()
+        logger.info('Season "%s" - closed this scraper', this_season.name)
+        if use_page_cache or offline:
+            logger.info('Season "%s" - page cache hits so far: %d, misses: %d', this_season.name, get_page_cache().hits, \
+                        get_page_cache().misses)
+        if fetcher_name == 'selenium' and not offline:
+            stats = get_driver_pool().wait_time_stats()
+            logger.info('Season "%s" - browser lease waits: %d leases, mean %.2fs, p95 %.2fs, max %.2fs, %d recycled', \
+                        this_season.name, stats['leases'], stats['mean'], stats['p95'], stats['max'], stats['recycled'])
+            if get_page_readiness() != None:
+                get_page_readiness().log_timing_summary()
+    finally:
+        # joblib's worker processes skip atexit hooks, so quit this process's browsers here
+        close_process_pool()
     return this_season
 
 def main():
-    global logger, data, wait_on_page_load
+    global logger, data, wait_on_page_load, browsers_per_worker, max_pages_per_browser, page_ready_timeout, use_fixed_wait, \
+           fetcher_name, engine_name, max_concurrency, per_host_limit, requests_per_second, use_page_cache, offline, \
+           cache_max_mb, cache_ttl_hours, resume, output_format, browser_profile_name, extraction
     # Instantiate the argument parser
     parser = argparse.ArgumentParser(description='oddsporter v1.0')
     # Declaring all our acceptable arguments below...
     parallel_cpus_desc = 'Number parallel CPUs for processing (default -1 for max available)'
     parser.add_argument('--number-of-cpus', type=int, nargs='?', help=parallel_cpus_desc)
     parser.add_argument('--wait-time-on-page-load', type=int, nargs='?', help='How many seconds to wait on page load (default 3)')
+    parser.add_argument('--fetcher', choices=['selenium', 'http'], nargs='?', help='Load pages with headless Chrome (selenium, default) or plain HTTP requests (http - only the HTML the server sends, no AJAX fragments, so results pages whose table is filled in with JavaScript fail to load)')
+    parser.add_argument('--extraction', choices=['html', 'js'], nargs='?', help='selenium fetcher - parse each page\'s full HTML (html, default) or pull just the table rows out as JSON in the browser (js)')
+    parser.add_argument('--engine', choices=['pages', 'joblib', 'asyncio'], nargs='?', help='Share out every page of every season over parallel processes (pages, default), scrape one season per parallel process (joblib) or fetch every page from one asyncio process over HTTP (asyncio - needs --offline for now)')
+    parser.add_argument('--max-concurrency', type=int, nargs='?', help='asyncio engine - max requests in flight overall (default 32)')
+    parser.add_argument('--per-host-limit', type=int, nargs='?', help='asyncio engine - max requests in flight to one host (default 8)')
+    parser.add_argument('--requests-per-second', type=float, nargs='?', help='asyncio engine - average request rate (default 10)')
+    parser.add_argument('--output-format', choices=['json', 'ndjson', 'ndjson.gz', 'parquet'], nargs='?', help='Write one JSON document per collection at the end (json, default), stream one game per line as each season finishes (ndjson, ndjson.gz) or write each season as a typed Parquet partition (parquet)')
+    parser.add_argument('--resume', action='store_true', help='Skip seasons and pages an interrupted earlier run already completed')
+    parser.add_argument('--no-cache', action='store_true', help='Don\'t read or write the on-disk page cache')
+    parser.add_argument('--offline', action='store_true', help='Replay a run from the page cache alone, without fetching anything')
+    parser.add_argument('--cache-max-mb', type=int, nargs='?', help='Size the page cache is trimmed back to, in MB (default 2048)')
+    parser.add_argument('--cache-ttl-hours', type=float, nargs='?', help='Hours current season pages stay cached (default 12)')
+    parser.add_argument('--page-ready-timeout', type=int, nargs='?', help='Max seconds to wait for a page\'s table to show up before falling back to the page load wait (default 10)')
+    parser.add_argument('--fixed-wait', action='store_true', help='Always sleep the page load wait instead of watching for the table')
+    parser.add_argument('--browser-profile', choices=['lean', 'full'], nargs='?', help='What headless Chrome downloads - only what the results table needs (lean, default) or everything (full)')
+    parser.add_argument('--browsers-per-worker', type=int, nargs='?', help='Warm browsers kept per worker process (default 1)')
+    parser.add_argument('--max-pages-per-browser', type=int, nargs='?', help='Page loads before a browser is recycled (default 250)')
     # Then grab them from the command line input
     # START parsing command line arguments and logging what's happening
     args = parser.parse_args()
@@ -77,6 +206,73 @@ def main():
         logger.info('Received argument --wait-time-on-page-load so will wait %s seconds', str(wait_on_page_load))
     else:
         logger.info('Did not receive argument --wait-time-on-page-load so will use default 3 seconds')
+    if args.fetcher != None:
+        fetcher_name = args.fetcher
+        logger.info('Received argument --fetcher so will load pages with %s', fetcher_name)
+    if args.extraction != None:
+        extraction = args.extraction
+        logger.info('Received argument --extraction so will extract games with %s', extraction)
+    if args.engine != None:
+        engine_name = args.engine
+        logger.info('Received argument --engine so will use the %s engine', engine_name)
+    if engine_name == 'asyncio':
+        if not args.offline:
+            # Over plain HTTP results pages come without their table until AJAX fragments get fetched too
+            raise RuntimeError('The asyncio engine can only replay cached pages for now - re-run it with --offline')
+        if fetcher_name != 'http':
+            fetcher_name = 'http'
+            logger.info('The asyncio engine fetches over plain HTTP so will load pages with http')
+        if args.max_concurrency != None:
+            max_concurrency = args.max_concurrency
+        if args.per_host_limit != None:
+            per_host_limit = args.per_host_limit
+        if args.requests_per_second != None:
+            requests_per_second = args.requests_per_second
+        logger.info('asyncio engine will keep up to %d requests in flight, %d per host, at %s requests/second', \
+                    max_concurrency, per_host_limit, str(requests_per_second))
+    if fetcher_name == 'http' and not args.offline:
+        logger.warning('The http fetcher only reads the HTML the server sends - results pages whose table is '
+                       'filled in with JavaScript will fail to load')
+    if args.output_format != None:
+        output_format = args.output_format
+        logger.info('Received argument --output-format so will write %s output', output_format)
+    if args.resume:
+        resume = True
+        logger.info('Received argument --resume so will pick up from checkpoints in %s', CHECKPOINT_DIRECTORY_PATH)
+    if extraction == 'js' and fetcher_name == 'selenium' and not args.offline and not args.no_cache:
+        # Rows pulled out in the browser never go through the page HTML the cache keeps
+        use_page_cache = False
+        logger.info('js extraction skips the page HTML so will not use the page cache')
+    if args.offline:
+        offline = True
+        logger.info('Received argument --offline so will only read pages from %s', PAGE_CACHE_DIRECTORY_PATH)
+    elif args.no_cache:
+        use_page_cache = False
+        logger.info('Received argument --no-cache so will not use the page cache')
+    if args.cache_max_mb != None:
+        cache_max_mb = args.cache_max_mb
+    if args.cache_ttl_hours != None:
+        cache_ttl_hours = args.cache_ttl_hours
+    if use_page_cache or offline:
+        logger.info('Page cache in %s holds up to %d MB, current season pages for %s hours', \
+                    PAGE_CACHE_DIRECTORY_PATH, cache_max_mb, str(cache_ttl_hours))
+    if args.page_ready_timeout != None:
+        page_ready_timeout = args.page_ready_timeout
+        logger.info('Received argument --page-ready-timeout so will wait up to %s seconds for pages to be ready', str(page_ready_timeout))
+    if args.fixed_wait:
+        use_fixed_wait = True
+        logger.info('Received argument --fixed-wait so will always wait the full page load time')
+    else:
+        logger.info('Page load times are being recorded to %s', PAGE_TIMINGS_FILE)
+    if args.browser_profile != None:
+        browser_profile_name = args.browser_profile
+        logger.info('Received argument --browser-profile so will use the %s browser profile', browser_profile_name)
+    if args.browsers_per_worker != None:
+        browsers_per_worker = args.browsers_per_worker
+        logger.info('Received argument --browsers-per-worker so will keep %s warm browsers', str(browsers_per_worker))
+    if args.max_pages_per_browser != None:
+        max_pages_per_browser = args.max_pages_per_browser
+        logger.info('Received argument --max-pages-per-browser so will recycle after %s pages', str(max_pages_per_browser))
     # END parsing command line arguments and logging what's happening
     logger.info('About to load "target sports"')
     target_sports = get_target_sports_from_file()
@@ -98,8 +294,6 @@ def main():
         logger.info('Will attempt to scrape all sports')
     else:
         logger.info('Only scraping one sport though')
-    crawler = Crawler(wait_on_page_load=wait_on_page_load)
-    logger.info('Crawler for season links has been initialized')
     ran_once = False
     for i, target_sport_obj in enumerate(target_sports):
         if (i + 1) != int(sport_to_do) and int(sport_to_do) != 0:
@@ -108,17 +302,56 @@ def main():
         c_name = target_sport_obj['collection_name']
         logger.info('Starting data collection "%s"', c_name)
         data.start_new_data_collection(target_sport_obj)
+        journal = CheckpointJournal(CHECKPOINT_DIRECTORY_PATH)
+        if not resume:
+            # Fresh run - forget what earlier runs completed
+            journal.clear_collection(c_name)
         main_league_results_url = target_sport_obj['root_url']
+        crawler = Crawler(wait_on_page_load=wait_on_page_load, fetcher=get_fetcher())
+        logger.info('Crawler for season links has been initialized')
         working_seasons = crawler.get_seasons_for_league(main_league_results_url)
         crawler.close_browser()
         logger.info('Crawler for season links has been shut down')
         # Make sure possible outcomes field is set, because the parallel processor needs to know
         for i,_ in enumerate(working_seasons):
             working_seasons[i].possible_outcomes = target_sport_obj['outcomes']
-        # Use parallel processing to scrape games for each season of this league's history
-        working_seasons_w_games = Parallel(n_jobs=max_parallel_cpus)(delayed(scrape_games_for_season)(this_season) for this_season in working_seasons)
+        game_writer = None
+        if output_format != 'json':
+            game_writer = make_game_writer(output_format, OUTPUT_DIRECTORY_PATH, data[c_name])
+        def season_finished(this_season):
+            if game_writer != None:
+                # Write this season out now and let go of its games, so memory stays flat
+                game_writer.write_season(this_season)
+                this_season.games = []
+        if engine_name == 'asyncio':
+            # Fetch every page of every season concurrently from this one process
+            engine = AsyncCrawlEngine(max_concurrency=max_concurrency, per_host_limit=per_host_limit, \
+                                      requests_per_second=requests_per_second, fetcher=get_fetcher())
+            checkpoints = [journal.for_season(c_name, this_season.name) for this_season in working_seasons]
+            working_seasons_w_games = engine.scrape_seasons(working_seasons, checkpoints, season_finished)
+        elif engine_name == 'pages':
+            # Pages of all seasons go out to parallel processes as they are discovered, idle ones take work from busy ones
+            scheduler = WorkStealingScheduler(functools.partial(make_worker_fetcher, get_worker_settings()), \
+                                              num_workers=max_parallel_cpus)
+            checkpoints = [journal.for_season(c_name, this_season.name) for this_season in working_seasons]
+            working_seasons_w_games = scheduler.scrape_seasons(working_seasons, checkpoints, season_finished)
+        else:
+            # Use parallel processing to scrape games for each season of this league's history,
+            # handling each season as soon as its worker returns it
+            working_seasons_w_games = []
+            for this_season in Parallel(n_jobs=max_parallel_cpus, return_as='generator_unordered')(delayed(scrape_games_for_season)(this_season, c_name) for this_season in working_seasons):
+                season_finished(this_season)
+                working_seasons_w_games.append(this_season)
+            # Keep seasons in the order the league lists them
+            season_order = dict((this_season.name, i) for i, this_season in enumerate(working_seasons))
+            working_seasons_w_games.sort(key=lambda this_season: season_order[this_season.name])
+        if game_writer != None:
+            game_writer.close()
+            logger.info('Streamed %d games to %s', game_writer.games_written, game_writer.path)
         data[c_name].league.seasons = working_seasons_w_games
-    if ran_once:
+    if ran_once and output_format != 'json':
+        logger.info('Output was streamed as each season finished')
+    elif ran_once:
         logger.info('Saving output now')
         data.set_output_directory(OUTPUT_DIRECTORY_PATH)
         data.save_all_collections_to_json()
@@ -6,17 +6,36 @@ Odds Portal user predictions scraper
 
 from pyppeteer import launch
 
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+import argparse
 import asyncio
+import json
 import os
+import re
+import time
 
 
 # Constants related to emulating a "real user" in the browser
 USER_AGENT_STRING = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.121 Safari/537.36'
 VIEWPORT_DICT = { 'width' : 1920 , 'height' : 1080 }
+# Tabs open at once in the logged in browser
+DEFAULT_TAB_COUNT = 4
+# Site to scrape - can be pointed at a local stand-in with --base-url
+BASE_URL = 'https://www.oddsportal.com'
+# Cookies and local storage of the last logged in session, readable only by the user running this
+SESSION_FILENAME = 'session.json'
+# Predictions of a run, one JSON object per line, in the run's output directory
+PREDICTIONS_FILENAME = 'predictions.ndjson'
+# Class of the odds cell a user picked in a prediction row
+PICK_CLASS = 'pred-usertip'
+# Class on a row's time cell holding the game's start as a Unix time, like t1552736400-1-1-0-0
+START_TIME_CLASS_PATTERN = re.compile(r'^t(\d+)-')
 
 
 class Prediction():
     def __init__(self):
+        self.user = str()
         self.sport = str()
         self.region = str()
         self.league = str()
@@ -40,25 +59,183 @@ class Prediction():
         s += 'Pick: ' + str(self.pick)
         return s
 
+    def to_dict(self):
+        return {
+            'user' : self.user,
+            'sport' : self.sport,
+            'region' : self.region,
+            'league' : self.league,
+            'start_time' : self.start_time,
+            'game_name' : self.game_name,
+            'game_specifier' : self.game_specifier,
+            'url' : self.url,
+            'odds' : self.odds,
+            'pick' : self.pick,
+        }
 
-async def main():
-    # Set up headless browser and a page within it to work out of
-    browser = await launch()
+
+class PredictionRowParser(HTMLParser):
+    """
+    Reads the inner HTML of a prediction row in one pass - the start time off the time cell, the game's link
+    and name off the participant cell, and the odds off the odds cells, noting which one was picked
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.start_timestamp = None
+        self.start_time_text = str()
+        self.href = None
+        self.game_name = str()
+        self.odds = []
+        self.pick = -1
+        # Kind of cell being read - 'time', 'participant', 'odds' or None for cells we don't need
+        self.cell = None
+        self.cell_text = []
+
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get('class') or '').split()
+        if 'td' == tag:
+            self.end_cell()
+            if 'datet' in classes:
+                self.cell = 'time'
+                for class_name in classes:
+                    match = START_TIME_CLASS_PATTERN.match(class_name)
+                    if match != None:
+                        self.start_timestamp = int(match.group(1))
+            elif 'table-participant' in classes:
+                self.cell = 'participant'
+            elif 'odds-nowrp' in classes:
+                self.cell = 'odds'
+                if PICK_CLASS in classes:
+                    self.pick = len(self.odds)
+        elif 'a' == tag and 'participant' == self.cell and self.href == None:
+            self.href = dict(attrs).get('href')
+
+    def handle_endtag(self, tag):
+        if 'td' == tag:
+            self.end_cell()
+
+    def handle_data(self, data):
+        if self.cell != None:
+            self.cell_text.append(data)
+
+    def close(self):
+        super().close()
+        self.end_cell()
+
+    def end_cell(self):
+        if self.cell == None:
+            return
+        # Collapse whitespace, non-breaking spaces included
+        text = ' '.join(''.join(self.cell_text).split())
+        if 'time' == self.cell:
+            self.start_time_text = text
+        elif 'participant' == self.cell:
+            self.game_name = text
+        elif 'odds' == self.cell:
+            self.odds.append(text)
+        self.cell = None
+        self.cell_text = []
+
+
+def parse_prediction(user, prediction_html):
+    """
+    Fill in a Prediction from the inner HTML of a prediction row
+
+    Returns:
+        (Prediction)
+    """
+    parser = PredictionRowParser()
+    parser.feed(prediction_html)
+    parser.close()
+    prediction = Prediction()
+    prediction.user = user
+    if parser.start_timestamp != None:
+        prediction.start_time = datetime.fromtimestamp(parser.start_timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        prediction.start_time = parser.start_time_text
+    prediction.game_name = parser.game_name
+    if parser.href != None:
+        prediction.url = BASE_URL + parser.href if parser.href.startswith('/') else parser.href
+        # Game links look like /soccer/england/premier-league/team-a-team-b-AbCd1234/ with the bet
+        # predicted on after the # for anything but the default, e.g. #over-under;2;2.50;0
+        path, _, prediction.game_specifier = parser.href.partition('#')
+        path_parts = [part for part in path.split('/') if len(part) > 0]
+        if len(path_parts) >= 4:
+            prediction.sport, prediction.region, prediction.league = path_parts[-4:-1]
+    prediction.odds = parser.odds
+    prediction.pick = parser.pick
+    return prediction
+
+
+def parse_predictions(user, html_list_for_predictions):
+    """
+    Parse all prediction rows scraped for a user at once
+
+    Returns:
+        (list) Predictions
+    """
+    return [parse_prediction(user, prediction_html) for prediction_html in html_list_for_predictions]
+
+
+def write_predictions(predictions, predictions_filename):
+    """
+    Write Predictions to a newline-delimited JSON file, one object per line
+    """
+    with open(predictions_filename, 'w', encoding='utf-8') as predictions_file:
+        for prediction in predictions:
+            predictions_file.write(json.dumps(prediction.to_dict(), ensure_ascii=False) + '\n')
+
+
+async def new_tab(browser):
+    """
+    Open a tab (page) in the browser, set up to look like a real user's
+    """
     page = await browser.newPage()
     await page.setUserAgent(USER_AGENT_STRING)
     await page.setViewport(VIEWPORT_DICT)
-    # Read in Odds Portal username from environment variable ODDS_PORTAL_USERNAME
-    try:
-        username = os.environ['ODDS_PORTAL_USERNAME']
-    except:
-        raise RuntimeError('Could not read environment variable ODDS_PORTAL_USERNAME')
-    # Read in Odds Portal password from environment variable ODDS_PORTAL_PASSWORD
-    try:
-        password = os.environ['ODDS_PORTAL_PASSWORD']
-    except:
-        raise RuntimeError('Could not read environment variable ODDS_PORTAL_PASSWORD')
+    return page
+
+
+class TabPool():
+    """
+    Up to size tabs of one browser, so all share its logged in session. A tab is opened the first time
+    it's needed and then reused, and the semaphore keeps more than size coroutines from holding one at once.
+    """
+    def __init__(self, browser, size=DEFAULT_TAB_COUNT):
+        self.browser = browser
+        self.semaphore = asyncio.Semaphore(size)
+        self.idle_tabs = []
+        self.tabs = []
+
+    async def acquire(self):
+        await self.semaphore.acquire()
+        if len(self.idle_tabs) > 0:
+            return self.idle_tabs.pop()
+        try:
+            tab = await new_tab(self.browser)
+        except:
+            self.semaphore.release()
+            raise
+        self.tabs.append(tab)
+        return tab
+
+    def release(self, tab):
+        self.idle_tabs.append(tab)
+        self.semaphore.release()
+
+    async def close(self):
+        for tab in self.tabs:
+            await tab.close()
+        self.tabs = []
+        self.idle_tabs = []
+
+
+async def log_in(page, username, password):
+    """
+    Log into Odds Portal through the login form, in a tab
+    """
     # Navigate to Odds Portal login page
-    await page.goto('https://www.oddsportal.com/login/')
+    await page.goto(BASE_URL + '/login/')
     # Inject script onto the page so we can leverage jQuery to get unique selectors later on
     await page.evaluate('jQuery.fn.getPath=function(){for(var e,r=this;r.length;){var t=r[0],n=t.localName;if(!n)break;n=n.toLowerCase();var a=r.parent(),h=a.children(n);h.length>1&&(n+=":eq("+h.index(t)+")"),e=n+(e?">"+e:""),r=a}return e};')
     # Get a selector for the username field by running some JavaScript
@@ -85,51 +262,202 @@ async def main():
     if login_button_selector == 'ERROR':
         await page.screenshot({ 'path' : 'assumed_error.png' })
         raise RuntimeError('Encountered issue trying to find login button at login form - see assumed_error.png !')
-    # Log in via that button then wait for redirect(s) to happen
-    await asyncio.wait([
-        await page.click(login_button_selector),
-        await page.waitForNavigation(),
-    ])
+    # Log in via that button, waiting for the redirect(s) it sets off - start waiting before clicking so
+    # a quick navigation can't be missed
+    await asyncio.gather(
+        page.waitForNavigation(),
+        page.click(login_button_selector),
+    )
     # Use JavaScript to assert whether logout button is on page - otherwise assume error
     is_there_logout_button = await page.evaluate('if($(\'li#user-header-logout > a:contains("Logout")\').length<1){"ERROR"}')
     if is_there_logout_button == 'ERROR':
         await page.screenshot({ 'path' : 'assumed_error.png' })
         raise RuntimeError('Could not find logout button after login - see assumed_error.png !')
+
+
+async def is_logged_in(page):
+    """
+    Whether the page in a tab is being shown to a logged in user, going by the logout button in its header
+    """
+    return True == await page.evaluate('document.querySelector("li#user-header-logout > a") !== null')
+
+
+async def save_session(page, session_filename=SESSION_FILENAME):
+    """
+    Save the cookies and local storage of the logged in session in a tab, so later runs can skip the login
+    form. The file is created readable and writable by the owner alone, as the cookies log in as you.
+    """
+    session = {
+        'saved_at' : int(time.time()),
+        'cookies' : await page.cookies(),
+        'local_storage' : await page.evaluate('() => Object.assign({}, window.localStorage)'),
+    }
+    # Create with owner only permissions, and restrict a file left over from before in case it was wider
+    session_fd = os.open(session_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.chmod(session_filename, 0o600)
+    with os.fdopen(session_fd, 'w') as session_file:
+        json.dump(session, session_file)
+
+
+async def restore_session(page, session_filename=SESSION_FILENAME):
+    """
+    Load a saved session into a tab and check it's still logged in - one page load rather than the login form
+
+    Returns:
+        (bool) whether the saved session could be used
+    """
+    if not os.path.exists(session_filename):
+        return False
+    try:
+        with open(session_filename, 'r') as session_file:
+            session = json.load(session_file)
+    except (OSError, ValueError):
+        return False
+    # Cookies are shared by every tab in the browser, local storage by every tab on the site
+    if len(session.get('cookies', [])) > 0:
+        await page.setCookie(*session['cookies'])
+    await page.goto(BASE_URL + '/')
+    await page.evaluate('(items) => { for (var key in items) { window.localStorage.setItem(key, items[key]); } }', \
+                        session.get('local_storage', {}))
+    return await is_logged_in(page)
+
+
+async def get_users_we_are_following(page):
+    """
+    Read who we're following off our profile, in a logged in tab
+
+    Returns:
+        (list) usernames of the users we're following
+    """
     # Get link to user profile with followed users showing
     my_username = await page.evaluate('$("div#user-header-r2 > ul > li#user-header-predictions > a").attr("href")')
     my_username = my_username.replace('/profile/','').replace('/my-predictions/','')
-    my_profile_link = await page.evaluate('https://www.oddsportal.com/profile/' + my_username + '/#following')
+    my_profile_link = BASE_URL + '/profile/' + my_username + '/#following'
     # Navigate to personal profile now
     await page.goto(my_profile_link)
     # Get list of users we're following via JavaScript
     users_we_are_following = await page.evaluate('$("div#profile-following > div > div.item > div.content > a.username").map(function(){return $(this).attr("title");}).get();')
-    for user_we_are_following in users_we_are_following:
-        link_to_users_predictions = 'https://www.oddsportal.com/profile/' + user_we_are_following + '/my-predictions/next/'
-        this_output_folder = 'output/' + user_we_are_following
+    return users_we_are_following
+
+
+async def scrape_predictions_page(tab_pool, user_we_are_following, page_count, screenshot_folder=None):
+    """
+    Load one page of a user's future predictions in a tab from the pool, saving a screenshot of it into
+    screenshot_folder if given - only worth the time when debugging
+
+    Returns:
+        (tuple) inner HTML of each prediction on the page, and whether there's another page
+    """
+    link_to_users_predictions = BASE_URL + '/profile/' + user_we_are_following + '/my-predictions/next/'
+    page = await tab_pool.acquire()
+    try:
         await page.goto(link_to_users_predictions)
-        this_users_predictions = []
-        is_there_another_page = True
-        page_count = 1
-        while True == is_there_another_page:
-            # Use JavaScript to determine if there are any predictions on the page
-            are_there_predictions_on_page = await page.evaluate('$("li.last > strong > span").length>0')
-            if True == are_there_predictions_on_page:
-                # Get inner HTML of each prediction
-                html_list_for_predictions = await page.evaluate('$("table.prediction-table#prediction-table-1 > tbody > tr[xeid]").map(function() { return $(this).html(); }).get();')
-                this_users_predictions += html_list_for_predictions
+        html_list_for_predictions = []
+        # Use JavaScript to determine if there are any predictions on the page
+        are_there_predictions_on_page = await page.evaluate('$("li.last > strong > span").length>0')
+        if True == are_there_predictions_on_page:
+            # Get inner HTML of each prediction
+            html_list_for_predictions = await page.evaluate('$("table.prediction-table#prediction-table-1 > tbody > tr[xeid]").map(function() { return $(this).html(); }).get();')
+        if screenshot_folder != None:
             # Save off image of this after checking if output directory exists
-            if not os.path.exists(this_output_folder):
-                os.makedirs(this_output_folder)
-            page_image_filename = user_we_are_following + '_' + page_count + '.png'
-            await page.screenshot({ 'path' : this_output_folder + '/' + page_image_filename })
-            # Use JavaScript to determine if there's another page
-            is_there_another_page = await page.evaluate('false') # TODO
-            page_count += 1
-        for i, single_prediction in enumerate(this_users_predictions):
-            with open(this_output_folder + '/' + user_we_are_following + '_' + str(i) + '.txt', 'w') as text_file:
-                text_file.write(str(single_prediction))
+            if not os.path.exists(screenshot_folder):
+                os.makedirs(screenshot_folder)
+            page_image_filename = user_we_are_following + '_' + str(page_count) + '.png'
+            await page.screenshot({ 'path' : screenshot_folder + '/' + page_image_filename })
+        # Use JavaScript to determine if there's another page
+        is_there_another_page = await page.evaluate('false') # TODO
+    finally:
+        tab_pool.release(page)
+    return html_list_for_predictions, is_there_another_page
+
+
+async def scrape_user(tab_pool, user_we_are_following, screenshot_folder=None):
+    """
+    Scrape all future predictions of one user we're following. Runs alongside the other users, each page
+    waiting its turn for a tab - once the number of pages can be read off the first one, the rest can be
+    gathered the same way.
+
+    Returns:
+        (list) inner HTML of each of the user's predictions
+    """
+    if screenshot_folder != None:
+        screenshot_folder = screenshot_folder + '/' + user_we_are_following
+    this_users_predictions = []
+    is_there_another_page = True
+    page_count = 1
+    while True == is_there_another_page:
+        html_list_for_predictions, is_there_another_page = await scrape_predictions_page(
+            tab_pool, user_we_are_following, page_count, screenshot_folder)
+        this_users_predictions += html_list_for_predictions
+        page_count += 1
+    return this_users_predictions
+
+
+async def main(tab_count=DEFAULT_TAB_COUNT, use_saved_session=True, take_screenshots=False):
+    # Set up headless browser and a pool of tabs within it to work out of
+    browser = await launch()
+    tab_pool = TabPool(browser, tab_count)
+    # Log in from one tab - the session cookies are shared by every tab in the browser
+    page = await tab_pool.acquire()
+    try:
+        # Pick up the session saved by an earlier run, if it hasn't expired
+        if True == use_saved_session and True == await restore_session(page):
+            print('Reusing the logged in session saved in ' + SESSION_FILENAME)
+        else:
+            # Read in Odds Portal username from environment variable ODDS_PORTAL_USERNAME
+            try:
+                username = os.environ['ODDS_PORTAL_USERNAME']
+            except:
+                raise RuntimeError('Could not read environment variable ODDS_PORTAL_USERNAME')
+            # Read in Odds Portal password from environment variable ODDS_PORTAL_PASSWORD
+            try:
+                password = os.environ['ODDS_PORTAL_PASSWORD']
+            except:
+                raise RuntimeError('Could not read environment variable ODDS_PORTAL_PASSWORD')
+            await log_in(page, username, password)
+            await save_session(page)
+        users_we_are_following = await get_users_we_are_following(page)
+    finally:
+        tab_pool.release(page)
+    if 0 == len(users_we_are_following):
+        print('Not following any users - nothing to scrape')
+        await tab_pool.close()
+        await browser.close()
+        return
+    # Everything from this run goes in a directory named after the time it started
+    run_output_folder = 'output/' + str(int(time.time()))
+    os.makedirs(run_output_folder, exist_ok=True)
+    screenshot_folder = run_output_folder if True == take_screenshots else None
+    # Scrape every user we're following at once, as far as the tab pool allows
+    started_at = time.time()
+    results = await asyncio.gather(*[scrape_user(tab_pool, user_we_are_following, screenshot_folder) \
+                                     for user_we_are_following in users_we_are_following], return_exceptions=True)
+    print('Scraped %d users in %.1f seconds with up to %d tabs' % (len(users_we_are_following), \
+          time.time() - started_at, tab_count))
+    # Parse the predictions of every user in one go, into one file for the run
+    predictions = []
+    for user_we_are_following, result in zip(users_we_are_following, results):
+        if isinstance(result, Exception):
+            print('Could not scrape predictions of ' + user_we_are_following + ' - ' + repr(result))
+        else:
+            predictions += parse_predictions(user_we_are_following, result)
+    predictions_filename = run_output_folder + '/' + PREDICTIONS_FILENAME
+    write_predictions(predictions, predictions_filename)
+    print('Wrote %d predictions to %s' % (len(predictions), predictions_filename))
+    await tab_pool.close()
     await browser.close()
 
 
 if __name__ == '__main__':
-    asyncio.get_event_loop().run_until_complete(main())
+    parser = argparse.ArgumentParser(description='Odds Portal user predictions scraper')
+    parser.add_argument('--tabs', type=int, default=DEFAULT_TAB_COUNT, \
+                        help='Browser tabs to scrape users\' predictions with at once (default %d)' % DEFAULT_TAB_COUNT)
+    parser.add_argument('--fresh-login', action='store_true', \
+                        help='Log in through the login form even if there\'s a saved session (saved again after)')
+    parser.add_argument('--screenshots', action='store_true', \
+                        help='Save a screenshot of every predictions page loaded, for debugging')
+    parser.add_argument('--base-url', default=BASE_URL, \
+                        help='Site to scrape, e.g. a local stand-in for testing (default %s)' % BASE_URL)
+    args = parser.parse_args()
+    BASE_URL = args.base_url.rstrip('/')
+    asyncio.get_event_loop().run_until_complete(main(max(args.tabs, 1), not args.fresh_login, args.screenshots))
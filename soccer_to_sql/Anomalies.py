@@ -0,0 +1,126 @@
+"""
+Hand-checked score overrides for matches whose score can't be scraped, and a
+sink recording the rows that couldn't be turned into matches, so a run never
+stops on one bad row.
+"""
+
+import json
+import os
+import time
+
+OVERRIDES_FILENAME = "score_overrides.json"
+ANOMALIES_FILENAME = "anomalies.ndjson"
+
+
+class ScoreOverrides():
+
+    def __init__(self, overrides_filename=OVERRIDES_FILENAME):
+        """
+        Constructor. Load the overrides file once, indexed by league, start
+        and teams. The file is a JSON list of objects like
+        {"league": "Bundesliga", "start": "13 Mar 2010 16:30",
+        "team1": "Bayern Munich", "team2": "Freiburg", "scores": [2, 1]}.
+
+        Args:
+            overrides_filename (str): Path of the overrides file. No overrides
+                apply if it doesn't exist.
+        """
+
+        self.scores = {}
+        if not os.path.isfile(overrides_filename):
+            return
+        with open(overrides_filename, "r") as overrides_file:
+            for override in json.load(overrides_file):
+                key = (
+                    override["league"], override["start"],
+                    override["team1"], override["team2"]
+                )
+                self.scores[key] = [int(s) for s in override["scores"]]
+
+    def __len__(self):
+        return len(self.scores)
+
+    def get_scores(self, league, start, participants):
+        """
+        Get the override of a match's scores.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+            start (str): Start of the match, e.g. "13 Mar 2010 16:30".
+            participants (list of str): Team 1 and team 2.
+
+        Returns:
+            (list of int) Team 1 and team 2 scores, or None if there is no
+                override for the match.
+        """
+
+        return self.scores.get(
+            (league["league"], start, participants[0], participants[-1])
+        )
+
+
+class AnomalySink():
+
+    def __init__(self, anomalies_filename=ANOMALIES_FILENAME):
+        """
+        Constructor. Anomalies are appended to a newline-delimited JSON file,
+        one object per line, so runs add to what earlier runs recorded.
+
+        Args:
+            anomalies_filename (str): Path of the file.
+        """
+
+        self.anomalies_filename = anomalies_filename
+        self.anomalies_file = None
+        self.count = 0
+
+    def record(self, anomaly):
+        """
+        Append an anomaly.
+
+        Args:
+            anomaly (dict): As from make_anomaly.
+        """
+
+        if self.anomalies_file is None:
+            self.anomalies_file = open(
+                self.anomalies_filename, "a", encoding="utf-8"
+            )
+        self.anomalies_file.write(json.dumps(anomaly, sort_keys=True) + "\n")
+        self.anomalies_file.flush()
+        self.count += 1
+
+    def close(self):
+        """
+        Close the file, if anything was recorded.
+        """
+
+        if self.anomalies_file is not None:
+            self.anomalies_file.close()
+            self.anomalies_file = None
+
+
+def make_anomaly(league, url, row, reason, raw_html=None):
+    """
+    Describe a row that couldn't be turned into a match.
+
+    Args:
+        league (dict): The dict result from parsing a league.json file.
+        url (str): URL the row was scraped from.
+        row (dict): The row, as from RowParser.
+        reason (str): What went wrong.
+        raw_html (str): HTML of the row, where there is any.
+
+    Returns:
+        (dict)
+    """
+
+    return {
+        "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "league": league["league"],
+        "area": league["area"],
+        "url": url,
+        "reason": reason,
+        "row": row,
+        "html": raw_html
+    }
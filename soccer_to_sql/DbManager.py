@@ -6,40 +6,75 @@ import os
 import sqlite3
 
 DB_FILENAME = "oddsportal.db"
+# scrape_state.status of a page whose rows were read
+PAGE_OK = "ok"
+# scrape_state.status of a page that couldn't be loaded or read
+PAGE_FAILED = "failed"
+# scrape_state.status of a page with rows that couldn't be read as matches,
+# tried again on the next run in case a score override now covers them
+PAGE_ANOMALIES = "anomalies"
 
 class DatabaseManager():
 
-    def __init__(self, is_first_run):
+    def __init__(self, is_first_run, full_refresh=False):
         """
-        Constructor.
+        Constructor. Matches and page states are buffered by add_soccer_match
+        and record_page, and written out together, in one transaction, by
+        flush.
 
         Args:
             is_first_run (bool): Is this the first DatabaseManager
                 created in this run?
+            full_refresh (bool): Start from an empty database on the first
+                run, instead of adding to what earlier runs scraped.
         """
 
-        if is_first_run:
+        if is_first_run and full_refresh:
             try:
                 os.remove(DB_FILENAME)
             except OSError:
                 pass
         self.conn = sqlite3.connect(DB_FILENAME)
+        # write-ahead log, synced at checkpoints rather than every commit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
         self.cursor = self.conn.cursor()
+        self.pending_rows = []
+        self.pending_states = []
         if is_first_run:
-            self.cursor.execute('''DROP TABLE IF EXISTS matches''')
-            self.cursor.execute('''CREATE TABLE matches
-                                    (league text, area text,
-                                    retrieved_from_url text, season text,
-                                    start_time integer, end_time integer,
-                                    team1 text, team2 text, team1_score text,
-                                    team2_score text, outcome text,
-                                    team1_odds real, team2_odds real,
-                                    draw_odds real)''')
+            self.cursor.execute("""CREATE TABLE IF NOT EXISTS matches
+                                    (league TEXT, area TEXT,
+                                    retrieved_from_url TEXT, season TEXT,
+                                    start_time INTEGER, end_time INTEGER,
+                                    team1 TEXT, team2 TEXT,
+                                    team1_score INTEGER, team2_score INTEGER,
+                                    outcome TEXT, team1_odds REAL,
+                                    team2_odds REAL, draw_odds REAL)""")
+            self.cursor.execute("""CREATE INDEX IF NOT EXISTS
+                                    matches_league_season_start
+                                    ON matches (league, season, start_time)""")
+            self.cursor.execute("""CREATE INDEX IF NOT EXISTS matches_team1
+                                    ON matches (team1)""")
+            self.cursor.execute("""CREATE INDEX IF NOT EXISTS matches_team2
+                                    ON matches (team2)""")
+            self.cursor.execute("""CREATE INDEX IF NOT EXISTS
+                                    matches_retrieved_from_url
+                                    ON matches (retrieved_from_url)""")
+            # one row per results page, as of the last time it was fetched
+            self.cursor.execute("""CREATE TABLE IF NOT EXISTS scrape_state
+                                    (url TEXT PRIMARY KEY, season_url TEXT,
+                                    league TEXT, fetched_at REAL,
+                                    content_hash TEXT, row_count INTEGER,
+                                    last_page INTEGER, status TEXT)""")
+            self.cursor.execute("""CREATE INDEX IF NOT EXISTS
+                                    scrape_state_season_url
+                                    ON scrape_state (season_url)""")
             self.conn.commit()
 
     def add_soccer_match(self, league, retrieved_from_url, match):
         """
-        Insert a soccer match entry into the database.
+        Queue a soccer match entry to be inserted into the database on the
+        next flush.
 
         Args:
             league (dict): The dict result from parsing a league.json file.
@@ -49,27 +84,138 @@ class DatabaseManager():
             match (object): The SoccerMatch to insert into the database.
         """
 
-        sql_str = "INSERT INTO matches VALUES ('"
-        sql_str += league["league"] + "', '"
-        sql_str += league["area"] + "', '"
-        sql_str += retrieved_from_url + "', '"
-        sql_str += str(match.get_season()) + "', "
-        sql_str += str(match.get_start_time_unix_int()) + ", "
-        sql_str += str(match.get_end_time_unix_int()) + ", '"
-        sql_str += match.get_team1_string() + "', '"
-        sql_str += match.get_team2_string() + "', '"
-        sql_str += str(match.get_team1_score()) + "', '"
-        sql_str += str(match.get_team2_score()) + "', '"
-        sql_str += match.get_outcome_string() + "', '"
-        sql_str += str(match.get_team1_odds()) + "', '"
-        sql_str += str(match.get_team2_odds()) + "', '"
-        sql_str += str(match.get_draw_odds()) + "')"
-        self.cursor.execute(sql_str)
-        self.conn.commit()
+        self.pending_rows.append((
+            league["league"], league["area"], retrieved_from_url,
+            str(match.get_season()), match.get_start_time_unix_int(),
+            match.get_end_time_unix_int(), match.get_team1_string(),
+            match.get_team2_string(), to_int(match.get_team1_score()),
+            to_int(match.get_team2_score()), match.get_outcome_string(),
+            to_float(match.get_team1_odds()), to_float(match.get_team2_odds()),
+            to_float(match.get_draw_odds())
+        ))
+
+    def record_page(self, page_state, replace_matches):
+        """
+        Queue the scrape state of a results page to be saved on the next
+        flush.
+
+        Args:
+            page_state (dict): The page's scrape_state columns - url,
+                season_url, league, fetched_at, content_hash, row_count,
+                last_page and status.
+
+            replace_matches (bool): Delete the matches an earlier run
+                inserted from this page, as it has been scraped again.
+        """
+
+        self.pending_states.append((page_state, replace_matches))
+
+    def flush(self):
+        """
+        Replace the matches of re-scraped pages, insert all queued matches and
+        save the queued page states, in a single transaction.
+
+        Returns:
+            (int) Number of matches inserted.
+        """
+
+        if len(self.pending_rows) == 0 and len(self.pending_states) == 0:
+            return 0
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM matches WHERE retrieved_from_url = ?",
+                [
+                    (page_state["url"],)
+                    for page_state, replace_matches in self.pending_states
+                    if replace_matches
+                ]
+            )
+            self.conn.executemany(
+                "INSERT INTO matches VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self.pending_rows
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scrape_state VALUES "
+                "(:url, :season_url, :league, :fetched_at, :content_hash, "
+                ":row_count, :last_page, :status)",
+                [page_state for page_state, _ in self.pending_states]
+            )
+        inserted = len(self.pending_rows)
+        self.pending_rows = []
+        self.pending_states = []
+        return inserted
 
     def __del__(self):
         """
-        Destructor.
+        Destructor. Write out anything still queued.
         """
 
+        self.flush()
         self.conn.close()
+
+
+def get_season_scrape_state(season_url):
+    """
+    Get what earlier runs recorded about the pages of a season. Only reads
+    the database, so it is safe alongside the process writing it.
+
+    Args:
+        season_url (str): Results URL of the season.
+
+    Returns:
+        (dict) scrape_state row, as a dict, of each page URL of the season
+            that was fetched before.
+    """
+
+    if not os.path.isfile(DB_FILENAME):
+        return {}
+    try:
+        conn = sqlite3.connect("file:" + DB_FILENAME + "?mode=ro", uri=True)
+    except sqlite3.Error:
+        return {}
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(
+            "SELECT * FROM scrape_state WHERE season_url = ?", (season_url,)
+        ).fetchall()
+    except sqlite3.Error:
+        # e.g. the writer hasn't created the table yet
+        return {}
+    finally:
+        conn.close()
+    return dict((row["url"], dict(row)) for row in rows)
+
+
+def to_int(value):
+    """
+    Convert a scraped value to an integer column value.
+
+    Args:
+        value (obj): Value to convert.
+
+    Returns:
+        (int) The value, or None if it isn't a number.
+    """
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(value):
+    """
+    Convert scraped odds to a real column value.
+
+    Args:
+        value (obj): Value to convert, e.g. "1.85" or "-".
+
+    Returns:
+        (float) The value, or None if it isn't a number.
+    """
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
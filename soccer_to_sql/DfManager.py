@@ -1,16 +1,226 @@
 """
 Manager class to handle pandas dataframe.
 """
+import os
 import pandas as pd
-from typing import Optional
+import pyarrow as pa
+import pyarrow.dataset as ds
+import re
+from typing import List
 
 DF_FILENAME = "df_oddsportal.parquet"
+DATASET_DIRNAME = "oddsportal_dataset"
+# one directory level each, league=<league>/season=<season>
+PARTITION_COLUMNS = ["league", "season"]
+ROWS_PER_GROUP = 10000
+PAGE_NUMBER_REGEX = re.compile(r"#/page/(\d+)/?")
+
+COLUMNS = [
+    'league',
+    'area',
+    'retrieved_from_url',
+    'season',
+    'start_time',
+    'end_time',
+    'team1',
+    'team2',
+    'team1_score',
+    'team2_score',
+    'outcome',
+    'team1_odds',
+    'team2_odds',
+    'draw_odds'
+]
+DTYPES = {
+    'league': 'category',
+    'area': 'category',
+    'retrieved_from_url': 'object',
+    'season': 'category',
+    'start_time': 'int64',
+    'end_time': 'int64',
+    'team1': 'category',
+    'team2': 'category',
+    'team1_score': 'Int16',
+    'team2_score': 'Int16',
+    'outcome': 'category',
+    'team1_odds': 'float64',
+    'team2_odds': 'float64',
+    'draw_odds': 'float64'
+}
+ARROW_TYPES = {
+    'category': pa.dictionary(pa.int32(), pa.string()),
+    'object': pa.string(),
+    'int64': pa.int64(),
+    'Int16': pa.int16(),
+    'float64': pa.float64()
+}
+# fixed, so every partition file has the same schema whatever its categories
+DATASET_SCHEMA = pa.schema(
+    [(column, ARROW_TYPES[DTYPES[column]]) for column in COLUMNS]
+)
+
+
+class MatchRowBuffer():
+
+    def __init__(self):
+        """
+        Constructor. Collects matches column by column, so a DataFrame is
+        only built once all of them are in.
+        """
+
+        self.columns = dict((column, []) for column in COLUMNS)
+
+    def __len__(self):
+        return len(self.columns['league'])
+
+    def append(self, row):
+        """
+        Add one match.
+
+        Args:
+            row (tuple): Values in COLUMNS order.
+        """
+
+        for column, value in zip(COLUMNS, row):
+            self.columns[column].append(value)
+
+    def to_dataframe(self):
+        """
+        Build a DataFrame of every match added, typed per DTYPES.
+
+        Returns:
+            (pd.DataFrame)
+        """
+
+        return pd.DataFrame(self.columns, columns=COLUMNS).astype(DTYPES)
+
+
+def to_score(value):
+    """
+    Convert a scraped score to a score column value.
+
+    Args:
+        value (obj): Value to convert.
+
+    Returns:
+        (int) The score, or None if it isn't a number.
+    """
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_odds(value):
+    """
+    Convert scraped odds to an odds column value.
+
+    Args:
+        value (obj): Value to convert, e.g. "1.85" or "-".
+
+    Returns:
+        (float) The odds, or NaN if there were none.
+    """
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def season_key(season_url):
+    """
+    Get the season partition value from the results URL of a season.
+
+    Args:
+        season_url (str): E.g. ".../premier-league-2015-2016/results/".
+
+    Returns:
+        (str) E.g. "2015-2016", or "current" for the current season's URL.
+    """
+
+    segments = [segment for segment in season_url.split("/") if segment]
+    if "results" in segments:
+        segments = segments[:segments.index("results")]
+    if len(segments) > 0:
+        found = re.search(r"(\d{4}(?:-\d{4})?)$", segments[-1])
+        if found is not None:
+            return found.group(1)
+    return "current"
+
+
+def read_dataset(columns=None, filters=None):
+    """
+    Load matches back from the partitioned dataset, reading only the
+    partitions and columns asked for.
+
+    Args:
+        columns (list of str): Columns to load, or None for all of them.
+        filters (list of tuple): Row filters, e.g.
+            [("league", "==", "Premier League"), ("season", "in", ["2015-2016"])].
+            Filters on league and season skip whole partitions.
+
+    Returns:
+        (pd.DataFrame)
+    """
+
+    return pd.read_parquet(
+        DATASET_DIRNAME, engine="pyarrow", columns=columns, filters=filters
+    )
+
+
+def delete_partition(league_name, season):
+    """
+    Delete the dataset files of one league and season.
+
+    Args:
+        league_name (str): League partition value.
+        season (str): Season partition value, as from season_key.
+    """
+
+    try:
+        dataset = ds.dataset(
+            DATASET_DIRNAME, format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([(column, pa.string()) for column in PARTITION_COLUMNS]),
+                flavor="hive"
+            )
+        )
+    except (FileNotFoundError, pa.ArrowInvalid):
+        # nothing written yet
+        return
+    partition_filter = (ds.field("league") == league_name) & (
+        ds.field("season") == season
+    )
+    for fragment in dataset.get_fragments(filter=partition_filter):
+        os.remove(fragment.path)
+        try:
+            # the partition's directories, as far up as they are left empty
+            os.removedirs(os.path.dirname(fragment.path))
+        except OSError:
+            pass
+
+
+def page_number(url):
+    """
+    Get the page number of a results page URL.
+
+    Args:
+        url (str): E.g. ".../results/#/page/3/".
+
+    Returns:
+        (int) The page number, 1 for a URL without one.
+    """
+
+    found = PAGE_NUMBER_REGEX.search(url)
+    return int(found.group(1)) if found is not None else 1
+
 
 class DataframeManager():
 
-    # create cache
-    _df_store: Optional[pd.DataFrame] = None
-    # create method to delete cache
+    # DataFrames of the leagues scraped so far in this run
+    _kept_dfs: List[pd.DataFrame] = []
 
     def __init__(self, is_first_run):
         """
@@ -23,24 +233,19 @@ class DataframeManager():
 
         if is_first_run:
             self.clear_kept_datasets()
-            self.df = pd.DataFrame(columns=[
-                'league',
-                'area',
-                'retrieved_from_url',
-                'season',
-                'start_time',
-                'end_time',
-                'team1',
-                'team2',
-                'team1_score',
-                'team2_score',
-                'outcome',
-                'team1_odds',
-                'team2_odds',
-                'draw_odds'
-            ])
-        else:
-            self.recover_kept_datasets()
+        self.rows = MatchRowBuffer()
+        self._df = None
+
+    @property
+    def df(self):
+        """
+        DataFrame of the matches added to this manager, built on first use
+        after a match is added.
+        """
+
+        if self._df is None:
+            self._df = self.rows.to_dataframe()
+        return self._df
 
     def add_soccer_match(self, league, retrieved_from_url, match):
         """
@@ -54,25 +259,23 @@ class DataframeManager():
             match (object): The SoccerMatch to insert into the Dataframe.
         """
 
-        self.df = self.df.append(
-            {
-                'league': league["league"],
-                'area': league["area"],
-                'retrieved_from_url': retrieved_from_url,
-                'season': match.get_season(),
-                'start_time': match.get_start_time_unix_int(),
-                'end_time': match.get_end_time_unix_int(),
-                'team1': match.get_team1_string(),
-                'team2': match.get_team2_string(),
-                'team1_score': match.get_team1_score(),
-                'team2_score': match.get_team2_score(),
-                'outcome': match.get_outcome_string(),
-                'team1_odds': match.get_team1_odds(),
-                'team2_odds': match.get_team2_odds(),
-                'draw_odds': match.get_draw_odds(),
-            },
-            ignore_index=True
-        )
+        self.rows.append((
+            league["league"],
+            league["area"],
+            retrieved_from_url,
+            match.get_season(),
+            match.get_start_time_unix_int(),
+            match.get_end_time_unix_int(),
+            match.get_team1_string(),
+            match.get_team2_string(),
+            to_score(match.get_team1_score()),
+            to_score(match.get_team2_score()),
+            match.get_outcome_string(),
+            to_odds(match.get_team1_odds()),
+            to_odds(match.get_team2_odds()),
+            to_odds(match.get_draw_odds())
+        ))
+        self._df = None
 
     def save_current_df_as_parquet(self):
         """
@@ -81,53 +284,136 @@ class DataframeManager():
 
         self.df.to_parquet(DF_FILENAME)
 
+    def write_season(self, league_name, season_url, merge=False,
+                     replaced_urls=(), last_page=None):
+        """
+        Write the matches added since the last write as the dataset partition
+        of their league and season, replacing whatever that partition held,
+        then let go of them. A partition left with no matches is deleted.
+
+        Args:
+            league_name (str): League the matches are from.
+            season_url (str): Results URL the season was scraped from.
+            merge (bool): Only replace the partition's matches from the pages
+                just scraped, keeping those of other pages.
+            replaced_urls (list of str): Pages whose matches from earlier runs
+                were replaced, even where they now have none.
+            last_page (int): Last page number of the season, where known -
+                matches kept from pages past it are dropped.
+
+        Returns:
+            (int) Number of matches written.
+        """
+
+        df = self.df
+        written = len(df)
+        self.rows = MatchRowBuffer()
+        self._df = None
+        if written == 0 and len(replaced_urls) == 0:
+            # nothing changed
+            return 0
+        season = season_key(season_url)
+        df = df.assign(season=season)
+        if merge:
+            df = self.merge_with_partition(
+                df, league_name, season, replaced_urls, last_page
+            )
+        if len(df) == 0:
+            delete_partition(league_name, season)
+            return written
+        table = pa.Table.from_pandas(
+            df, schema=DATASET_SCHEMA, preserve_index=False
+        )
+        ds.write_dataset(
+            table, DATASET_DIRNAME, format="parquet",
+            partitioning=PARTITION_COLUMNS, partitioning_flavor="hive",
+            existing_data_behavior="delete_matching",
+            basename_template="part-{i}.parquet",
+            max_rows_per_group=ROWS_PER_GROUP,
+            file_options=ds.ParquetFileFormat().make_write_options(
+                compression="zstd"
+            )
+        )
+        return written
+
     def save_cached_df_as_parquet(self):
         """Save cached dataframe locally as parquet file."""
         print("Storing cached dataset for further use")
-        if not isinstance(DataframeManager._df_store, pd.DataFrame):
+        if len(DataframeManager._kept_dfs) == 0:
             print(
                 "Cannot store cached dataset because it is empty or was never"
                 " kept"
             )
-            self.df = None
             raise Exception(
                 "Cannot store cached dataset because it is empty or was never"
                 " kept"
             )
-        DataframeManager._df_store.to_parquet(DF_FILENAME)
+        self.get_kept_datasets().to_parquet(DF_FILENAME)
 
-    def keep_dataset(self):
-        """Concat current df to the df in DataframeManager's cache."""
+    def merge_with_partition(self, df, league_name, season, replaced_urls=(),
+                             last_page=None):
+        """
+        Add the matches already in a season's dataset partition that didn't
+        come from a page in df or a replaced page. The current season always
+        has the "current" partition, so after a rollover it still holds last
+        season's pages - those past the new last page are dropped, the rest
+        get replaced as they are scraped.
 
-        if DataframeManager._df_store is None:
-            DataframeManager._df_store = self.df.copy()
-        else:
-            DataframeManager._df_store = pd.concat(
-                [DataframeManager._df_store, self.df], ignore_index=True
-            )
+        Args:
+            df (pd.DataFrame): Matches of one league and season.
+            league_name (str): League partition value.
+            season (str): Season partition value.
+            replaced_urls (list of str): Pages whose kept matches are dropped.
+            last_page (int): Last page number of the season, or None.
 
-    def recover_kept_datasets(self):
-        """Overwrite df in DataframeManager class with the df in cache."""
-        print("Storing current dataset for further use")
-        if not isinstance(DataframeManager._df_store, pd.DataFrame):
-            print(
-                "Cannot recover dataset because it is empty or was never kept"
-            )
-            self.df = None
-            raise Exception(
-                "Cannot recover dataset because it is empty or was never kept"
-            )
-        print(
-            "Overwriting dataset with kept datasets. "
-            f"Now dataset has {len(DataframeManager._df_store)} rows"
+        Returns:
+            (pd.DataFrame)
+        """
+
+        try:
+            kept_df = read_dataset(filters=[
+                ("league", "==", league_name),
+                ("season", "==", season)
+            ])
+        except (FileNotFoundError, pa.ArrowInvalid):
+            # nothing written yet
+            return df
+        is_kept = ~kept_df["retrieved_from_url"].isin(
+            set(df["retrieved_from_url"]) | set(replaced_urls)
         )
-        self.df = DataframeManager._df_store.copy()
+        if last_page is not None:
+            is_kept &= kept_df["retrieved_from_url"].map(page_number) <= last_page
+        kept_df = kept_df[is_kept]
+        if len(kept_df) == 0:
+            return df
+        # partition columns come back as categories of their own
+        kept_df = kept_df.astype({"league": "object", "season": "object"})
+        return pd.concat(
+            [kept_df[COLUMNS], df.astype({"season": "object"})],
+            ignore_index=True
+        ).astype(DTYPES)
+
+    def keep_dataset(self):
+        """Keep the current df with the leagues already kept this run."""
+
+        DataframeManager._kept_dfs.append(self.df)
+        # the rows live on in the kept DataFrame
+        self.rows = MatchRowBuffer()
+
+    def get_kept_datasets(self):
+        """
+        Combine the DataFrames of every league kept this run, in one go.
+
+        Returns:
+            (pd.DataFrame)
+        """
+
+        # categories differ between leagues, so type the result again
+        return pd.concat(
+            DataframeManager._kept_dfs, ignore_index=True
+        ).astype(DTYPES)
 
     def clear_kept_datasets(self):
         """Clear datasets kept in the object's memory."""
         print("Clear kept dataset")
-        if isinstance(DataframeManager._df_store, pd.DataFrame):
-            DataframeManager._df_store.drop(
-                DataframeManager._df_store.index, inplace=True
-            )
-        DataframeManager._df_store = None
+        DataframeManager._kept_dfs = []
@@ -0,0 +1,507 @@
+"""
+Ways of getting the tournament table of a results page - through a Selenium
+driven browser, or straight over HTTP without a browser.
+"""
+
+from bs4 import BeautifulSoup
+import re
+import time
+import urllib3
+from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+
+CHROMEDRIVER_PATH = "/usr/local/bin/chromedriver"
+USER_AGENT_STRING = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/72.0.3626.121 Safari/537.36"
+)
+PAGE_NUMBER_REGEX = re.compile(r"#/page/(\d+)/?")
+PAGE_FRAGMENT_REGEX = re.compile(r"#/page/(\d+)/?$")
+NO_DATA_SELECTOR = "div.message-info > ul > li > div.cms"
+NO_DATA_TEXT = "No data available"
+
+# Browser profiles - "lean" only loads what the tournament table needs,
+# "full" loads everything
+BROWSER_PROFILES = ["lean", "full"]
+LEAN_RESOURCE_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.css",
+    "*.mp4", "*.webm", "*.mp3"
+]
+LEAN_BLOCKED_HOSTS = [
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com",
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com",
+    "adservice.google.com", "facebook.net", "facebook.com", "twitter.com",
+    "scorecardresearch.com", "quantserve.com", "criteo.com", "criteo.net",
+    "adnxs.com", "amazon-adsystem.com", "taboola.com", "outbrain.com",
+    "hotjar.com", "cookielaw.org", "onetrust.com"
+]
+# Scripts from these build the tournament table, so they are never blocked
+LEAN_ALLOWED_HOSTS = ["oddsportal.com"]
+
+# Run in the page to send back just the date and match rows of the
+# tournament table, in the same shape RowParser builds from HTML
+TOURNAMENT_TABLE_ROWS_SCRIPT = """
+return (function () {
+    var table = document.getElementById("tournamentTable");
+    if (table === null) {
+        return null;
+    }
+    // Same as BeautifulSoup's .string - text of a lone descendant, else null
+    function string(node) {
+        while (node.nodeType === 1) {
+            if (node.childNodes.length !== 1) {
+                return null;
+            }
+            node = node.firstChild;
+        }
+        return node.nodeValue;
+    }
+    function find(element, className) {
+        return element.querySelector("." + className);
+    }
+    var rows = [];
+    table.querySelectorAll("tr").forEach(function (tr) {
+        var datet = find(tr, "datet");
+        if (tr.classList.contains("center") && tr.classList.contains("nob-border")) {
+            rows.push({date: datet !== null ? string(datet) : null});
+        } else if (tr.classList.contains("deactivate") && tr.hasAttribute("xeid")) {
+            var participant = find(tr, "table-participant");
+            var first = participant !== null ? participant.firstChild : null;
+            var score = find(tr, "table-score");
+            rows.push({
+                time: datet !== null ? string(datet) : null,
+                participants: participant !== null ? participant.textContent : null,
+                href: first !== null && first.nodeType === 1 ? first.getAttribute("href") : null,
+                score: score !== null ? string(score) : null,
+                odds: Array.prototype.map.call(
+                    tr.querySelectorAll(".odds-nowrp"),
+                    function (cell) { return cell.textContent; }
+                )
+            });
+        }
+    });
+    return rows;
+})();
+"""
+# Run in the page to read the last page number off its pagination bar
+LAST_PAGE_NUMBER_SCRIPT = """
+return (function () {
+    var last = 1;
+    document.querySelectorAll("#pagination a[x-page]").forEach(function (link) {
+        var page = parseInt(link.getAttribute("x-page"), 10);
+        if (page > last) {
+            last = page;
+        }
+    });
+    return last;
+})();
+"""
+
+
+def lean_blocked_url_patterns(allowed_hosts=LEAN_ALLOWED_HOSTS):
+    """
+    URL patterns the lean browser profile blocks.
+
+    Args:
+        allowed_hosts (list): Hosts never blocked, with their subdomains.
+
+    Returns:
+        (list) Wildcard URL patterns for Network.setBlockedURLs.
+    """
+
+    patterns = []
+    for pattern in LEAN_RESOURCE_URL_PATTERNS:
+        # versioned assets too, e.g. styles.css?v=123
+        patterns.extend([pattern, pattern + "?*"])
+    for host in LEAN_BLOCKED_HOSTS:
+        if any(
+            host == allowed or host.endswith("." + allowed)
+            for allowed in allowed_hosts
+        ):
+            continue
+        patterns.extend(["*://" + host + "/*", "*://*." + host + "/*"])
+    return patterns
+
+
+def make_chrome_options(browser_profile):
+    """
+    Chrome options for a browser profile.
+
+    Args:
+        browser_profile (str): "lean" or "full".
+
+    Returns:
+        (webdriver.ChromeOptions)
+    """
+
+    if browser_profile not in BROWSER_PROFILES:
+        raise ValueError("Unknown browser profile: " + str(browser_profile))
+    options = webdriver.ChromeOptions()
+    if browser_profile == "lean":
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.default_content_setting_values.notifications": 2
+        })
+        for argument in [
+            "--blink-settings=imagesEnabled=false", "--disable-extensions",
+            "--disable-gpu", "--mute-audio",
+            "--disable-background-networking", "--disk-cache-size=1"
+        ]:
+            options.add_argument(argument)
+    return options
+
+
+class Fetcher():
+    """
+    Interface used by the Scraper to load results pages.
+    """
+
+    # whether the page last loaded showed its tournament table - False when
+    # waiting for it timed out, so it may be incomplete and isn't cached
+    last_page_ready = True
+
+    def get_tournament_table_html(self, url):
+        """
+        Load a results page and get the inner HTML of its tournament table.
+
+        Args:
+            url (str): URL of the results page.
+
+        Returns:
+            (str) Inner HTML of the tournament table, or None if there is none.
+        """
+
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Release anything held by this fetcher.
+        """
+
+        pass
+
+    def print_page_load_times(self):
+        """
+        Print a summary of how long pages took, where that is tracked.
+        """
+
+        pass
+
+    def get_tournament_table_rows(self, url):
+        """
+        Load a results page and pull the date and match rows out of its
+        tournament table in the browser, instead of sending back its HTML.
+
+        Args:
+            url (str): URL of the results page.
+
+        Returns:
+            (list of dict) Rows, as from TOURNAMENT_TABLE_ROWS_SCRIPT, or None
+                if there is no tournament table.
+        """
+
+        raise NotImplementedError()
+
+    def get_last_page_number(self):
+        """
+        Read the last page number off the pagination bar of the page last
+        loaded by get_tournament_table_rows.
+
+        Returns:
+            (int) Last page number, 1 if there is no pagination bar.
+        """
+
+        raise NotImplementedError()
+
+
+class SeleniumFetcher(Fetcher):
+
+    def __init__(self, page_ready_timeout=10, fallback_delay=5,
+                 browser_profile="lean"):
+        """
+        Constructor. Launch the web driver browser.
+
+        Args:
+            page_ready_timeout (int): Max seconds to wait for the tournament
+                table of a page to show up.
+            fallback_delay (int): Seconds to sleep when the table does not
+                show up within page_ready_timeout.
+            browser_profile (str): "lean" to skip images, fonts, stylesheets,
+                ads and trackers, or "full" to load everything.
+        """
+
+        self.browser = webdriver.Chrome(
+            CHROMEDRIVER_PATH,
+            chrome_options=make_chrome_options(browser_profile)
+        )
+        if browser_profile == "lean":
+            self.block_urls(lean_blocked_url_patterns())
+        self.page_ready_timeout = page_ready_timeout
+        self.fallback_delay = fallback_delay
+        self.page_load_times = []
+
+    def block_urls(self, patterns):
+        """
+        Stop the browser from requesting URLs matching any of the patterns.
+
+        Args:
+            patterns (list): Wildcard URL patterns.
+        """
+
+        try:
+            self.browser.execute_cdp_cmd("Network.enable", {})
+            self.browser.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": patterns}
+            )
+        except (AttributeError, WebDriverException):
+            # selenium before 3.14 or a chromedriver without DevTools
+            # commands - the Chrome prefs still apply, and they only block
+            # images
+            print("Could not block URLs through DevTools, only images are "
+                  "blocked")
+
+    def load_page(self, url):
+        """
+        Navigate to a results page and wait for its tournament table.
+
+        Args:
+            url (str): URL of the results page.
+
+        Returns:
+            (bool) Whether the page loaded - False where the browser failed or
+                timed out, so the page gets skipped rather than stopping the
+                league.
+        """
+
+        started_at = time.time()
+        self.last_page_ready = False
+        try:
+            self.browser.get(url)
+            # waiting for table to load
+            # needed or else the data won't be complete
+            self.last_page_ready = self.wait_for_tournament_table(
+                url, started_at
+            )
+        except WebDriverException as e:
+            # TimeoutException included
+            print(f"Could not load {url}: {e.__class__.__name__}")
+            return False
+        return True
+
+    def get_tournament_table_html(self, url):
+        if not self.load_page(url):
+            return None
+        try:
+            tournament_tbl = self.browser.find_element_by_id("tournamentTable")
+            return tournament_tbl.get_attribute("innerHTML")
+        except NoSuchElementException:
+            return None
+        except WebDriverException as e:
+            print(f"Could not read the tournament table of {url}: "
+                  f"{e.__class__.__name__}")
+            return None
+
+    def get_tournament_table_rows(self, url):
+        if not self.load_page(url):
+            return None
+        try:
+            return self.browser.execute_script(TOURNAMENT_TABLE_ROWS_SCRIPT)
+        except WebDriverException as e:
+            print(f"Could not read the tournament table of {url}: "
+                  f"{e.__class__.__name__}")
+            return None
+
+    def get_last_page_number(self):
+        return self.browser.execute_script(LAST_PAGE_NUMBER_SCRIPT)
+
+    def close(self):
+        self.browser.quit()
+
+    def wait_for_tournament_table(self, url, started_at):
+        """
+        Wait until the tournament table for the requested page has rows,
+        falling back to a fixed sleep when it doesn't show up in time. Records
+        how long the page took in page_load_times.
+
+        Args:
+            url (str): URL that was just navigated to.
+            started_at (float): Time the navigation started.
+
+        Returns:
+            (bool) Whether the table showed up before the timeout.
+        """
+
+        page_match = PAGE_NUMBER_REGEX.search(url)
+        expected_page = page_match.group(1) if page_match else None
+
+        def is_table_ready(browser):
+            # "No data available", e.g. past the last page - other info
+            # messages can show before the table arrives
+            if any(
+                message.text.strip() == NO_DATA_TEXT
+                for message in browser.find_elements_by_css_selector(
+                    NO_DATA_SELECTOR
+                )
+            ):
+                return True
+            rows = browser.find_elements_by_css_selector(
+                "table#tournamentTable tr"
+            )
+            if len(rows) == 0:
+                return False
+            if expected_page is None or expected_page == "1":
+                return True
+            # the table is swapped in via AJAX, make sure it's the right page
+            active_pages = browser.find_elements_by_css_selector(
+                "div#pagination span.active-page"
+            )
+            return any(
+                active_page.text.strip() == expected_page
+                for active_page in active_pages
+            )
+
+        try:
+            WebDriverWait(
+                self.browser, self.page_ready_timeout, poll_frequency=0.1
+            ).until(is_table_ready)
+            is_ready = True
+        except TimeoutException:
+            time.sleep(self.fallback_delay)
+            is_ready = False
+        self.page_load_times.append((url, time.time() - started_at, is_ready))
+        return is_ready
+
+    def print_page_load_times(self):
+        if len(self.page_load_times) == 0:
+            return
+        seconds = sorted(t[1] for t in self.page_load_times)
+        fallbacks = len([t for t in self.page_load_times if t[2] is False])
+        print(
+            f"Page load times over {len(seconds)} pages: "
+            f"mean {sum(seconds) / len(seconds):.2f}s, "
+            f"p50 {seconds[len(seconds) // 2]:.2f}s, "
+            f"p95 {seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))]:.2f}s, "
+            f"max {seconds[-1]:.2f}s, {fallbacks} fallbacks"
+        )
+
+
+class HttpFetcher(Fetcher):
+
+    def __init__(self, timeout=10, maxsize=10):
+        """
+        Constructor. Set up a pooled HTTP client - no browser involved. This
+        only works where the server sends the tournament table in the page
+        HTML - the AJAX fragments Odds Portal results pages fill their table
+        in from are not fetched, so on those it finds no tournament table.
+
+        Args:
+            timeout (int): Seconds before a request is given up on.
+            maxsize (int): Max connections kept open per host.
+        """
+
+        retries = urllib3.util.Retry(
+            total=2, backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504]
+        )
+        self.http = urllib3.PoolManager(
+            maxsize=maxsize, block=True, retries=retries
+        )
+        self.timeout = timeout
+
+    def fetch(self, url):
+        """
+        Get the HTML at a URL. The "#/page/N/" fragment of pagination URLs
+        never reaches the server, so the ".../page/N/" path form is requested
+        instead.
+
+        Args:
+            url (str): URL to fetch.
+
+        Returns:
+            (str) HTML at the URL, or None if it couldn't be retrieved.
+        """
+
+        request_url = PAGE_FRAGMENT_REGEX.sub(r"page/\1/", url)
+        try:
+            response = self.http.request(
+                "GET", request_url, timeout=self.timeout,
+                headers={"User-Agent": USER_AGENT_STRING, "Referer": url}
+            )
+        except urllib3.exceptions.HTTPError as e:
+            print(f"HTTP request failed for {url}: {e}")
+            return None
+        if response.status != 200:
+            print(f"Got HTTP status {response.status} for {url}")
+            return None
+        return response.data.decode("utf-8", errors="replace")
+
+    def get_tournament_table_html(self, url):
+        html = self.fetch(url)
+        if html is None:
+            return None
+        tournament_tbl = BeautifulSoup(html, "lxml").find(id="tournamentTable")
+        if tournament_tbl is None:
+            return None
+        return tournament_tbl.decode_contents()
+
+    def close(self):
+        self.http.clear()
+
+
+class CachingFetcher(Fetcher):
+
+    def __init__(self, cache, fetcher=None, offline=False):
+        """
+        Constructor. Serve tournament tables from a PageCache, going to the
+        wrapped fetcher only on a miss.
+
+        Args:
+            cache (PageCache): Cache to read from and write to.
+            fetcher (Fetcher): Fetcher used on a cache miss.
+            offline (bool): Only ever read the cache, no fetcher needed.
+        """
+
+        if fetcher is None and not offline:
+            raise ValueError("CachingFetcher needs a fetcher unless offline")
+        self.cache = cache
+        self.fetcher = fetcher
+        self.offline = offline
+
+    def get_tournament_table_html(self, url):
+        html = self.cache.get(url, allow_stale=self.offline)
+        if html is not None or self.offline:
+            return html
+        html = self.fetcher.get_tournament_table_html(url)
+        if html is not None and self.fetcher.last_page_ready:
+            self.cache.put(url, html)
+        return html
+
+    def close(self):
+        if self.fetcher is not None:
+            self.fetcher.close()
+
+    def print_page_load_times(self):
+        if self.fetcher is not None:
+            self.fetcher.print_page_load_times()
+
+
+def make_fetcher(name, **kwargs):
+    """
+    Create a fetcher by name.
+
+    Args:
+        name (str): "selenium" or "http".
+
+    Returns:
+        (Fetcher)
+    """
+
+    if name == "selenium":
+        return SeleniumFetcher(**kwargs)
+    elif name == "http":
+        return HttpFetcher()
+    raise ValueError("Unknown fetcher: " + str(name))
@@ -0,0 +1,277 @@
+"""
+Writers taking scraped matches to the database and the Parquet dataset,
+either directly or through a queue to a single writer process.
+"""
+
+from Anomalies import AnomalySink
+from DbManager import DatabaseManager
+from DfManager import DataframeManager
+
+# message kinds sent to write_from_queue
+MATCHES_MESSAGE = "matches"
+SEASON_MESSAGE = "season"
+
+
+class MatchWriter():
+
+    def __init__(self, is_first_run, full_refresh=False):
+        """
+        Constructor. Owns the database, and a DataframeManager for each league
+        so leagues being scraped at the same time keep their seasons apart.
+
+        Args:
+            is_first_run (bool): Should the database be initialized?
+            full_refresh (bool): Start from an empty database.
+        """
+
+        self.db_manager = DatabaseManager(is_first_run, full_refresh)
+        self.df_managers = {}
+        self.anomaly_sink = AnomalySink()
+
+    def get_df_manager(self, league):
+        """
+        Get the DataframeManager collecting a league's matches.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+        Returns:
+            (DataframeManager)
+        """
+
+        key = (league["area"], league["league"])
+        if key not in self.df_managers:
+            self.df_managers[key] = DataframeManager(False)
+        return self.df_managers[key]
+
+    def add_soccer_match(self, league, retrieved_from_url, match):
+        """
+        Queue a soccer match for the database and the league's current season.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+            retrieved_from_url (str): URL this match was retrieved from.
+
+            match (object): The SoccerMatch to write.
+        """
+
+        self.db_manager.add_soccer_match(league, retrieved_from_url, match)
+        self.get_df_manager(league).add_soccer_match(
+            league, retrieved_from_url, match
+        )
+
+    def record_page(self, page_state, replace_matches):
+        """
+        Queue the scrape state of a results page for the database.
+
+        Args:
+            page_state (dict): The page's scrape_state columns.
+
+            replace_matches (bool): The page's matches from earlier runs are
+                replaced by those just added.
+        """
+
+        self.db_manager.record_page(page_state, replace_matches)
+
+    def record_anomaly(self, anomaly):
+        """
+        Record a row that couldn't be turned into a match.
+
+        Args:
+            anomaly (dict): As from Anomalies.make_anomaly.
+        """
+
+        self.anomaly_sink.record(anomaly)
+
+    def flush(self):
+        """
+        Insert the matches and page states queued so far into the database.
+
+        Returns:
+            (int) Number of matches inserted.
+        """
+
+        return self.db_manager.flush()
+
+    def write_season(self, league, season_url, merge=False, replaced_urls=(),
+                     last_page=None):
+        """
+        Write a league's finished season to its dataset partition.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+            season_url (str): Results URL the season was scraped from.
+
+            merge (bool): Keep the partition's matches from pages that
+                weren't scraped again.
+
+            replaced_urls (list of str): Pages whose matches from earlier
+                runs were replaced.
+
+            last_page (int): Last page number of the season, where known.
+
+        Returns:
+            (int) Number of matches written.
+        """
+
+        return self.get_df_manager(league).write_season(
+            league["league"], season_url, merge, replaced_urls, last_page
+        )
+
+    def close(self):
+        """
+        Write out anything still queued for the database.
+        """
+
+        self.db_manager.flush()
+        self.anomaly_sink.close()
+
+
+class QueueMatchWriter():
+
+    def __init__(self, queue):
+        """
+        Constructor. Same interface as MatchWriter, but sends the matches of
+        each page to write_from_queue running in the writer process.
+
+        Args:
+            queue (multiprocessing.Queue): Queue write_from_queue reads.
+        """
+
+        self.queue = queue
+        self.pending_matches = []
+        self.pending_states = []
+        self.pending_anomalies = []
+        self.season_counts = {}
+
+    def add_soccer_match(self, league, retrieved_from_url, match):
+        """
+        Queue a soccer match to be sent on the next flush.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+            retrieved_from_url (str): URL this match was retrieved from.
+
+            match (object): The SoccerMatch to write.
+        """
+
+        self.pending_matches.append((league, retrieved_from_url, match))
+        key = (league["area"], league["league"])
+        self.season_counts[key] = self.season_counts.get(key, 0) + 1
+
+    def record_page(self, page_state, replace_matches):
+        """
+        Queue the scrape state of a results page to be sent on the next flush.
+
+        Args:
+            page_state (dict): The page's scrape_state columns.
+
+            replace_matches (bool): The page's matches from earlier runs are
+                replaced by those just added.
+        """
+
+        self.pending_states.append((page_state, replace_matches))
+
+    def record_anomaly(self, anomaly):
+        """
+        Queue a row that couldn't be turned into a match, to be sent on the
+        next flush.
+
+        Args:
+            anomaly (dict): As from Anomalies.make_anomaly.
+        """
+
+        self.pending_anomalies.append(anomaly)
+
+    def flush(self):
+        """
+        Send the queued matches, page states and anomalies to the writer
+        process in one message.
+
+        Returns:
+            (int) Number of matches sent.
+        """
+
+        if len(self.pending_matches) == 0 and len(self.pending_states) == 0 \
+                and len(self.pending_anomalies) == 0:
+            return 0
+        self.queue.put((
+            MATCHES_MESSAGE, self.pending_matches, self.pending_states,
+            self.pending_anomalies
+        ))
+        sent = len(self.pending_matches)
+        self.pending_matches = []
+        self.pending_states = []
+        self.pending_anomalies = []
+        return sent
+
+    def write_season(self, league, season_url, merge=False, replaced_urls=(),
+                     last_page=None):
+        """
+        Have the writer process write a league's finished season.
+
+        Args:
+            league (dict): The dict result from parsing a league.json file.
+
+            season_url (str): Results URL the season was scraped from.
+
+            merge (bool): Keep the partition's matches from pages that
+                weren't scraped again.
+
+            replaced_urls (list of str): Pages whose matches from earlier
+                runs were replaced.
+
+            last_page (int): Last page number of the season, where known.
+
+        Returns:
+            (int) Number of matches in the season.
+        """
+
+        self.flush()
+        self.queue.put((
+            SEASON_MESSAGE, league, season_url, merge, list(replaced_urls),
+            last_page
+        ))
+        return self.season_counts.pop((league["area"], league["league"]), 0)
+
+    def close(self):
+        """
+        Send anything still queued.
+        """
+
+        self.flush()
+
+
+def write_from_queue(queue, is_first_run, full_refresh=False):
+    """
+    Writer process main loop - the only process touching the database and
+    the dataset. Runs until it reads None from the queue.
+
+    Args:
+        queue (multiprocessing.Queue): Queue QueueMatchWriters send to.
+
+        is_first_run (bool): Should the database be initialized?
+
+        full_refresh (bool): Start from an empty database.
+    """
+
+    writer = MatchWriter(is_first_run, full_refresh)
+    while True:
+        message = queue.get()
+        if message is None:
+            break
+        if message[0] == MATCHES_MESSAGE:
+            for league, retrieved_from_url, match in message[1]:
+                writer.add_soccer_match(league, retrieved_from_url, match)
+            for page_state, replace_matches in message[2]:
+                writer.record_page(page_state, replace_matches)
+            for anomaly in message[3]:
+                writer.record_anomaly(anomaly)
+            writer.flush()
+        elif message[0] == SEASON_MESSAGE:
+            written = writer.write_season(*message[1:])
+            print(f"Wrote {written} matches of {message[2]}")
+    writer.close()
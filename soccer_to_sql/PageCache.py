@@ -0,0 +1,164 @@
+"""
+Compressed on-disk cache of page HTML keyed by URL.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+CACHE_DIRNAME = "cache"
+INDEX_FILENAME = "index.sqlite"
+CLOSED_SEASON_URL_REGEX = re.compile(r"-\d{4}(-\d{4})?/results/")
+
+
+def is_closed_season_url(url):
+    """
+    Determine whether a URL belongs to a season that is over. Past seasons have
+    their years in the URL, e.g. .../bundesliga-2020-2021/results/, while the
+    current season is just .../bundesliga/results/.
+
+    Args:
+        url (str): URL to assess.
+
+    Returns:
+        (bool)
+    """
+
+    return CLOSED_SEASON_URL_REGEX.search(url) is not None
+
+
+class PageCache():
+
+    def __init__(self, directory=CACHE_DIRNAME, max_bytes=2 * 1024 ** 3,
+                 current_season_ttl=12 * 3600):
+        """
+        Constructor. Pages of closed seasons are kept indefinitely, current
+        season pages expire after current_season_ttl. Once the cache grows past
+        max_bytes, least recently used pages are evicted, current season pages
+        first.
+
+        Args:
+            directory (str): Directory to keep the cache in.
+            max_bytes (int): Size the cache is trimmed back to.
+            current_season_ttl (int): Seconds current season pages stay valid.
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.current_season_ttl = current_season_ttl
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(
+            os.path.join(directory, INDEX_FILENAME), timeout=30,
+            check_same_thread=False
+        )
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS pages
+                             (key text PRIMARY KEY, url text,
+                             is_closed integer, fetched_at real,
+                             last_access real, size integer)''')
+        self.conn.commit()
+
+    def path_for(self, key):
+        """
+        Get the file path a page with the given key is stored at.
+
+        Args:
+            key (str): Hash of the page URL.
+
+        Returns:
+            (str)
+        """
+
+        return os.path.join(self.directory, key[:2], key + ".html.gz")
+
+    def get(self, url, allow_stale=False):
+        """
+        Get a page from the cache.
+
+        Args:
+            url (str): URL of the page.
+            allow_stale (bool): Also return expired current season pages.
+
+        Returns:
+            (str) Cached HTML, or None on a miss.
+        """
+
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        row = self.conn.execute(
+            "SELECT is_closed, fetched_at FROM pages WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        is_closed, fetched_at = row
+        is_expired = time.time() - fetched_at > self.current_season_ttl
+        if not is_closed and not allow_stale and is_expired:
+            return None
+        try:
+            with gzip.open(self.path_for(key), "rt", encoding="utf-8") as f:
+                html = f.read()
+        except (OSError, EOFError):
+            self.conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            self.conn.commit()
+            return None
+        self.conn.execute(
+            "UPDATE pages SET last_access = ? WHERE key = ?", (time.time(), key)
+        )
+        self.conn.commit()
+        return html
+
+    def put(self, url, html):
+        """
+        Store a page in the cache, evicting others if it grew too big.
+
+        Args:
+            url (str): URL of the page.
+            html (str): HTML to store.
+        """
+
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            f.write(html)
+        os.replace(path + ".tmp", path)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+            (key, url, int(is_closed_season_url(url)), now, now,
+             os.path.getsize(path))
+        )
+        self.conn.commit()
+        self.evict_if_needed()
+
+    def evict_if_needed(self):
+        """
+        Drop least recently used pages until the cache is under max_bytes.
+        """
+
+        total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM pages"
+        ).fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        rows = self.conn.execute(
+            "SELECT key, size FROM pages ORDER BY is_closed, last_access"
+        ).fetchall()
+        for key, size in rows:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+            self.conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total_bytes -= size
+        self.conn.commit()
+
+    def __del__(self):
+        """
+        Destructor.
+        """
+
+        self.conn.close()
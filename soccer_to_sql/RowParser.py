@@ -0,0 +1,351 @@
+"""
+Ways of parsing the tournament table HTML of a results page into its date and
+match rows - BeautifulSoup with Python's html.parser, or a one-pass lxml
+parser giving the same rows several times faster.
+"""
+
+from bs4 import BeautifulSoup
+import lxml.html
+from lxml.etree import ParserError
+
+ROW_PARSERS = ["lxml", "soup"]
+
+
+class RowParser():
+    """
+    Interface used by the Scraper to parse tournament tables.
+    """
+
+    def parse(self, tournament_tbl_html):
+        """
+        Parse the inner HTML of a tournament table.
+
+        Args:
+            tournament_tbl_html (str): Inner HTML of div#tournamentTable.
+
+        Returns:
+            (tuple) Rows as a list of dicts - date rows as {"date"}, match
+                rows as {"time", "participants", "href", "score", "odds"} - or
+                None if they couldn't be read, and the last page number on
+                the pagination bar (1 if there is none).
+        """
+
+        raise NotImplementedError()
+
+
+class SoupRowParser(RowParser):
+
+    def parse(self, tournament_tbl_html):
+        tournament_tbl_soup = BeautifulSoup(tournament_tbl_html, "html.parser")
+        return (
+            self.get_rows(tournament_tbl_soup),
+            self.get_last_page_number(tournament_tbl_soup)
+        )
+
+    def get_rows(self, tournament_tbl_soup):
+        """
+        Get the date and match rows of a parsed tournament table.
+
+        Args:
+            tournament_tbl_soup (obj): BeautifulSoup of the tournament table.
+
+        Returns:
+            (list of dict) Rows as from get_row, or None if there are none.
+        """
+
+        try:
+            significant_rows = tournament_tbl_soup(self.is_soccer_match_or_date)
+        except:
+            return None
+        return [self.get_row(tag) for tag in significant_rows]
+
+    def get_last_page_number(self, tournament_tbl_soup):
+        """
+        Read the number of the last page from the pagination bar of a
+        tournament table.
+
+        Args:
+            tournament_tbl_soup (obj): BeautifulSoup of the tournament table.
+
+        Returns:
+            (int) Last page number, 1 if there is no pagination bar.
+        """
+
+        pagination = tournament_tbl_soup.find(id="pagination")
+        if pagination is None:
+            return 1
+        page_numbers = [
+            int(link["x-page"])
+            for link in pagination.find_all("a", attrs={"x-page": True})
+            if link["x-page"].isdigit()
+        ]
+        return max(page_numbers + [1])
+
+    def get_row(self, tag):
+        """
+        Pull the strings scraping needs out of an HTML tag for a date or
+        soccer match row.
+
+        Args:
+            tag (obj): HTML tag object from BeautifulSoup.
+
+        Returns:
+            (dict)
+        """
+
+        datet = tag.find(class_="datet")
+        datet_str = datet.string if datet is not None else None
+        if self.is_date(tag):
+            return {"date": datet_str}
+        participant = tag.find(class_="table-participant")
+        first_child = None
+        if participant is not None and len(participant.contents) > 0:
+            first_child = participant.contents[0]
+        attrs = getattr(first_child, "attrs", None) or {}
+        score = tag.find(class_="table-score")
+        return {
+            "time": datet_str,
+            "participants": (
+                participant.text if participant is not None else None
+            ),
+            "href": attrs.get("href"),
+            "score": score.string if score is not None else None,
+            "odds": [cell.text for cell in tag.find_all(class_="odds-nowrp")]
+        }
+
+    def is_soccer_match_or_date(self, tag):
+        """
+        Determine whether a provided HTML tag is a row for a soccer match or
+        date.
+
+        Args:
+            tag (obj): HTML tag object from BeautifulSoup.
+
+        Returns:
+            (bool)
+        """
+
+        if tag.name != "tr":
+            return False
+        if "center" in tag["class"] and "nob-border" in tag["class"]:
+            return True
+        if "deactivate" in tag["class"] and tag.has_attr("xeid"):
+            return True
+        return False
+
+    def is_date(self, tag):
+        """
+        Determine whether a provided HTML tag is a row for a date.
+
+        Args:
+            tag (obj): HTML tag object from BeautifulSoup.
+
+        Returns:
+            (bool)
+        """
+
+        return "center" in tag["class"] and "nob-border" in tag["class"]
+
+
+class LxmlRowParser(RowParser):
+    """
+    Walks the table once, reading every field of a row as it passes it, with
+    the same results as SoupRowParser.
+    """
+
+    def parse(self, tournament_tbl_html):
+        try:
+            root = lxml.html.fragment_fromstring(
+                tournament_tbl_html, create_parent="div"
+            )
+        except ParserError:
+            return [], 1
+        return self.get_rows(root), self.get_last_page_number(root)
+
+    def get_rows(self, root):
+        """
+        Get the date and match rows of a parsed tournament table.
+
+        Args:
+            root (obj): lxml element holding the tournament table.
+
+        Returns:
+            (list of dict) Rows, or None if there are none.
+        """
+
+        rows = []
+        for tr in root.iter("tr"):
+            tr_class = tr.get("class")
+            if tr_class is None:
+                # where SoupRowParser gives up on a row without a class
+                return None
+            classes = tr_class.split()
+            if "center" in classes and "nob-border" in classes:
+                rows.append({"date": self.get_date_string(tr)})
+            elif "deactivate" in classes and tr.get("xeid") is not None:
+                rows.append(self.get_match_row(tr))
+        return rows
+
+    def get_match_row(self, tr):
+        """
+        Read every field of a soccer match row in one walk of its elements.
+
+        Args:
+            tr (obj): lxml element of the row.
+
+        Returns:
+            (dict)
+        """
+
+        datet = participant = score = None
+        odds = []
+        for element in tr.iterdescendants():
+            classes = element_classes(element)
+            if not classes:
+                continue
+            if datet is None and "datet" in classes:
+                datet = element
+            if participant is None and "table-participant" in classes:
+                participant = element
+            if score is None and "table-score" in classes:
+                score = element
+            if "odds-nowrp" in classes:
+                odds.append(element.text_content())
+        href = None
+        if participant is not None and not participant.text and len(participant):
+            first_child = participant[0]
+            if isinstance(first_child.tag, str):
+                href = first_child.get("href")
+        return {
+            "time": element_string(datet) if datet is not None else None,
+            "participants": (
+                participant.text_content() if participant is not None else None
+            ),
+            "href": href,
+            "score": element_string(score) if score is not None else None,
+            "odds": odds
+        }
+
+    def get_date_string(self, tr):
+        """
+        Read the date of a date row.
+
+        Args:
+            tr (obj): lxml element of the row.
+
+        Returns:
+            (str) Date string, or None if the row has none.
+        """
+
+        for element in tr.iterdescendants():
+            if "datet" in element_classes(element):
+                return element_string(element)
+        return None
+
+    def get_last_page_number(self, root):
+        """
+        Read the number of the last page from the pagination bar of a
+        tournament table.
+
+        Args:
+            root (obj): lxml element holding the tournament table.
+
+        Returns:
+            (int) Last page number, 1 if there is no pagination bar.
+        """
+
+        paginations = root.xpath("(.//*[@id='pagination'])[1]")
+        if len(paginations) == 0:
+            return 1
+        page_numbers = [
+            int(page) for page in paginations[0].xpath(".//a/@x-page")
+            if page.isdigit()
+        ]
+        return max(page_numbers + [1])
+
+
+def element_classes(element):
+    """
+    Get the classes of an lxml element.
+
+    Args:
+        element (obj): lxml element, comment or processing instruction.
+
+    Returns:
+        (list of str)
+    """
+
+    if not isinstance(element.tag, str):
+        return []
+    return element.get("class", "").split()
+
+
+def element_string(element):
+    """
+    Same as BeautifulSoup's .string - the text of an element's one child,
+    following single children down, or None if there are several.
+
+    Args:
+        element (obj): lxml element.
+
+    Returns:
+        (str)
+    """
+
+    while True:
+        children = list(element)
+        num_nodes = len(children) + (1 if element.text else 0)
+        num_nodes += sum(1 for child in children if child.tail)
+        if num_nodes != 1:
+            return None
+        if element.text:
+            return str(element.text)
+        element = children[0]
+
+
+def get_row_html(tournament_tbl_html, index):
+    """
+    Get the HTML of one of the rows a RowParser read from a tournament table.
+
+    Args:
+        tournament_tbl_html (str): Inner HTML of div#tournamentTable.
+        index (int): Position of the row in the parsed rows.
+
+    Returns:
+        (str) HTML of the row, or None if there is no such row.
+    """
+
+    try:
+        root = lxml.html.fragment_fromstring(
+            tournament_tbl_html, create_parent="div"
+        )
+    except ParserError:
+        return None
+    found = -1
+    for tr in root.iter("tr"):
+        classes = (tr.get("class") or "").split()
+        if ("center" in classes and "nob-border" in classes) or (
+            "deactivate" in classes and tr.get("xeid") is not None
+        ):
+            found += 1
+            if found == index:
+                return lxml.html.tostring(tr, encoding="unicode", with_tail=False)
+    return None
+
+
+def make_row_parser(name):
+    """
+    Create a row parser by name.
+
+    Args:
+        name (str): "lxml" or "soup".
+
+    Returns:
+        (RowParser)
+    """
+
+    if name == "lxml":
+        return LxmlRowParser()
+    elif name == "soup":
+        return SoupRowParser()
+    raise ValueError("Unknown row parser: " + str(name))
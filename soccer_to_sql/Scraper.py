@@ -2,33 +2,89 @@
 Soccer match results scraping object.
 """
 
-from bs4 import BeautifulSoup
-from DbManager import DatabaseManager
-from DfManager import DataframeManager
+from Anomalies import ScoreOverrides, make_anomaly
+from concurrent.futures import ThreadPoolExecutor
+from DbManager import PAGE_ANOMALIES, PAGE_FAILED, PAGE_OK
+from DbManager import get_season_scrape_state
+from DfManager import season_key
+from Fetcher import CachingFetcher, make_fetcher
+from MatchWriter import MatchWriter
+from PageCache import PageCache, is_closed_season_url
+from RowParser import get_row_html, make_row_parser
+import hashlib
 import json
+import queue
 import re
-import time
-from selenium import webdriver
 from SoccerMatch import SoccerMatch
+import time
 
 class Scraper():
 
-    def __init__(self, league_json, initialize_db):
+    def __init__(self, league_json, initialize_db, fetcher="selenium",
+                 page_ready_timeout=10, fallback_delay=5, use_cache=True,
+                 offline=False, browser_profile="lean", extraction="html",
+                 match_writer=None, page_concurrency=1, row_parser="lxml",
+                 full_refresh=False):
         """
-        Constructor. Launch the web driver browser, initialize the league
-        field by parsing the representative JSON file, and connect to the
-        database manager.
+        Constructor. Set up the page fetcher (launching the web driver browser
+        unless fetching over plain HTTP), initialize the league field by
+        parsing the representative JSON file, and set up where matches are
+        written.
 
         Args:
             league_json (str): JSON string of the league to associate with the
                 Scraper.
             initialize_db (bool): Should the database be initialized?
+            fetcher (str): How to load pages, "selenium" or "http".
+            page_ready_timeout (int): Max seconds to wait for the tournament
+                table of a page to show up.
+            fallback_delay (int): Seconds to sleep when the table does not
+                show up within page_ready_timeout (selenium only).
+            use_cache (bool): Reuse pages kept in the on-disk page cache.
+            offline (bool): Only read pages from the page cache.
+            browser_profile (str): What the browser loads, "lean" or "full"
+                (selenium only).
+            extraction (str): "html" to parse the tournament table HTML
+                here, or "js" to have the browser send back just its rows
+                (selenium only, bypasses the page cache).
+            match_writer (object): Where matches go, e.g. a QueueMatchWriter
+                feeding a writer process. Defaults to a MatchWriter writing
+                the database and dataset from this process.
+            page_concurrency (int): Max pages of a season fetched at the
+                same time, each by its own fetcher (so its own browser with
+                selenium).
+            row_parser (str): How tournament table HTML is parsed, "lxml"
+                (one pass) or "soup" (BeautifulSoup with html.parser).
+            full_refresh (bool): Scrape every page of every season again,
+                rather than only the current season and pages of closed
+                seasons that earlier runs didn't get.
         """
 
-        self.browser = webdriver.Chrome("/usr/local/bin/chromedriver")
+        if extraction not in ["html", "js"]:
+            raise ValueError("Unknown extraction: " + str(extraction))
+        if extraction == "js" and (offline or fetcher != "selenium"):
+            raise ValueError("js extraction needs the selenium fetcher")
+        self.extraction = extraction
+        self.full_refresh = full_refresh
+        self.row_parser = make_row_parser(row_parser)
+        self.fetcher_name = fetcher
+        self.page_ready_timeout = page_ready_timeout
+        self.fallback_delay = fallback_delay
+        self.use_cache = use_cache
+        self.offline = offline
+        self.browser_profile = browser_profile
+        self.fetcher = self.make_page_fetcher()
+        self.page_fetchers = [self.fetcher]
+        self.page_concurrency = max(page_concurrency, 1)
         self.league = self.parse_json(league_json)
-        self.db_manager = DatabaseManager(initialize_db)
-        self.df_manager = DataframeManager(initialize_db)
+        self.score_overrides = ScoreOverrides()
+        # tournament table HTML of pages whose rows are yet to be added, to
+        # record anomalies with
+        self.page_html = {}
+        self.anomaly_count = 0
+        if match_writer is None:
+            match_writer = MatchWriter(initialize_db, full_refresh)
+        self.match_writer = match_writer
 
     def parse_json(self, json_str):
         """
@@ -43,10 +99,53 @@ class Scraper():
 
         return json.loads(json_str)
 
+    def make_page_fetcher(self):
+        """
+        Set up a fetcher as configured in the constructor.
+
+        Returns:
+            (Fetcher)
+        """
+
+        if self.offline:
+            return CachingFetcher(PageCache(), offline=True)
+        if self.fetcher_name == "selenium":
+            page_fetcher = make_fetcher(
+                self.fetcher_name, page_ready_timeout=self.page_ready_timeout,
+                fallback_delay=self.fallback_delay,
+                browser_profile=self.browser_profile
+            )
+        else:
+            page_fetcher = make_fetcher(self.fetcher_name)
+        if self.use_cache and self.extraction == "html":
+            # own cache connection, as fetchers may be used from other threads
+            page_fetcher = CachingFetcher(PageCache(), page_fetcher)
+        return page_fetcher
+
+    def get_page_fetchers(self, num_pages):
+        """
+        Get the fetchers to load a number of pages with, setting up more of
+        them, up to page_concurrency, the first time they are needed.
+
+        Args:
+            num_pages (int): Pages about to be fetched.
+
+        Returns:
+            (list of Fetcher)
+        """
+
+        wanted = min(num_pages, self.page_concurrency)
+        while len(self.page_fetchers) < wanted:
+            self.page_fetchers.append(self.make_page_fetcher())
+        return self.page_fetchers[:max(wanted, 1)]
+
     def scrape_all_urls(self, do_verbose_output=False):
         """
-        Call the scrape method on every URL in this Scraper's league field, in
-        order, then close the browser.
+        Scrape every season URL in this Scraper's league field, in order, then
+        close the fetchers. Page 1 of a season says how many pages it has, and
+        the rest are then fetched page_concurrency at a time. Unless doing a
+        full refresh, pages of closed seasons that an earlier run read are
+        skipped, and only pages whose rows changed are written.
 
         Args:
             do_verbose_output (bool): True/false do verbose output.
@@ -58,32 +157,72 @@ class Scraper():
             print(output_str)
 
         for url in self.league["urls"]:
+            season_str = season_key(url)
             if do_verbose_output:
-                list_season_str = [
-                    ele for ele in url.split("/")
-                    if ele.startswith('bundesliga')
-                ]
-                if len(list_season_str) == 0:
-                    season_str = "Bundesliga this year"
-                else:
-                    season_str = list_season_str[0]
                 print(f"Starting season {season_str} ...")
 
-            # loop through all pages in that season
-            page = 1
-            while self.scrape_url("#/page/".join((url, "{}/".format(page)))):
-                if do_verbose_output:
-                    print("Scraped page", page)
-                page += 1
+            # what earlier runs got from this season, unless starting over
+            state = {} if self.full_refresh else get_season_scrape_state(url)
+            # pages of a closed season don't change once they were read
+            is_closed = is_closed_season_url(url)
+            first_page_url = "#/page/".join((url, "1/"))
+            # pages whose matches from earlier runs were replaced
+            replaced_urls = []
+            if is_closed and self.is_page_done(state.get(first_page_url)):
+                last_page = state[first_page_url]["last_page"]
+            else:
+                rows, last_page = self.get_first_page(first_page_url)
+                if rows is None:
+                    print(f"No tournament table at {first_page_url}")
+                    last_page = 0
+                if self.add_page(url, first_page_url, rows, last_page, state):
+                    replaced_urls.append(first_page_url)
+                if rows is not None and do_verbose_output:
+                    print(f"Scraped page 1 of {last_page}")
+
+            pages = [
+                page for page in range(2, last_page + 1)
+                if not (is_closed and self.is_page_done(state.get(
+                    "#/page/".join((url, "{}/".format(page)))
+                )))
+            ]
+            page_urls = [
+                "#/page/".join((url, "{}/".format(page))) for page in pages
+            ]
+            for page, page_url, rows in zip(
+                pages, page_urls, self.fetch_pages(page_urls)
+            ):
+                if self.add_page(url, page_url, rows, last_page, state):
+                    replaced_urls.append(page_url)
+                if rows is None:
+                    print(f"Could not load page {page}, skipping it")
+                elif do_verbose_output:
+                    print(f"Scraped page {page} of {last_page}")
+
+            # replaces this season's matches from the pages just scraped, or
+            # all of them on a full refresh, dropping any from pages past the
+            # last one
+            written = self.match_writer.write_season(
+                self.league, url, merge=not self.full_refresh,
+                replaced_urls=replaced_urls,
+                last_page=last_page if last_page > 0 else None
+            )
 
             if do_verbose_output:
-                print(f"Finished season {season_str}!")
+                print(f"Finished season {season_str}, wrote {written} matches!")
                 print("\n")
 
-        self.browser.quit()
+        for page_fetcher in self.page_fetchers:
+            page_fetcher.close()
+        self.match_writer.close()
+
+        if do_verbose_output is True:
+            for page_fetcher in self.page_fetchers:
+                page_fetcher.print_page_load_times()
 
-        # keep dataframe in cache of class
-        self.df_manager.keep_dataset()
+        if self.anomaly_count > 0:
+            print(f"Recorded {self.anomaly_count} rows that couldn't be read "
+                  "as matches in the anomalies file")
 
         if do_verbose_output is True:
             print("Done scraping this league.")
@@ -100,106 +239,268 @@ class Scraper():
             Whether data existed for that season.
         """
 
-        self.browser.get(url)
+        rows = self.get_rows(url)
+        if rows is None:
+            return False
+        self.add_rows(url, rows)
+        self.match_writer.flush()
+        return True
+
+    def fetch_pages(self, page_urls):
+        """
+        Get the rows of several results pages, fetching up to
+        page_concurrency of them at a time.
+
+        Args:
+            page_urls (list of str): URLs of the pages.
+
+        Returns:
+            (iterator) Rows of each page, as from get_rows, in page_urls order.
+        """
 
-        # waiting for table to load
-        # needed or else the data won't be complete
-        delay = 5 # seconds
-        time.sleep(delay)
+        page_fetchers = self.get_page_fetchers(len(page_urls))
+        if len(page_fetchers) == 1:
+            for page_url in page_urls:
+                yield self.get_rows(page_url)
+            return
 
-        tournament_tbl = self.browser.find_element_by_id("tournamentTable")
-        tournament_tbl_html = tournament_tbl.get_attribute("innerHTML")
-        tournament_tbl_soup = BeautifulSoup(tournament_tbl_html, "html.parser")
-        try:
-            significant_rows = tournament_tbl_soup(self.is_soccer_match_or_date)
-        except:
+        # a fetcher (and its browser) only loads one page at a time
+        idle_fetchers = queue.Queue()
+        for page_fetcher in page_fetchers:
+            idle_fetchers.put(page_fetcher)
+
+        def fetch_page(page_url):
+            page_fetcher = idle_fetchers.get()
+            try:
+                return self.get_rows(page_url, page_fetcher)
+            finally:
+                idle_fetchers.put(page_fetcher)
+
+        with ThreadPoolExecutor(max_workers=len(page_fetchers)) as executor:
+            yield from executor.map(fetch_page, page_urls)
+
+    def add_page(self, season_url, url, rows, last_page, state):
+        """
+        Record a fetched results page in the scrape state, and write its
+        matches if they changed since an earlier run read it.
+
+        Args:
+            season_url (str): Results URL of the page's season.
+
+            url (str): URL of the page.
+
+            rows (list of dict): Rows of the page as from get_rows, or None if
+                it couldn't be loaded.
+
+            last_page (int): Last page number of the season.
+
+            state (dict): Scrape state of the season's pages, as from
+                get_season_scrape_state.
+
+        Returns:
+            (bool) Whether the page's matches from earlier runs were replaced.
+        """
+
+        page_state = {
+            "url": url, "season_url": season_url,
+            "league": self.league["league"], "fetched_at": time.time(),
+            "content_hash": None, "row_count": None, "last_page": last_page,
+            "status": PAGE_FAILED
+        }
+        if rows is None:
+            # keep whatever an earlier run got from it
+            self.match_writer.record_page(page_state, False)
+            self.match_writer.flush()
+            return False
+        page_state["content_hash"] = hashlib.sha256(
+            json.dumps(rows, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        page_state["row_count"] = sum(1 for row in rows if "date" not in row)
+        page_state["status"] = PAGE_OK
+        previous = state.get(url)
+        if self.is_page_done(previous) and (
+            previous["content_hash"] == page_state["content_hash"]
+        ):
+            self.page_html.pop(url, None)
+            self.match_writer.record_page(page_state, False)
+            self.match_writer.flush()
             return False
+        if self.add_rows(url, rows) > 0:
+            page_state["status"] = PAGE_ANOMALIES
+        self.match_writer.record_page(page_state, True)
+        # one transaction per page
+        self.match_writer.flush()
+        return True
+
+    def is_page_done(self, page_state):
+        """
+        Determine whether an earlier run read a page.
+
+        Args:
+            page_state (dict): The page's scrape state, None if it has none.
+
+        Returns:
+            (bool)
+        """
+
+        return page_state is not None and page_state["status"] == PAGE_OK
 
+    def add_rows(self, url, rows):
+        """
+        Turn the match rows of a results page into SoccerMatches and hand
+        them to the match writer, along with any rows that couldn't be.
+
+        Args:
+            url (str): URL the rows were scraped from.
+
+            rows (list of dict): Rows of the page, as from get_rows.
+
+        Returns:
+            (int) Number of rows recorded as anomalies.
+        """
+
+        page_html = self.page_html.pop(url, None)
+        anomaly_count = 0
         current_date_str = None
-        for row in significant_rows:
-            if self.is_date(row) is True:
-                current_date_str = self.get_date(row)
+        for i, row in enumerate(rows):
+            if "date" in row:
+                current_date_str = self.get_date(row["date"])
             elif self.is_date_string_supported(current_date_str) == False:
                 # not presently supported
                 continue
             else:  # is a soccer match
-                this_match = SoccerMatch()
-                game_datetime_str = current_date_str + " " + self.get_time(row)
-                this_match.set_start(game_datetime_str)
-                season = self.get_season(row)
-                this_match.set_season(season)
-                participants = self.get_participants(row)
-                this_match.set_teams(participants)
                 try:
-                    scores = self.get_scores(row)
-                except:
-                    if (
-                        participants == ['Bayern Munich', 'Freiburg']
-                    ) and (
-                        game_datetime_str == '13 Mar 2010 16:30'
-                    ):
-                        scores = [2, 1]
-                    elif (
-                        participants == [
-                            'Hertha Berlin', 'B. Monchengladbach'
-                        ]
-                    ) and (
-                        game_datetime_str == '23 Jan 2010 13:30'
-                    ):
-                        scores = [0, 0]
-                    elif (
-                        participants == [
-                            'Bayern Munich', 'Hoffenheim'
-                        ]
-                    ) and (
-                        game_datetime_str == '15 Jan 2010 18:30'
-                    ):
-                        scores = [2, 0]
-                    else:
-                        import pdb; pdb.set_trace()
-                this_match.set_scores(scores)
-                this_match.set_outcome_from_scores(scores)
-                odds = self.get_odds(row)
-                this_match.set_odds(odds)
-                # extra_info = self.get_extra_info(row)
-                # this_match.set_extra_info(extra_info)
-                self.db_manager.add_soccer_match(self.league, url, this_match)
-                self.df_manager.add_soccer_match(self.league, url, this_match)
+                    this_match = self.get_match(
+                        current_date_str, row
+                    )
+                except Exception as e:
+                    # record it and carry on, a bad row never stops a run
+                    raw_html = None
+                    if page_html is not None:
+                        raw_html = get_row_html(page_html, i)
+                    self.match_writer.record_anomaly(make_anomaly(
+                        self.league, url, row, repr(e), raw_html
+                    ))
+                    anomaly_count += 1
+                    continue
+                self.match_writer.add_soccer_match(self.league, url, this_match)
+
+        self.anomaly_count += anomaly_count
+        return anomaly_count
+
+    def get_match(self, date_str, row):
+        """
+        Build a SoccerMatch from a match row, taking its scores from the
+        score overrides where it has one.
 
-        return True
+        Args:
+            date_str (str): Date of the date row above it.
+
+            row (dict): Match row, as from get_rows.
 
-    def is_soccer_match_or_date(self, tag):
+        Returns:
+            (SoccerMatch)
         """
-        Determine whether a provided HTML tag is a row for a soccer match or
-        date.
+
+        this_match = SoccerMatch()
+        game_datetime_str = date_str + " " + row["time"]
+        this_match.set_start(game_datetime_str)
+        season = self.get_season(row["href"])
+        this_match.set_season(season)
+        participants = self.get_participants(row["participants"])
+        this_match.set_teams(participants)
+        scores = self.score_overrides.get_scores(
+            self.league, game_datetime_str, participants
+        )
+        if scores is None:
+            scores = self.get_scores(row["score"])
+        if len(scores) != 2:
+            raise ValueError("Expected 2 scores, got " + str(scores))
+        this_match.set_scores(scores)
+        this_match.set_outcome_from_scores(scores)
+        this_match.set_odds(row["odds"])
+        # extra_info = self.get_extra_info(row)
+        # this_match.set_extra_info(extra_info)
+        return this_match
+
+    def get_first_page(self, url):
+        """
+        Load the first results page of a season and get its rows, along with
+        the number of pages its pagination bar says the season has.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            url (str): URL of page 1 of the season.
 
         Returns:
-            (bool)
+            (tuple) Rows as from get_rows, and the last page number (1 if
+                there is no pagination bar).
         """
 
-        if tag.name != "tr":
-            return False
-        if "center" in tag["class"] and "nob-border" in tag["class"]:
-            return True
-        if "deactivate" in tag["class"] and tag.has_attr("xeid"):
-            return True
-        return False
+        if self.extraction == "js":
+            rows = self.get_rows(url)
+            if rows is None:
+                return None, 0
+            last_page = self.fetcher.get_last_page_number()
+            if not isinstance(last_page, int):
+                raise ValueError("Unexpected last page number for " + url)
+            return rows, last_page
+        tournament_tbl_html = self.fetcher.get_tournament_table_html(url)
+        if tournament_tbl_html is None:
+            return None, 0
+        self.page_html[url] = tournament_tbl_html
+        return self.row_parser.parse(tournament_tbl_html)
+
+    def get_rows(self, url, fetcher=None):
+        """
+        Load a results page and get the date and match rows of its tournament
+        table, each as a dict of the strings the rest of scraping needs.
+
+        Args:
+            url (str): URL to scrape data from.
+            fetcher (Fetcher): Fetcher to load it with, if not self.fetcher.
+
+        Returns:
+            (list of dict) Date rows as {"date"}, match rows as {"time",
+                "participants", "href", "score", "odds"}, or None if the page
+                has no tournament table or its rows couldn't be read.
+        """
 
-    def is_date(self, tag):
+        if fetcher is None:
+            fetcher = self.fetcher
+        if self.extraction == "js":
+            rows = fetcher.get_tournament_table_rows(url)
+            if rows is not None and not (
+                isinstance(rows, list) and all(self.is_valid_row(row) for row in rows)
+            ):
+                raise ValueError("Unexpected tournament table rows for " + url)
+            return rows
+        tournament_tbl_html = fetcher.get_tournament_table_html(url)
+        if tournament_tbl_html is None:
+            return None
+        self.page_html[url] = tournament_tbl_html
+        return self.row_parser.parse(tournament_tbl_html)[0]
+
+    def is_valid_row(self, row):
         """
-        Determine whether a provided HTML tag is a row for a date.
+        Check a row sent back by the browser has the shape RowParser gives.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            row (dict): Row to check.
 
         Returns:
             (bool)
         """
 
-        return "center" in tag["class"] and "nob-border" in tag["class"]
+        if not isinstance(row, dict):
+            return False
+        if "date" in row:
+            return row["date"] is None or isinstance(row["date"], str)
+        for key in ["time", "participants", "href", "score"]:
+            if row.get(key) is not None and not isinstance(row[key], str):
+                return False
+        return isinstance(row.get("odds"), list) and all(
+            isinstance(odds, str) for odds in row["odds"]
+        )
 
     def is_date_string_supported(self, date_string):
         """
@@ -225,18 +526,19 @@ class Scraper():
             return False
         return True
 
-    def get_date(self, tag):
+    def get_date(self, this_date):
         """
-        Extract the date from an HTML tag for a date row.
+        Clean up the date string of a date row.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            this_date (str): Date string of the row.
 
         Returns:
             (str) Extracted date string.
         """
 
-        this_date = tag.find(class_="datet").string
+        if this_date is None:
+            return None
         if "Today" in this_date:
             return "Today"
         elif this_date.endswith(" - Play Offs"):
@@ -245,73 +547,57 @@ class Scraper():
             this_date = this_date[:-12]
         return this_date
 
-    def get_time(self, tag):
+    def get_participants(self, participants_str):
         """
-        Extract the time from an HTML tag for a soccer match row.
-
-        Args:
-            tag (obj): HTML tag object from BeautifulSoup.
-
-        Returns:
-            (str) Extracted time.
-        """
-
-        return tag.find(class_="datet").string
-
-    def get_participants(self, tag):
-        """
-        Extract the match's participants from an HTML tag for a soccer match
-        row.
+        Extract the match's participants from the participants text of a
+        soccer match row.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            participants_str (str): Text of the participants cell.
 
         Returns:
             (list of str) Extracted match participants.
         """
 
-        parsed_strings = tag.find(class_="table-participant").text.split(" - ")
+        parsed_strings = participants_str.split(" - ")
         participants = []
         participants.append(parsed_strings[0].replace('\xa0', ''))
         participants.append(parsed_strings[-1].replace('\xa0', ''))
         return participants
 
-    def get_season(self, tag):
+    def get_season(self, href):
         """
-        Extract the season the match is played in from an HTML tag for a
-        soccer match row.
+        Extract the season the match is played in from the link to a soccer
+        match.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            href (str): Link from the participants cell of the row.
 
         Returns:
             (str) season.
         """
 
-        parsed_href_elements = tag.find(
-            class_="table-participant"
-        ).contents[0].attrs['href'].split('/')
+        if href is None:
+            return ""
+        # e.g. /soccer/germany/bundesliga-2009-2010/<match>/
+        parsed_href_elements = href.split('/')
+        if len(parsed_href_elements) < 4:
+            return ""
+        season = season_key(parsed_href_elements[3])
+        return "" if season == "current" else season
 
-        for ele in parsed_href_elements:
-            if ele.startswith('bundesliga'):
-                return "-".join(ele.split('-')[1:])
-
-        return ""
-        
-
-    def get_scores(self, tag):
+    def get_scores(self, score_str):
         """
-        Extract the scores for each team from an HTML tag for a soccer match
-        row.
+        Extract the scores for each team from the score string of a soccer
+        match row.
 
         Args:
-            tag (obj): HTML tag object from BeautifulSoup.
+            score_str (str): Text of the score cell.
 
         Returns:
             (list of int) Extracted match scores.
         """
 
-        score_str = tag.find(class_="table-score").string
         if self.is_invalid_game_from_score_string(score_str):
             return [-1,-1]
         non_decimal = re.compile(r"[^\d]+")
@@ -319,24 +605,6 @@ class Scraper():
         scores = [int(s) for s in score_str.split()]
         return scores
 
-    def get_odds(self, tag):
-        """
-        Extract the betting odds for a match from an HTML tag for a soccer
-        match row.
-
-        Args:
-            tag (obj): HTML tag object from BeautifulSoup.
-
-        Returns:
-            (list of str) Extracted match odds.
-        """
-
-        odds_cells = tag.find_all(class_="odds-nowrp")
-        odds = []
-        for cell in odds_cells:
-            odds.append(cell.text)
-        return odds
-
     def is_invalid_game_from_score_string(self, score_str):
         """
         Assess, from the score string extracted from a soccer match row,
@@ -0,0 +1,152 @@
+"""
+Compare building the matches DataFrame one DataFrame.append per match (the
+old DataframeManager) against the columnar row buffer DataframeManager uses
+now, over a few leagues' worth of synthetic matches.
+
+Run from the soccer_to_sql directory:
+    python benchmarks/df_benchmark.py
+    python benchmarks/df_benchmark.py --leagues 3 --seasons 10
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd
+from DfManager import COLUMNS
+from DfManager import DataframeManager
+from SoccerMatch import SoccerMatch
+
+MATCHES_PER_SEASON = 306
+TEAMS = [
+    "Bayern Munich", "Dortmund", "Leverkusen", "RB Leipzig", "Freiburg",
+    "Union Berlin", "Wolfsburg", "Mainz", "B. Monchengladbach", "Koln",
+    "Hoffenheim", "Werder Bremen", "Bochum", "Augsburg", "Stuttgart",
+    "Hertha Berlin", "Schalke", "Eintracht Frankfurt"
+]
+
+
+def make_leagues(num_leagues, num_seasons):
+    """
+    Build synthetic leagues of matches.
+
+    Args:
+        num_leagues (int): How many leagues.
+        num_seasons (int): Seasons per league.
+
+    Returns:
+        (list of tuple) League dict and its list of (url, SoccerMatch).
+    """
+
+    leagues = []
+    for l in range(num_leagues):
+        league = {"league": "league-%d" % l, "area": "area-%d" % l}
+        matches = []
+        for s in range(num_seasons):
+            url = "https://www.oddsportal.com/soccer/area/league-%d-%d-%d/results/" % (
+                l, 2000 + s, 2001 + s
+            )
+            for m in range(MATCHES_PER_SEASON):
+                match = SoccerMatch()
+                match.set_start("%02d Mar %d 15:30" % (1 + m % 28, 2000 + s))
+                match.set_season("%d-%d" % (2000 + s, 2001 + s))
+                match.set_teams([TEAMS[m % 18], TEAMS[(m + 5) % 18]])
+                scores = [m % 4, m % 3]
+                match.set_scores(scores)
+                match.set_outcome_from_scores(scores)
+                match.set_odds(["%.2f" % (1.5 + m % 7 / 3), "3.40", "-"])
+                matches.append((url, match))
+        leagues.append((league, matches))
+    return leagues
+
+
+def legacy_append(df, record):
+    """
+    What DataFrame.append did, and what the old DataframeManager called once
+    per match - copy the whole frame with one more row.
+    """
+
+    return pd.concat([df, pd.DataFrame([record])], ignore_index=True)
+
+
+def build_legacy(leagues):
+    store = None
+    for league, matches in leagues:
+        df = pd.DataFrame(columns=COLUMNS)
+        for url, match in matches:
+            df = legacy_append(df, {
+                'league': league["league"],
+                'area': league["area"],
+                'retrieved_from_url': url,
+                'season': match.get_season(),
+                'start_time': match.get_start_time_unix_int(),
+                'end_time': match.get_end_time_unix_int(),
+                'team1': match.get_team1_string(),
+                'team2': match.get_team2_string(),
+                'team1_score': match.get_team1_score(),
+                'team2_score': match.get_team2_score(),
+                'outcome': match.get_outcome_string(),
+                'team1_odds': match.get_team1_odds(),
+                'team2_odds': match.get_team2_odds(),
+                'draw_odds': match.get_draw_odds(),
+            })
+        store = df.copy() if store is None else pd.concat([store, df], ignore_index=True)
+    return store
+
+
+def build_buffered(leagues):
+    for i, (league, matches) in enumerate(leagues):
+        df_manager = DataframeManager(i == 0)
+        for url, match in matches:
+            df_manager.add_soccer_match(league, url, match)
+        df_manager.keep_dataset()
+    return df_manager.get_kept_datasets()
+
+
+def measure(build, leagues):
+    """
+    Returns:
+        (tuple) Seconds taken, peak traced MB, final DataFrame.
+    """
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    df = build(leagues)
+    elapsed = time.perf_counter() - started_at
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataFrame building benchmark")
+    parser.add_argument("--leagues", type=int, default=3)
+    parser.add_argument("--seasons", type=int, default=5)
+    args = parser.parse_args()
+    leagues = make_leagues(args.leagues, args.seasons)
+    rows = sum(len(matches) for _, matches in leagues)
+    legacy_time, legacy_peak, legacy_df = measure(build_legacy, leagues)
+    buffered_time, buffered_peak, buffered_df = measure(build_buffered, leagues)
+    # same matches, only the dtypes differ
+    typed_legacy_df = legacy_df.copy()
+    for column in ["team1_score", "team2_score", "team1_odds", "team2_odds", "draw_odds"]:
+        typed_legacy_df[column] = pd.to_numeric(typed_legacy_df[column], errors="coerce")
+    if not typed_legacy_df.astype(buffered_df.dtypes.to_dict()).equals(buffered_df):
+        print("DataFrames differ between implementations!")
+    print(f"{rows} matches over {args.leagues} leagues")
+    print(f"{'':10} {'seconds':>10} {'peak MB':>10} {'frame MB':>10}")
+    for name, seconds, peak, df in [
+        ("append", legacy_time, legacy_peak, legacy_df),
+        ("buffered", buffered_time, buffered_peak, buffered_df)
+    ]:
+        frame_mb = df.memory_usage(deep=True).sum() / 2 ** 20
+        print(f"{name:10} {seconds:10.2f} {peak:10.1f} {frame_mb:10.2f}")
+    print(f"{legacy_time / buffered_time:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
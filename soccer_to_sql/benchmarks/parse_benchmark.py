@@ -0,0 +1,207 @@
+"""
+Compare the row parsers in RowParser.py on recorded tournament tables - check
+they read the same rows and page counts, and time them in rows per second.
+
+Pages come from files of tournament table HTML given on the command line, or
+else from the page cache (./cache), or else are synthetic. The synthetic
+tables are always checked for parity too, and the script exits with status 1
+if any parser's rows differ from soup's.
+
+Run from the soccer_to_sql directory:
+    python benchmarks/parse_benchmark.py
+    python benchmarks/parse_benchmark.py saved_tables/*.html --repeat 5
+"""
+
+import argparse
+import glob
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PageCache import CACHE_DIRNAME
+from RowParser import ROW_PARSERS, make_row_parser
+
+TEAMS = [
+    "Bayern Munich", "Dortmund", "Leverkusen", "RB Leipzig", "Freiburg",
+    "Union Berlin", "Wolfsburg", "Mainz", "B. Monchengladbach", "Koln",
+    "Hoffenheim", "Werder Bremen", "Bochum", "Augsburg", "Stuttgart",
+    "Hertha Berlin", "Schalke", "Eintracht Frankfurt"
+]
+SCORES = ["2:1", "0:0", "1:3 <span>pen.</span>", "postp.", "canc.", "3:2 ET"]
+
+
+def synthetic_table(num_matches, page, last_page):
+    """
+    Build the inner HTML of a tournament table shaped like Odds Portal's,
+    including the odd cases the parsers have to agree on.
+
+    Args:
+        num_matches (int): Match rows on the page.
+        page (int): Page number, for the pagination bar.
+        last_page (int): Last page number, for the pagination bar.
+
+    Returns:
+        (str)
+    """
+
+    rows = [
+        '<tr class="dark center" xtid="39"><th class="first2 tl" colspan="7">'
+        '<a href="/soccer/">Soccer</a></th></tr>'
+    ]
+    for m in range(num_matches):
+        if m % 9 == 0:
+            suffix = " - Play Offs" if m % 27 == 9 else ""
+            rows.append(
+                '<tr class="center nob-border"><th class="first2 tl" '
+                'colspan="5"><span class="datet t%d-1-1-0-0">%02d Mar 2010%s'
+                '</span></th><th>1</th><th>X</th><th>2</th></tr>'
+                % (1268438400 + m * 3600, 1 + m % 28, suffix)
+            )
+        home = TEAMS[m % 18]
+        away = TEAMS[(m + 5) % 18]
+        odds = "".join(
+            '<td class="odds-nowrp" xodd="%.2f"><a href="">%.2f</a></td>'
+            % (1.5 + j, 1.5 + j) for j in range(2)
+        ) + '<td class="odds-nowrp">-</td>'
+        participant = (
+            '<a href="/soccer/germany/bundesliga-2009-2010/m%d/">%s&nbsp;- '
+            '<span class="bold">%s</span></a>' % (m, home, away)
+        )
+        if m % 13 == 0:
+            participant = '<span class="flag"></span>' + participant
+        rows.append(
+            '<tr class="odd deactivate" xeid="x%d">\n<td class="table-time '
+            'datet t%d-1-1-0-0">%02d:30</td><td class="name '
+            'table-participant">%s</td><td class="center bold table-odds '
+            'table-score">%s</td>%s<td class="center info-value">12</td>'
+            '</tr>\n'
+            % (m, 1268438400 + m * 3600, 12 + m % 9, participant,
+               SCORES[m % len(SCORES)], odds)
+        )
+    pagination = "".join(
+        '<a href="#/page/%d/" x-page="%d"><span%s>%d</span></a>'
+        % (p, p, ' class="active-page"' if p == page else "", p)
+        for p in range(1, last_page + 1)
+    )
+    return (
+        '<table class=" table-main" id="tournamentTable"><tbody>%s</tbody>'
+        '</table><div id="pagination">%s<a href="#/page/%d/" x-page="%d">'
+        '<span class="arrow">&raquo;|</span></a></div>'
+        % ("".join(rows), pagination, last_page, last_page)
+    )
+
+
+def synthetic_tables():
+    """
+    Returns:
+        (list of tuple) Name and HTML of each synthetic table.
+    """
+
+    return [
+        ("synthetic-%d" % page, synthetic_table(50, page, 8))
+        for page in range(1, 9)
+    ]
+
+
+def load_tables(paths):
+    """
+    Load tournament tables to parse.
+
+    Args:
+        paths (list of str): Files of tournament table HTML, may be empty.
+
+    Returns:
+        (list of tuple) Name and HTML of each table.
+    """
+
+    if len(paths) == 0:
+        paths = glob.glob(os.path.join(CACHE_DIRNAME, "*", "*.html.gz"))
+    tables = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            tables.append((os.path.basename(path), f.read()))
+    if len(tables) == 0:
+        tables = synthetic_tables()
+    return tables
+
+
+def find_mismatches(tables, results):
+    """
+    Compare each parser's results with soup's.
+
+    Args:
+        tables (list of tuple): Name and HTML of each table.
+        results (dict): Parser name to its results for tables, in order.
+
+    Returns:
+        (list of tuple) Parser name and table name where they differ.
+    """
+
+    mismatches = []
+    for name in ROW_PARSERS:
+        for (table_name, _), expected, got in zip(
+            tables, results["soup"], results[name]
+        ):
+            if expected != got:
+                mismatches.append((name, table_name))
+    return mismatches
+
+
+def time_parser(row_parser, tables, repeat):
+    """
+    Returns:
+        (tuple) Best seconds over repeat runs, results of the last run.
+    """
+
+    best = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        results = [row_parser.parse(html) for _, html in tables]
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Row parser benchmark")
+    parser.add_argument(
+        "tables", nargs="*",
+        help="Files of tournament table HTML (.html or .html.gz)"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    tables = load_tables(args.tables)
+
+    timings = {}
+    results = {}
+    for name in ROW_PARSERS:
+        timings[name], results[name] = time_parser(
+            make_row_parser(name), tables, args.repeat
+        )
+
+    mismatches = find_mismatches(tables, results)
+    # the synthetic tables have the odd cases, check them whatever was timed
+    synthetic = synthetic_tables()
+    if tables != synthetic:
+        mismatches += find_mismatches(synthetic, dict(
+            (name, [make_row_parser(name).parse(html) for _, html in synthetic])
+            for name in ROW_PARSERS
+        ))
+    for name, table_name in mismatches:
+        print(f"{name}: rows differ from soup for {table_name}!")
+
+    rows = sum(len(result[0] or []) for result in results["soup"])
+    print(f"{len(tables)} tables, {rows} rows")
+    print(f"{'':8} {'seconds':>10} {'rows/sec':>12}")
+    for name in ROW_PARSERS:
+        print(f"{name:8} {timings[name]:10.3f} {rows / timings[name]:12.0f}")
+    print(f"lxml {timings['soup'] / timings['lxml']:.1f}x faster")
+    if len(mismatches) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,189 @@
 """
 Run the Odds Portal scraping suite, processing all the present soccer league
-JSON files in lexicographical order.
+JSON files in lexicographical order, several leagues at a time. One writer
+process owns the database and the Parquet dataset, and the league workers
+send it their matches through a queue.
 """
 
+import argparse
+import multiprocessing
+import os
+import sys
 from os import listdir, sep
 from os.path import isfile, join
+import traceback
+from MatchWriter import QueueMatchWriter, write_from_queue
 from Scraper import Scraper
 
 soccer_match_path = "." + sep + "leagues" + sep + "soccer"
 
-initialize_db = True
+# set in each league worker process by init_worker
+match_queue = None
 
-for possible_file in listdir(soccer_match_path):
-    if isfile(join(soccer_match_path, possible_file)) and possible_file.endswith('bundesliga.json'):
-        soccer_match_json_file = join(soccer_match_path, possible_file)
+
+def init_worker(queue):
+    """
+    League worker process initializer.
+
+    Args:
+        queue (multiprocessing.Queue): Queue the writer process reads.
+    """
+
+    global match_queue
+    match_queue = queue
+
+
+def scrape_league(soccer_match_json_file, scraper_kwargs):
+    """
+    Scrape every season of one league, sending its matches to the writer
+    process. Runs in a league worker process, with its own fetcher.
+
+    Args:
+        soccer_match_json_file (str): Path of the league JSON file.
+
+        scraper_kwargs (dict): Fetching options passed on to Scraper.
+
+    Returns:
+        (bool) Whether the league was scraped without errors.
+    """
+
+    try:
         with open(soccer_match_json_file, "r") as open_json_file:
             json_str = open_json_file.read().replace("\n", "")
-            match_scraper = Scraper(json_str, initialize_db)
-            match_scraper.scrape_all_urls(True)
-            if initialize_db is True:
-                initialize_db = False
+        match_scraper = Scraper(
+            json_str, False, match_writer=QueueMatchWriter(match_queue),
+            **scraper_kwargs
+        )
+        match_scraper.scrape_all_urls(True)
+    except Exception:
+        print(f"Failed to scrape {soccer_match_json_file}")
+        traceback.print_exc()
+        return False
+    return True
+
+
+def get_league_files():
+    """
+    Get the league JSON files to scrape.
+
+    Returns:
+        (list of str) Paths, in lexicographical order.
+    """
+
+    return [
+        join(soccer_match_path, possible_file)
+        for possible_file in sorted(listdir(soccer_match_path))
+        if isfile(join(soccer_match_path, possible_file))
+        and possible_file.endswith(".json")
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soccer to SQL scraper")
+    parser.add_argument(
+        "--fetcher", choices=["selenium", "http"], default="selenium",
+        help="Load pages with a Chrome browser (selenium, default) or plain "
+        "HTTP requests (http - only the HTML the server sends, without the "
+        "AJAX fragments, so results pages whose table is filled in with "
+        "JavaScript come back without one)"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Don't read or write the on-disk page cache"
+    )
+    parser.add_argument(
+        "--offline", action="store_true",
+        help="Replay a run from the page cache alone, without fetching "
+        "anything"
+    )
+    parser.add_argument(
+        "--browser-profile", choices=["lean", "full"], default="lean",
+        help="What Chrome loads - only what the results table needs (lean, "
+        "default) or everything (full)"
+    )
+    parser.add_argument(
+        "--extraction", choices=["html", "js"], default="html",
+        help="Parse the tournament table HTML in Python (html, default) or "
+        "pull its rows out as JSON in the browser (js, selenium only, no page "
+        "cache)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=-1,
+        help="Leagues scraped at the same time, each with its own browser "
+        "(default -1, one per CPU)"
+    )
+    parser.add_argument(
+        "--page-concurrency", type=int, default=1,
+        help="Pages of a season each worker fetches at the same time, each "
+        "with its own browser (default 1)"
+    )
+    parser.add_argument(
+        "--row-parser", choices=["lxml", "soup"], default="lxml",
+        help="Parse tournament table HTML in one pass with lxml (default) or "
+        "with BeautifulSoup and html.parser (soup)"
+    )
+    parser.add_argument(
+        "--full-refresh", action="store_true",
+        help="Start from an empty database and scrape every page of every "
+        "season again, instead of only the current season and pages earlier "
+        "runs didn't get"
+    )
+    args = parser.parse_args()
+    if args.fetcher == "http" and not args.offline:
+        print("The http fetcher only reads the HTML the server sends - results "
+              "pages whose table is filled in with JavaScript will come back "
+              "without one")
+
+    league_files = get_league_files()
+    workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    workers = min(workers, max(len(league_files), 1))
+    scraper_kwargs = {
+        "fetcher": args.fetcher,
+        "use_cache": not args.no_cache,
+        "offline": args.offline,
+        "browser_profile": args.browser_profile,
+        "extraction": args.extraction,
+        "page_concurrency": args.page_concurrency,
+        "row_parser": args.row_parser,
+        "full_refresh": args.full_refresh
+    }
+
+    queue = multiprocessing.Queue()
+    writer = multiprocessing.Process(
+        target=write_from_queue, args=(queue, True, args.full_refresh)
+    )
+    writer.start()
+    results = [False] * len(league_files)
+    try:
+        with multiprocessing.Pool(
+            workers, initializer=init_worker, initargs=(queue,)
+        ) as pool:
+            results = pool.starmap(
+                scrape_league,
+                [(league_file, scraper_kwargs) for league_file in league_files],
+                chunksize=1
+            )
+            # leaving the with block terminates the workers - let them exit
+            # on their own first, so their queue feeder threads finish sending
+            pool.close()
+            pool.join()
+    finally:
+        # once the workers have exited, everything they sent is ahead of this
+        # in the queue
+        queue.put(None)
+        writer.join()
+
+    failed = [
+        league_file for league_file, ok in zip(league_files, results) if not ok
+    ]
+    print(f"Scraped {len(league_files) - len(failed)} of {len(league_files)} "
+          "leagues")
+    for league_file in failed:
+        print(f"Failed: {league_file}")
+    if writer.exitcode != 0:
+        print(f"Writer process exited with code {writer.exitcode} - matches "
+              "sent to it may not have been saved")
+        sys.exit(1)
 
-match_scraper.df_manager.save_cached_df_as_parquet()
+if __name__ == "__main__":
+    main()